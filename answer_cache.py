@@ -0,0 +1,141 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+_PUNCT_RE = re.compile(r"[\s\?\!\.,;:\"'()\[\]{}]+")
+
+
+def normalize_query(text):
+    """ทำให้คำถามที่พิมพ์ต่างกันเล็กน้อยได้ key เดียวกัน (ตัวพิมพ์, ช่องว่าง, เครื่องหมายวรรคตอน)"""
+    return _PUNCT_RE.sub(" ", text.lower()).strip()
+
+
+class AnswerCache:
+    """
+    Cache คำตอบ {reply, sources} ของ RAG pipeline
+    - ค้นด้วย normalized query ก่อน (exact)
+    - ถ้าไม่เจอ ค้นด้วย cosine similarity ของ query embedding (>= similarity_threshold, ค่าเริ่มต้น 1 = ปิด)
+      เฉพาะ entry ที่ topic_fn(key) ตรงกัน (เช่นฟอร์มที่คำถามพูดถึง) คำถามที่ต่างกันแค่ฟอร์ม/การกระทำจึงไม่ได้คำตอบผิดฟอร์ม
+    - จำกัดขนาดด้วย LRU + TTL และล้างทั้งหมดเมื่อ version ของ collection เปลี่ยน (re-ingest)
+    """
+
+    def __init__(self, max_entries=512, ttl_seconds=3600, similarity_threshold=1.0, topic_fn=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.topic_fn = topic_fn or (lambda key: None)
+        self.version = None
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, unit_vector, value, topic)
+        self._generation = 0  # เพิ่มทุกครั้งที่มี entry ใหม่ (snapshot ของ matrix ต้องสร้างใหม่)
+        self._snapshot = (-1, [], None, [])  # (generation, keys, matrix, topics)
+        self._lock = threading.Lock()
+
+    def _expired(self, key, expires_at, now):
+        if expires_at <= now:
+            del self._entries[key]
+            return True
+        return False
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(key, entry[0], now):
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def _matrix(self):
+        """(keys, matrix ของ unit vector, topics) สร้างใหม่เฉพาะเมื่อมี entry ใหม่ และ stack นอก lock"""
+        with self._lock:
+            if self._snapshot[0] == self._generation:
+                return self._snapshot[1:]
+            generation = self._generation
+            items = list(self._entries.items())
+        keys = [key for key, _ in items]
+        matrix = np.stack([entry[1] for _, entry in items]) if items else None
+        topics = [entry[3] for _, entry in items]
+        with self._lock:
+            if generation == self._generation:
+                self._snapshot = (generation, keys, matrix, topics)
+        return keys, matrix, topics
+
+    def get_similar(self, key, vector):
+        """entry ที่ใกล้ vector ที่สุด (topic เดียวกับ key) ถ้า similarity >= threshold"""
+        if self.similarity_threshold >= 1:
+            with self._lock:
+                self.misses += 1
+            return None
+        topic = self.topic_fn(key)
+        keys, matrix, topics = self._matrix()
+        best_key = None
+        if keys:
+            # matrix product ครั้งเดียวนอก lock; key ที่ถูกลบ/หมดอายุไปแล้วเช็คซ้ำตอนหยิบข้างล่าง
+            scores = matrix @ _unit(vector)
+            scores[np.fromiter((t != topic for t in topics), dtype=bool, count=len(topics))] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] >= self.similarity_threshold:
+                best_key = keys[best]
+        with self._lock:
+            entry = self._entries.get(best_key) if best_key is not None else None
+            if entry is None or self._expired(best_key, entry[0], time.monotonic()):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            return entry[2]
+
+    def put(self, key, vector, value):
+        topic = self.topic_fn(key)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, _unit(vector), value, topic)
+            self._entries.move_to_end(key)
+            self._generation += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set_version(self, version):
+        """ล้าง cache เมื่อข้อมูลใน Vector DB ถูกโหลดใหม่ (version เปลี่ยน)"""
+        with self._lock:
+            if version == self.version:
+                return False
+            self.version = version
+            self._clear()
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._entries.clear()
+        self._generation += 1
+        self._snapshot = (-1, [], None, [])
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "similarity_threshold": self.similarity_threshold,
+                "version": self.version,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+            }
+
+
+def _unit(vector):
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
@@ -0,0 +1,92 @@
+import asyncio
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    รวม request ที่เข้ามาใกล้ๆ กัน (ภายใน max_wait_ms หรือจนครบ max_batch_size) แล้วเรียก batch_fn ครั้งเดียว
+    batch_fn รับ list ของ items และต้องคืน list ของผลลัพธ์ที่เรียงตรงกัน
+    ผลลัพธ์ของแต่ละ item ส่งกลับผ่าน Future ให้ request ที่รออยู่
+    """
+
+    def __init__(self, batch_fn, max_batch_size=32, max_wait_ms=5, name="micro-batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, item):
+        future = Future()
+        if self.max_batch_size <= 1:
+            # ปิด batching: เรียกตรงๆ ใน thread ของ request
+            self._run([(item, future)])
+            return future
+        self._ensure_worker()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    async def submit_async(self, item):
+        """เหมือน __call__ แต่ await จาก event loop ได้ (รอผล batch โดยไม่กิน thread ของ threadpool)"""
+        if self.max_batch_size <= 1:
+            context = contextvars.copy_context()
+            return await asyncio.get_running_loop().run_in_executor(None, context.run, self.__call__, item)
+        return await asyncio.wrap_future(self.submit(item))
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                self._worker.start()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._run(batch)
+
+    def _run(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = list(self.batch_fn(items))
+            if len(results) != len(items):
+                # zip จะทิ้ง future ที่ไม่มีผลไว้ให้รอตลอดไป
+                raise ValueError(f"{self.name}: batch_fn returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(items)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
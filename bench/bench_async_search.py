@@ -0,0 +1,172 @@
+"""
+Benchmark: ค้น Qdrant server แบบ sync (threadpool เหมือน /chat เดิม) เทียบกับ async (AsyncQdrantClient)
+
+ใช้ hybrid query แบบเดียวกับ main.py (dense + sparse prefetch, RRF ใน request เดียว) บน collection ชั่วคราว
+ที่สร้างจาก vector สุ่ม (ไม่ต้องโหลดโมเดล วัดเฉพาะ I/O ไป Qdrant) แล้วลบทิ้งเมื่อจบ เทียบ
+  - sync-rest:  QdrantClient (REST) บน thread pool ขนาด --threads (ค่าเริ่มต้น 40 = threadpool ของ FastAPI/anyio)
+  - async-rest: AsyncQdrantClient (REST) concurrency ไม่จำกัดด้วยจำนวน thread
+  - async-grpc: AsyncQdrantClient (prefer_grpc) ตามค่า QDRANT_GRPC_PORT / QDRANT_POOL_SIZE ของ main.py
+ที่ 1, 32, 256, 1024 concurrent clients
+
+    QDRANT_URL=http://localhost:6333 python bench/bench_async_search.py --json bench_async_search.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GROQ_API_KEY", "offline-bench")  # main.py ต้องมีค่า แต่ benchmark นี้ไม่เรียก LLM
+
+from qdrant_client import AsyncQdrantClient, QdrantClient, models
+
+import main
+
+DIM = 384
+VOCABULARY = 5000
+
+
+def random_sparse(rng, terms=8):
+    indices = rng.sample(range(VOCABULARY), terms)
+    return models.SparseVector(indices=indices, values=[rng.random() for _ in indices])
+
+
+def seed_collection(client, name, points, rng):
+    client.create_collection(
+        collection_name=name,
+        vectors_config={"dense_vector": models.VectorParams(size=DIM, distance=models.Distance.COSINE)},
+        sparse_vectors_config={"sparse_vector": models.SparseVectorParams()},
+    )
+    for start in range(0, points, 256):
+        client.upsert(
+            collection_name=name,
+            points=[
+                models.PointStruct(
+                    id=index,
+                    vector={
+                        "dense_vector": [rng.gauss(0, 1) for _ in range(DIM)],
+                        "sparse_vector": random_sparse(rng, terms=40),
+                    },
+                    payload={"page_content": f"chunk {index}", "metadata": {"file": "bench"}},
+                )
+                for index in range(start, min(points, start + 256))
+            ],
+        )
+
+
+def queries(n, rng):
+    return [([rng.gauss(0, 1) for _ in range(DIM)], random_sparse(rng)) for _ in range(n)]
+
+
+def summarize(mode, concurrency, latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "qps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def run_sync(client, collection, batch, concurrency, threads, k):
+    """concurrency คนยิงพร้อมกัน แต่ทำงานได้พร้อมกันแค่ threads ตัว (ที่เหลือรอ thread ว่าง เหมือน sync handler)"""
+    def one(query, submitted):
+        client.query_batch_points(collection_name=collection, requests=[main.hybrid_request(*query, k)])
+        return time.perf_counter() - submitted
+
+    started = time.perf_counter()
+    latencies = []
+    with ThreadPoolExecutor(max_workers=min(concurrency, threads)) as pool:
+        for offset in range(0, len(batch), concurrency):
+            # ยิงเป็นระลอกละ concurrency request วัดเวลาจากตอนยิง (รวมเวลารอ thread ว่าง)
+            submitted = time.perf_counter()
+            futures = [pool.submit(one, query, submitted) for query in batch[offset:offset + concurrency]]
+            latencies.extend(future.result() for future in futures)
+    return latencies, time.perf_counter() - started
+
+
+async def run_async(client, collection, batch, concurrency, k):
+    async def one(query, submitted):
+        await client.query_batch_points(collection_name=collection, requests=[main.hybrid_request(*query, k)])
+        return time.perf_counter() - submitted
+
+    started = time.perf_counter()
+    latencies = []
+    for offset in range(0, len(batch), concurrency):
+        submitted = time.perf_counter()
+        latencies.extend(await asyncio.gather(*(one(query, submitted) for query in batch[offset:offset + concurrency])))
+    return latencies, time.perf_counter() - started
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=main.QDRANT_URL, help="Qdrant server (ค่าเริ่มต้น QDRANT_URL)")
+    parser.add_argument("--api-key", default=main.QDRANT_API_KEY)
+    parser.add_argument("--points", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=2048)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 32, 256, 1024])
+    parser.add_argument("--threads", type=int, default=40, help="ขนาด threadpool ของโหมด sync")
+    parser.add_argument("--k", type=int, default=main.RETRIEVAL_K)
+    parser.add_argument("--json", help="บันทึกผลเป็นไฟล์ JSON")
+    args = parser.parse_args()
+    if not args.url:
+        sys.exit("ต้องระบุ Qdrant server ด้วย --url หรือ QDRANT_URL")
+
+    rng = random.Random(0)
+    collection = f"bench_async_search_{uuid.uuid4().hex[:8]}"
+    sync_client = QdrantClient(url=args.url, api_key=args.api_key, timeout=main.QDRANT_TIMEOUT_SECONDS)
+    print(f"🧠 Seeding {args.points} points into {collection}...")
+    seed_collection(sync_client, collection, args.points, rng)
+    batch = queries(args.requests, rng)
+
+    async def run_async_modes():
+        rows = []
+        for mode, prefer_grpc in (("async-rest", False), ("async-grpc", True)):
+            client = AsyncQdrantClient(
+                url=args.url,
+                api_key=args.api_key,
+                prefer_grpc=prefer_grpc,
+                grpc_port=main.QDRANT_GRPC_PORT,
+                grpc_options=main.QDRANT_GRPC_OPTIONS,
+                pool_size=main.QDRANT_POOL_SIZE,
+                timeout=main.QDRANT_TIMEOUT_SECONDS,
+            )
+            await run_async(client, collection, batch[:32], 8, args.k)  # warm-up connection
+            for concurrency in args.concurrency:
+                rows.append(summarize(mode, concurrency, *await run_async(client, collection, batch, concurrency, args.k)))
+                report(rows[-1])
+            await client.close()
+        return rows
+
+    def report(row):
+        print(f"{row['mode']:>10} c={row['concurrency']:<5} {row['qps']:8.1f} q/s  "
+              f"p50={row['p50_ms']:7.1f}ms  p95={row['p95_ms']:7.1f}ms  p99={row['p99_ms']:7.1f}ms")
+
+    results = []
+    try:
+        run_sync(sync_client, collection, batch[:32], 8, args.threads, args.k)  # warm-up connection
+        for concurrency in args.concurrency:
+            results.append(summarize("sync-rest", concurrency, *run_sync(
+                sync_client, collection, batch, concurrency, args.threads, args.k,
+            )))
+            report(results[-1])
+        results.extend(asyncio.run(run_async_modes()))
+    finally:
+        sync_client.delete_collection(collection)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,103 @@
+"""
+Benchmark: micro-batching ของ query embedding + Qdrant hybrid search
+
+รันแบบ offline ด้วย Qdrant in-memory (ข้อมูลจาก SUMMARY_TEXT) เทียบ
+  - unbatched: EMBED_BATCH_MAX_SIZE=1 (embed/search ทีละคำถาม)
+  - batched:   ค่า EMBED_BATCH_MAX_SIZE / EMBED_BATCH_MAX_WAIT_MS ที่ตั้งไว้
+ที่ 1, 8, 32, 128 concurrent clients
+
+    python bench/bench_batching.py --requests 512 --json bench_batching.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_qdrant import QdrantVectorStore, FastEmbedSparse, RetrievalMode
+from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
+
+import main
+from forms import FORM_MASTER_DATA, SUMMARY_TEXT
+from thai_text import ThaiSparseEmbeddings, ThaiTextSplitter
+
+
+def build_store():
+    if main.THAI_SEGMENTATION:
+        splitter = ThaiTextSplitter(chunk_size=500, chunk_overlap=50)
+        sparse_embedding = ThaiSparseEmbeddings(FastEmbedSparse(model_name=main.SPARSE_MODEL_NAME))
+    else:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+        sparse_embedding = FastEmbedSparse(model_name=main.SPARSE_MODEL_NAME)
+    docs = splitter.split_documents([Document(page_content=SUMMARY_TEXT, metadata={"file": "summary_forms.txt"})])
+    return QdrantVectorStore.from_documents(
+        documents=docs,
+        embedding=FastEmbedEmbeddings(model_name=main.DENSE_MODEL_NAME),
+        sparse_embedding=sparse_embedding,
+        location=":memory:",
+        collection_name=main.COLLECTION_NAME,
+        retrieval_mode=RetrievalMode.HYBRID,
+        vector_name="dense_vector",
+        sparse_vector_name="sparse_vector",
+    )
+
+
+def questions(n):
+    pool = [f"{kw} ต้องใช้ฟอร์มอะไร" for item in FORM_MASTER_DATA for kw in item["keywords"]]
+    return [pool[i % len(pool)] + f" ({i})" for i in range(n)]
+
+
+def run(vector_store, concurrency, queries):
+    def one(message):
+        started = time.perf_counter()
+        dense, sparse = main.embed_query(vector_store, message)
+        main.hybrid_search(vector_store, dense, sparse, k=5)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = sorted(pool.map(one, queries))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": len(queries),
+        "qps": len(queries) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--json", help="บันทึกผลเป็นไฟล์ JSON")
+    args = parser.parse_args()
+
+    print("🧠 Building in-memory index...")
+    vector_store = build_store()
+    queries = questions(args.requests)
+    run(vector_store, 4, queries[:16])  # warm-up ONNX
+
+    results = []
+    for mode, batch_size in (("unbatched", 1), ("batched", main.EMBED_BATCH_MAX_SIZE)):
+        for batcher in (main.embedding_batcher, main.search_batcher):
+            batcher.max_batch_size = batch_size
+        for concurrency in args.concurrency:
+            row = {"mode": mode, **run(vector_store, concurrency, queries)}
+            results.append(row)
+            print(f"{mode:>9} c={concurrency:<4} {row['qps']:8.1f} q/s  p50={row['p50_ms']:7.1f}ms  p95={row['p95_ms']:7.1f}ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    run_benchmark()
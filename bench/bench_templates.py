@@ -0,0 +1,124 @@
+"""
+Benchmark: render แม่แบบของ /generate-form (.docx และ ?format=pdf)
+
+เทียบ renders/s ของทุก template ใน TEMPLATE_MAP
+  - baseline: DocxTemplate(path) + render + save ทุกครั้ง (โค้ดเดิม)
+  - cached:   form_templates.render_docx (template compile ไว้แล้ว, รูปภาพไม่ถูก deflate ซ้ำ)
+  - pool:     cached ผ่าน ProcessPoolExecutor ขนาด FORM_RENDER_WORKERS
+  - pdf:      form_pdf.render_pdf (?format=pdf) ถ้ามีฟอนต์ไทย (PDF_THAI_FONT หรือของระบบ)
+
+    python bench/bench_templates.py --renders 50 --json bench_templates.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # TEMPLATE_MAP เป็น path แบบ relative
+
+from docxtpl import DocxTemplate
+
+import form_pdf
+import form_templates
+
+# ไม่ import main เพื่อไม่ให้ต้องมี GROQ_API_KEY / โหลดโมเดล
+TEMPLATE_DIR = "templates"
+TEMPLATE_MAP = {
+    "RO.01": os.path.join(TEMPLATE_DIR, "RO-01_General_Request.docx"),
+    "RO.03": os.path.join(TEMPLATE_DIR, "RO-03_Guardian.docx"),
+    "RO.12": os.path.join(TEMPLATE_DIR, "RO-12_Withdrawal.docx"),
+    "RO.13": os.path.join(TEMPLATE_DIR, "RO-13_Resignation.docx"),
+    "RO.16": os.path.join(TEMPLATE_DIR, "RO-16_Sick_Leave.docx"),
+}
+CONTEXT = {
+    "student_id": "64070500000",
+    "student_name": "นักศึกษา ทดสอบ",
+    "name": "นักศึกษา ทดสอบ",
+    "faculty": "วิศวกรรมศาสตร์",
+    "year": "3",
+    "semester": "2/2567",
+    "phone": "0812345678",
+}
+
+
+def baseline_render(path, context):
+    doc = DocxTemplate(path)
+    doc.render(context)
+    stream = BytesIO()
+    doc.save(stream)
+    return stream.getvalue()
+
+
+def measure(fn, renders):
+    started = time.perf_counter()
+    for _ in range(renders):
+        fn()
+    return renders / (time.perf_counter() - started)
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--renders", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("FORM_RENDER_WORKERS", 2)))
+    parser.add_argument("--json", help="บันทึกผลเป็นไฟล์ JSON")
+    args = parser.parse_args()
+
+    templates = {form: path for form, path in TEMPLATE_MAP.items() if os.path.exists(path)}
+    for form in TEMPLATE_MAP.keys() - templates.keys():
+        print(f"⚠️ ข้าม {form}: ไม่พบไฟล์ {TEMPLATE_MAP[form]}")
+
+    pool = ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=form_templates.preload,
+        initargs=(list(templates.values()),),
+    )
+    # warm-up: spawn worker + compile template ก่อนจับเวลา
+    list(pool.map(form_templates.preload, [[]] * args.workers))
+
+    results = []
+    for form, path in sorted(templates.items()):
+        started = time.perf_counter()
+        form_templates.preload([path])
+        compile_ms = (time.perf_counter() - started) * 1000
+
+        baseline = measure(lambda: baseline_render(path, CONTEXT), max(1, args.renders // 5))
+        cached = measure(lambda: form_templates.render_docx(path, CONTEXT), args.renders)
+        started = time.perf_counter()
+        list(pool.map(form_templates.render_docx, [path] * args.renders, [CONTEXT] * args.renders))
+        pooled = args.renders / (time.perf_counter() - started)
+        pdf = None
+        if form_pdf.font_available():
+            form_pdf.preload([path])
+            pdf = measure(lambda: form_pdf.render_pdf(path, CONTEXT), args.renders)
+
+        row = {
+            "form": form,
+            "compile_ms": compile_ms,
+            "baseline_rps": baseline,
+            "cached_rps": cached,
+            "pool_rps": pooled,
+            "pdf_rps": pdf,
+            "workers": args.workers,
+        }
+        results.append(row)
+        print(
+            f"{form:>6} compile={compile_ms:6.1f}ms  baseline={baseline:6.1f}/s  "
+            f"cached={cached:6.1f}/s  pool({args.workers})={pooled:6.1f}/s"
+            + (f"  pdf={pdf:6.1f}/s" if pdf is not None else "")
+        )
+    pool.shutdown()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,183 @@
+"""
+Benchmark: throughput และ memory ต่อจำนวน worker ของ serve.py (โมเดลร่วมกันแบบ copy-on-write) เทียบ uvicorn --workers
+
+stack เดียวกับ bench/loadtest.py (fake LLM + index ใน process จาก fixture หรือ --snapshot) แต่ยิง /chat แบบ closed-loop
+(--concurrency client ยิงต่อทันทีที่ได้คำตอบ) เพื่อวัด throughput สูงสุด ปิด answer cache / coalescing ทุก request
+จึง embed + ค้นจริง แล้ววัด memory ของทุก process หลังยิงเสร็จจาก /proc/<pid>/smaps_rollup
+  - RSS: นับ page ที่ใช้ร่วมกันซ้ำทุก process (รวมกันแล้วเกินจริง)
+  - PSS: page ที่ใช้ร่วมกันหารตามจำนวน process (รวมกันได้ memory จริงของทั้ง server)
+  - USS: page ของ process นั้นเท่านั้น (memory ที่ได้คืนถ้า worker นั้นตาย)
+
+    python bench/bench_workers.py --workers 1 2 4 --json bench_workers.json
+    python bench/bench_workers.py --launcher serve --workers 4 --snapshot vector_snapshot
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from loadtest import (
+    build_snapshot, free_port, process_tree, send, server_env, start_fake_llm, stop_processes, summarize, wait_ready,
+)
+from retrieval_bench import QUESTIONS_PATH, ROOT, load_questions
+
+
+def memory_mb(pid):
+    """{"rss", "pss", "uss"} เป็น MB หรือ None ถ้า process จบไปแล้ว"""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    except OSError:
+        return None
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def cmdline(pid):
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return f.read().replace(b"\0", b" ").decode()
+    except OSError:
+        return ""
+
+
+def process_roles(root, worker_depth):
+    """
+    {pid: role} master / worker / render (process ของ render pool และ resource tracker ของ multiprocessing)
+    worker_depth: ชั้นของ process ที่รับ request (0 = server process เดียว, 1 = ลูกของ master)
+    """
+    parents = process_tree(root)
+    roles = {}
+    for pid in parents:
+        depth, current = 0, pid
+        while parents[current] is not None:
+            depth, current = depth + 1, parents[current]
+        if depth < worker_depth:
+            roles[pid] = "master"
+        elif depth == worker_depth and "resource_tracker" not in cmdline(pid):
+            roles[pid] = "worker"
+        else:
+            roles[pid] = "render"
+    return roles
+
+
+def start_server(launcher, workers, env):
+    port = free_port()
+    if launcher == "serve":
+        command = [sys.executable, "serve.py"]
+        env = {**env, "WORKERS": str(workers), "HOST": "127.0.0.1", "PORT": str(port)}
+    else:
+        command = [
+            sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+        ]
+    return f"http://127.0.0.1:{port}", subprocess.Popen(command, cwd=ROOT, env=env)
+
+
+async def hammer(base_url, questions, concurrency, duration, timeout, rng):
+    """closed-loop: concurrency client ยิง /chat ต่อเนื่องจนครบ duration วินาที"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        deadline = time.monotonic() + duration
+
+        async def user():
+            records = []
+            while time.monotonic() < deadline:
+                records.append(await send(client, "chat", "/chat", {"message": rng.choice(questions)["question"]}))
+            return records
+
+        started = time.monotonic()
+        results = await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+    return [record for records in results for record in records], elapsed
+
+
+def measure(args, launcher, workers, env, questions):
+    base_url, server = start_server(launcher, workers, env)
+    try:
+        wait_ready(base_url, server, args.ready_timeout)
+        rng = random.Random(args.seed)
+        asyncio.run(hammer(base_url, questions, args.concurrency, args.warmup, args.timeout, rng))
+        records, elapsed = asyncio.run(hammer(base_url, questions, args.concurrency, args.duration, args.timeout, rng))
+        worker_depth = 0 if launcher == "uvicorn" and workers == 1 else 1
+        processes = []
+        for pid, role in sorted(process_roles(server.pid, worker_depth).items()):
+            memory = memory_mb(pid)
+            if memory is not None:
+                processes.append({"pid": pid, "role": role, **memory})
+    finally:
+        stop_processes([server])
+
+    serving = [process for process in processes if process["role"] == "worker"]
+    return {
+        "launcher": launcher,
+        "workers": workers,
+        **summarize(records, elapsed),
+        "worker_rss_mb": sum(process["rss"] for process in serving) / len(serving),
+        "worker_pss_mb": sum(process["pss"] for process in serving) / len(serving),
+        "worker_uss_mb": sum(process["uss"] for process in serving) / len(serving),
+        "total_pss_mb": sum(process["pss"] for process in processes),
+        "processes": processes,
+    }
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--launcher", choices=["serve", "uvicorn"], nargs="+", default=["serve", "uvicorn"])
+    parser.add_argument("--concurrency", type=int, default=32, help="จำนวน client ที่ยิงพร้อมกัน")
+    parser.add_argument("--duration", type=float, default=20, help="วินาทีที่วัดผล")
+    parser.add_argument("--warmup", type=float, default=3, help="วินาทีที่ยิงก่อนเริ่มวัด (ไม่นับผล)")
+    parser.add_argument("--snapshot", help="snapshot ที่มีอยู่แล้ว (upload_data.py --export-snapshot) แทนการสร้างจาก fixture")
+    parser.add_argument("--source", action="append", help="PDF / โฟลเดอร์เพิ่มเติมตอนสร้าง index")
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--llm-tokens-per-s", type=float, default=0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="บันทึกผลเป็นไฟล์ JSON")
+    args = parser.parse_args()
+
+    questions = load_questions(QUESTIONS_PATH)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        snapshot = args.snapshot
+        if snapshot is None:
+            print("🧠 Building index from fixtures...")
+            snapshot = build_snapshot(workdir, args.source)
+        fake_llm_url, fake_llm = start_fake_llm(args)
+        # ทุก request ต้อง embed + ค้นจริง (ไม่ตอบจาก cache / ไม่รวมกับ request อื่น)
+        env = {**server_env(fake_llm_url, snapshot), "ANSWER_CACHE_MAX_ENTRIES": "0", "COALESCE_REQUESTS": "0"}
+        try:
+            for launcher in args.launcher:
+                for workers in args.workers:
+                    row = measure(args, launcher, workers, env, questions)
+                    results.append(row)
+                    print(f"{launcher:>8} x{workers:<2} {row['rps']:7.1f} rps  p50={row['p50_ms']:7.1f}ms  "
+                          f"p95={row['p95_ms']:7.1f}ms  errors={row['error_rate']:.2%}  "
+                          f"worker RSS={row['worker_rss_mb']:.0f}MB PSS={row['worker_pss_mb']:.0f}MB "
+                          f"USS={row['worker_uss_mb']:.0f}MB  total PSS={row['total_pss_mb']:.0f}MB")
+        finally:
+            stop_processes([fake_llm])
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,150 @@
+"""
+Fake LLM server ที่ตอบแบบ OpenAI/Groq chat completions (ไม่ต้องใช้ GROQ_API_KEY จริง)
+ใช้ทดสอบ LLMGateway (rate limit, retry, fallback, hedging) และ load test แบบ offline
+
+    python bench/fake_llm.py --port 9000 --latency-ms 300 --error-rate 0.1 --rpm 60
+    GROQ_BASE_URL=http://127.0.0.1:9000 GROQ_API_KEY=fake uvicorn main:app
+
+- --latency-ms / --jitter-ms: เวลาก่อนตอบ (สุ่ม ± jitter)
+- --tokens-per-s: ความเร็ว generate (stream ส่งแต่ละคำตามความเร็วนี้, non-stream รอจน generate ครบ) 0 = ใช้ --stream-delay-ms
+- --error-rate: สัดส่วน request ที่ตอบ 500
+- --rpm: เกินจำนวน request ต่อนาทีนี้จะตอบ 429 พร้อม Retry-After
+- --fail-models: model ที่ตอบ 503 ทุกครั้ง (ทดสอบ GROQ_FALLBACK_MODEL)
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from collections import deque
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_builder import estimate_tokens
+
+REPLY = "ลาป่วยใช้แบบฟอร์ม RO.16 (คำร้องขอลาป่วย/ลากิจ) ยื่นผ่านอาจารย์ที่ปรึกษาภายใน 7 วันหลังกลับมาเรียน"
+
+
+def create_app(latency_ms=300, jitter_ms=50, error_rate=0.0, rpm=0, stream_delay_ms=10, fail_models=(), tokens_per_s=0):
+    app = FastAPI()
+    recent = deque()
+    counters = {"requests": 0, "rate_limited": 0, "errors": 0}
+
+    def rate_limited():
+        if not rpm:
+            return False
+        now = time.monotonic()
+        while recent and recent[0] <= now - 60:
+            recent.popleft()
+        if len(recent) >= rpm:
+            return True
+        recent.append(now)
+        return False
+
+    def error(status, message, headers=None):
+        return JSONResponse({"error": {"message": message, "type": "fake_llm"}}, status_code=status, headers=headers)
+
+    @app.post("/openai/v1/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        counters["requests"] += 1
+        if rate_limited():
+            counters["rate_limited"] += 1
+            retry_after = 60 - (time.monotonic() - recent[0])
+            return error(429, "rate limit exceeded", {"retry-after": f"{retry_after:.1f}"})
+        await asyncio.sleep(max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000)
+        if model in fail_models:
+            counters["errors"] += 1
+            return error(503, f"{model} is unavailable")
+        if random.random() < error_rate:
+            counters["errors"] += 1
+            return error(500, "internal error")
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        completion_tokens = estimate_tokens(REPLY)
+        if not body.get("stream"):
+            if tokens_per_s:
+                await asyncio.sleep(completion_tokens / tokens_per_s)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": REPLY}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": completion_tokens, "total_tokens": completion_tokens},
+            }
+
+        async def events():
+            words = REPLY.split(" ")
+            for index, word in enumerate(words):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"content": word if index == 0 else " " + word},
+                        "finish_reason": None,
+                    }],
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                if tokens_per_s:
+                    await asyncio.sleep(estimate_tokens(word) / tokens_per_s)
+                else:
+                    await asyncio.sleep(stream_delay_ms / 1000)
+            done = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    def stats():
+        return counters
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=0, help="0 = ไม่จำกัด")
+    parser.add_argument("--stream-delay-ms", type=float, default=10)
+    parser.add_argument("--fail-models", nargs="*", default=[])
+    parser.add_argument("--tokens-per-s", type=float, default=0, help="0 = ใช้ --stream-delay-ms ต่อคำ")
+    args = parser.parse_args()
+    app = create_app(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rpm=args.rpm,
+        stream_delay_ms=args.stream_delay_ms,
+        fail_models=set(args.fail_models),
+        tokens_per_s=args.tokens_per_s,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""
+Load test แบบ end-to-end ของ /chat, /chat/stream และ /generate-form โดยไม่ใช้ Groq quota / Qdrant production
+
+ค่าเริ่มต้นจะรันทุกอย่างในเครื่อง:
+  - fake LLM (bench/fake_llm.py) กำหนด latency / ความเร็ว token / error rate ได้
+  - index ใน process (VECTOR_BACKEND=numpy) สร้างจาก fixture (SUMMARY_TEXT + PDF ที่ระบุด้วย --source)
+    ด้วย chunking / embedding แบบเดียวกับ upload_data.py (ต้องมีโมเดล FastEmbed ใน cache) หรือใช้ --snapshot ที่มีอยู่แล้ว
+  - uvicorn main:app จำนวน --workers process
+แล้วยิง traffic แบบ open-loop (Poisson ตาม --rps ไม่รอคำตอบก่อนยิงตัวถัดไป) ตาม --mix
+  - chat:      /chat ล้วน (คำถามจาก bench/retrieval_questions.jsonl)
+  - forms:     /generate-form ล้วน (ข้อมูลนักศึกษาสุ่ม)
+  - mixed:     chat 60% / chat-stream 15% / form 25%
+  - exam-week: แบบ mixed แต่ทุก 10 วินาทีมี burst 5 เท่านาน 2 วินาที และครึ่งหนึ่งเป็นคำถามเดียวกัน (ประกาศจากสำนักทะเบียน)
+รายงาน RPS, p50/p95/p99, error rate ต่อ endpoint, RSS สูงสุด/สุดท้ายของแต่ละ worker (อ่านจาก /proc จึงใช้ได้บน Linux)
+และ /cache/stats ของ server บันทึกเป็น JSON เพื่อเทียบระหว่าง release ได้ (--baseline)
+
+    python bench/loadtest.py --mix exam-week --rps 20 --duration 60 --workers 2 --json loadtest.json
+    python bench/loadtest.py --mix chat --snapshot vector_snapshot --json after.json --baseline loadtest.json
+    python bench/loadtest.py --target http://127.0.0.1:8000 --server-pid 1234   # ยิง server ที่รันอยู่แล้ว
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
+from langchain_qdrant import FastEmbedSparse
+
+from retrieval_bench import QUESTIONS_PATH, ROOT, build_index, load_chunks, load_questions, percentiles
+
+import main
+from thai_text import ThaiSparseEmbeddings
+
+TRAFFIC_MIXES = {
+    "chat": {"weights": {"chat": 1.0}},
+    "forms": {"weights": {"form": 1.0}},
+    "mixed": {"weights": {"chat": 0.6, "stream": 0.15, "form": 0.25}},
+    "exam-week": {
+        "weights": {"chat": 0.6, "stream": 0.15, "form": 0.25},
+        "burst_every": 10, "burst_seconds": 2, "burst_factor": 5, "hot_ratio": 0.5,
+    },
+}
+HOT_QUESTION = "ลงทะเบียนเพิ่ม-ลดวิชาหลังประกาศผลต้องใช้ฟอร์มอะไร"
+ERROR_REPLY = "เกิดข้อผิดพลาดในระบบ"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def process_tree(pid):
+    """
+    {pid: parent pid} ของ server และ process ลูกทั้งหมด
+    (uvicorn --workers: master → worker → render pool ของแต่ละ worker)
+    """
+    parents, pending = {pid: None}, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                children = [int(child) for child in f.read().split()]
+        except OSError:
+            children = []
+        for child in children:
+            parents[child] = current
+        pending.extend(children)
+    return parents
+
+
+def build_snapshot(workdir, sources):
+    """index จาก fixture แบบเดียวกับ retrieval_bench.py (--backend numpy) คืน path ของ snapshot"""
+    embeddings = FastEmbedEmbeddings(model_name=main.DENSE_MODEL_NAME)
+    sparse_embeddings = FastEmbedSparse(model_name=main.SPARSE_MODEL_NAME)
+    if main.THAI_SEGMENTATION:
+        sparse_embeddings = ThaiSparseEmbeddings(sparse_embeddings)
+    build_index("numpy", load_chunks(sources), embeddings, sparse_embeddings, workdir)
+    return os.path.join(workdir, "snapshot")
+
+
+def start_fake_llm(args):
+    """start bench/fake_llm.py คืน (url, process)"""
+    port = free_port()
+    process = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "bench", "fake_llm.py"), "--port", str(port),
+        "--latency-ms", str(args.llm_latency_ms), "--tokens-per-s", str(args.llm_tokens_per_s),
+        "--error-rate", str(args.llm_error_rate),
+    ])
+    return f"http://127.0.0.1:{port}", process
+
+
+def server_env(fake_llm_url, snapshot):
+    """env ของ server ที่ใช้ index ใน process + fake LLM"""
+    env = {
+        **os.environ,
+        "VECTOR_BACKEND": "numpy",
+        "VECTOR_SNAPSHOT_PATH": os.path.abspath(snapshot),
+        "GROQ_BASE_URL": fake_llm_url,
+        "GROQ_API_KEY": "fake",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    }
+    # fake LLM ไม่มี quota: ไม่ให้ LLMGateway จำกัด rate ตาม quota ของ Groq จริง (ตั้งเองใน env เพื่อทดสอบ gateway ได้)
+    env.setdefault("LLM_REQUESTS_PER_MINUTE", "1000000")
+    env.setdefault("LLM_TOKENS_PER_MINUTE", "1000000000")
+    env.setdefault("LLM_MAX_PENDING", "100000")
+    return env
+
+
+def start_stack(args, snapshot):
+    """start fake LLM + uvicorn main:app คืน (base_url, server process, processes ทั้งหมด)"""
+    fake_llm_url, fake_llm = start_fake_llm(args)
+    server_port = free_port()
+    server = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(server_port),
+        "--workers", str(args.workers), "--log-level", "warning",
+    ], cwd=ROOT, env=server_env(fake_llm_url, snapshot))
+    return f"http://127.0.0.1:{server_port}", server, [server, fake_llm], fake_llm_url
+
+
+def stop_processes(processes):
+    for process in processes:
+        process.send_signal(signal.SIGINT)
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def wait_ready(base_url, server, timeout):
+    """รอ /readyz (โหลดโมเดล + warm-up) ของทุก worker แบบคร่าวๆ: ต้องตอบ ready ติดกันหลายครั้ง"""
+    deadline = time.monotonic() + timeout
+    streak = 0
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            sys.exit(f"❌ server exited with code {server.returncode}")
+        try:
+            ready = httpx.get(f"{base_url}/readyz", timeout=2).status_code == 200
+        except httpx.HTTPError:
+            ready = False
+        streak = streak + 1 if ready else 0
+        if streak >= 10:
+            return
+        time.sleep(0.2 if ready else 1)
+    sys.exit(f"❌ server not ready after {timeout}s")
+
+
+class Traffic:
+    """สร้าง request ตาม mix (สุ่มแบบกำหนด seed ได้ ผลจึงซ้ำได้)"""
+
+    def __init__(self, mix, questions, rng):
+        self.mix = mix
+        self.kinds = list(mix["weights"])
+        self.weights = list(mix["weights"].values())
+        self.questions = questions
+        self.forms = [form for form, path in main.TEMPLATE_MAP.items() if os.path.exists(os.path.join(ROOT, path))]
+        self.rng = rng
+
+    def rate_factor(self, t):
+        burst_every = self.mix.get("burst_every")
+        if burst_every and t % burst_every < self.mix["burst_seconds"]:
+            return self.mix["burst_factor"]
+        return 1
+
+    def next_request(self):
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        if kind == "form":
+            return kind, "/generate-form", {
+                "formType": self.rng.choice(self.forms),
+                "studentId": str(self.rng.randrange(64070500000, 67070599999)),
+                "name": f"นักศึกษา ทดสอบ {self.rng.randrange(1000)}",
+                "faculty": "วิศวกรรมศาสตร์",
+                "year": str(self.rng.randrange(1, 5)),
+            }
+        if self.rng.random() < self.mix.get("hot_ratio", 0):
+            message = HOT_QUESTION
+        else:
+            message = self.rng.choice(self.questions)["question"]
+        return kind, "/chat/stream" if kind == "stream" else "/chat", {"message": message}
+
+
+async def send(client, kind, path, payload):
+    started = time.perf_counter()
+    record = {"kind": kind, "status": None, "error": None}
+    try:
+        if kind == "stream":
+            first_byte = None
+            async with client.stream("POST", path, json=payload) as response:
+                record["status"] = response.status_code
+                body = []
+                async for chunk in response.aiter_text():
+                    first_byte = first_byte or time.perf_counter() - started
+                    body.append(chunk)
+            record["ttfb"] = first_byte
+            if '"type": "error"' in "".join(body):
+                record["error"] = "stream error"
+        else:
+            response = await client.post(path, json=payload)
+            record["status"] = response.status_code
+            if kind == "chat" and response.status_code == 200 and response.json().get("reply") == ERROR_REPLY:
+                record["error"] = "error reply"
+        if record["status"] >= 400:
+            record["error"] = f"HTTP {record['status']}"
+    except httpx.HTTPError as e:
+        record["error"] = type(e).__name__
+    record["latency"] = time.perf_counter() - started
+    return record
+
+
+async def sample_memory(pids, samples, interval=0.5):
+    while True:
+        for pid in pids:
+            value = rss_mb(pid)
+            if value is not None:
+                samples[pid].append(value)
+        await asyncio.sleep(interval)
+
+
+async def drive(base_url, traffic, rps, duration, server_pid, timeout, max_connections):
+    """ยิง request แบบ open-loop: เวลาห่างระหว่าง request สุ่มแบบ exponential ตาม rps (× burst factor)"""
+    samples = collections.defaultdict(list)
+    parents = process_tree(server_pid) if server_pid else {}
+    sampler = asyncio.create_task(sample_memory(list(parents), samples)) if parents else None
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        tasks = []
+        started = time.monotonic()
+        t = 0.0
+        while True:
+            t += traffic.rng.expovariate(rps * traffic.rate_factor(t))
+            if t >= duration:
+                break
+            await asyncio.sleep(max(0.0, started + t - time.monotonic()))
+            tasks.append(asyncio.create_task(send(client, *traffic.next_request())))
+        records = await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+        try:
+            server_stats = (await client.get("/cache/stats")).json()
+        except (httpx.HTTPError, ValueError):
+            server_stats = None
+    if sampler is not None:
+        sampler.cancel()
+    workers = [
+        {"pid": pid, "parent": parents[pid], "rss_mb_max": max(values), "rss_mb_end": values[-1]}
+        for pid, values in samples.items() if values
+    ]
+    return records, elapsed, workers, server_stats
+
+
+def summarize(records, elapsed):
+    errors = [record for record in records if record["error"]]
+    result = {
+        "requests": len(records),
+        "rps": len(records) / elapsed,
+        **percentiles([record["latency"] for record in records]),
+        "errors": len(errors),
+        "error_rate": len(errors) / len(records),
+        "status": dict(collections.Counter(str(record["status"]) for record in records)),
+        "error_kinds": dict(collections.Counter(record["error"] for record in errors)),
+    }
+    ttfb = [record["ttfb"] for record in records if record.get("ttfb") is not None]
+    if ttfb:
+        result["ttfb_p95_ms"] = percentiles(ttfb)["p95_ms"]
+    return result
+
+
+def compare(result, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    for name, row in {"overall": result["overall"], **result["endpoints"]}.items():
+        before = baseline["overall"] if name == "overall" else baseline["endpoints"].get(name)
+        if not before:
+            continue
+        print(f"   {name:>8}: rps {before['rps']:.1f} → {row['rps']:.1f}  "
+              f"p95 {before['p95_ms']:.0f} → {row['p95_ms']:.0f}ms  "
+              f"errors {before['error_rate']:.2%} → {row['error_rate']:.2%}")
+
+
+def run_loadtest():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mix", choices=sorted(TRAFFIC_MIXES), default="mixed")
+    parser.add_argument("--rps", type=float, default=10, help="อัตรา request เฉลี่ย (ช่วง burst คูณ burst_factor)")
+    parser.add_argument("--duration", type=float, default=30, help="วินาที")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn --workers")
+    parser.add_argument("--snapshot", help="snapshot ที่มีอยู่แล้ว (upload_data.py --export-snapshot) แทนการสร้างจาก fixture")
+    parser.add_argument("--source", action="append", help="PDF / โฟลเดอร์เพิ่มเติมตอนสร้าง index (เหมือน upload_data.py --source)")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-tokens-per-s", type=float, default=200)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--target", help="URL ของ server ที่รันอยู่แล้ว (ไม่ start fake LLM / server เอง)")
+    parser.add_argument("--server-pid", type=int, help="pid ของ server ที่ --target (ใช้วัด memory)")
+    parser.add_argument("--timeout", type=float, default=60, help="timeout ต่อ request (วินาที)")
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="บันทึกผลเป็นไฟล์ JSON")
+    parser.add_argument("--baseline", help="JSON ของรอบก่อน เพื่อเทียบผล")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    traffic = Traffic(TRAFFIC_MIXES[args.mix], load_questions(QUESTIONS_PATH), rng)
+    processes, fake_llm_url = [], None
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            if args.target:
+                base_url, server, server_pid = args.target, None, args.server_pid
+            else:
+                snapshot = args.snapshot
+                if snapshot is None:
+                    print("🧠 Building index from fixtures...")
+                    snapshot = build_snapshot(workdir, args.source)
+                base_url, server, processes, fake_llm_url = start_stack(args, snapshot)
+                server_pid = server.pid
+            print(f"⏳ Waiting for {base_url}/readyz ...")
+            wait_ready(base_url, server, args.ready_timeout)
+            print(f"🚀 {args.mix}: {args.rps} rps for {args.duration}s")
+            records, elapsed, workers, server_stats = asyncio.run(drive(
+                base_url, traffic, args.rps, args.duration, server_pid, args.timeout, args.max_connections,
+            ))
+            fake_llm_stats = httpx.get(f"{fake_llm_url}/stats").json() if fake_llm_url else None
+        finally:
+            stop_processes(processes)
+
+    by_kind = collections.defaultdict(list)
+    for record in records:
+        by_kind[record["kind"]].append(record)
+    result = {
+        "config": {
+            "mix": args.mix,
+            "rps": args.rps,
+            "duration_s": args.duration,
+            "workers": args.workers,
+            "target": args.target,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_tokens_per_s": args.llm_tokens_per_s,
+            "llm_error_rate": args.llm_error_rate,
+            "seed": args.seed,
+        },
+        "overall": summarize(records, elapsed),
+        "endpoints": {kind: summarize(rows, elapsed) for kind, rows in sorted(by_kind.items())},
+        "workers": workers,
+        "fake_llm": fake_llm_stats,
+        "server": server_stats,
+    }
+
+    for name, row in {"overall": result["overall"], **result["endpoints"]}.items():
+        print(f"📊 {name:>8}: {row['requests']:5d} req  {row['rps']:7.1f} rps  p50={row['p50_ms']:7.1f}ms  "
+              f"p95={row['p95_ms']:7.1f}ms  p99={row['p99_ms']:7.1f}ms  errors={row['error_rate']:.2%}")
+    for worker in workers:
+        parent = f" (child of {worker['parent']})" if worker["parent"] else ""
+        print(f"🧮 pid {worker['pid']}{parent}: RSS max {worker['rss_mb_max']:.0f}MB, end {worker['rss_mb_end']:.0f}MB")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    if args.baseline:
+        compare(result, args.baseline)
+
+
+if __name__ == "__main__":
+    run_loadtest()
@@ -0,0 +1,295 @@
+"""
+Benchmark + regression ของ retrieval (ไม่เรียก LLM, ไม่ต้องมี Qdrant server / GROQ_API_KEY)
+
+สร้าง index จาก fixture ในเครื่อง (SUMMARY_TEXT + PDF ที่ระบุด้วย --source) ด้วย chunking / embedding
+แบบเดียวกับ upload_data.py แล้วถามชุดคำถามที่มีเฉลยเป็นรหัสฟอร์ม (bench/retrieval_questions.jsonl
+สร้างจาก keyword ใน FORM_MASTER_DATA ถ้ายังไม่มีไฟล์) วัด
+  - recall@k (มี chunk ของฟอร์มที่ถูกต้องใน k อันดับแรก) และ MRR
+  - latency ต่อคำถาม p50/p95/p99 (embed และ search แยกกัน)
+  - embedding throughput ตอน build index และเวลา build
+ต้องมีโมเดล FastEmbed ใน cache แล้ว (preload.py / FASTEMBED_CACHE_PATH) จึงรันแบบ offline ได้ทั้งหมด
+
+    python bench/retrieval_bench.py --backend numpy --json before.json
+    python bench/retrieval_bench.py --rerank --k 30 --json rerank.json   # ค้น 30 แล้ว rerank เหลือ RERANK_TOP_N
+    RETRIEVAL_K=3 python bench/retrieval_bench.py --json after.json --baseline before.json --max-recall-drop 0.02
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("GROQ_API_KEY", "offline-bench")  # main.py ต้องมีค่า แต่ benchmark นี้ไม่เรียก LLM
+
+from langchain_core.documents import Document
+from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
+from langchain_qdrant import QdrantVectorStore, FastEmbedSparse, RetrievalMode
+from qdrant_client import QdrantClient, models
+
+import main
+import upload_data
+from context_builder import estimate_tokens
+from forms import FORM_MASTER_DATA, SUMMARY_TEXT
+from local_index import LocalIndex, LocalVectorStore, write_snapshot
+from reranker import Reranker
+from thai_text import ThaiSparseEmbeddings
+
+QUESTIONS_PATH = os.path.join(ROOT, "bench", "retrieval_questions.jsonl")
+RECALL_AT = (1, 3, 5, 10)
+
+
+def seed_questions():
+    """คำถามตั้งต้นจาก keyword ของแต่ละฟอร์ม (ไม่รวม keyword ที่เป็นรหัสฟอร์มตรงๆ เช่น ro16 / สทน.16)"""
+    questions = []
+    for item in FORM_MASTER_DATA:
+        number = item["id"].split(".")[1]
+        for keyword in item.get("keywords", []):
+            if number in keyword:
+                continue
+            questions.append({"question": f"{keyword} ต้องใช้ฟอร์มอะไร", "form_id": item["id"]})
+        questions.append({"question": f"ขอ{item['name']}ต้องทำอย่างไร", "form_id": item["id"]})
+    return questions
+
+
+def load_questions(path):
+    if not os.path.exists(path):
+        with open(path, "w", encoding="utf-8") as f:
+            for row in seed_questions():
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        print(f"📝 Seeded {path} from FORM_MASTER_DATA keywords (แก้/เพิ่มคำถามจริงของนักศึกษาได้)")
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_chunks(sources):
+    """chunk ของ fixture ในเครื่อง ตัดแบบเดียวกับ upload_data.py (SUMMARY_TEXT ตามหัวข้อ + PDF ที่ระบุ)"""
+    text_splitter = upload_data.make_text_splitter()
+    summary_doc = Document(
+        page_content=SUMMARY_TEXT,
+        metadata={"file": "summary_forms.txt", "source": upload_data.SUMMARY_SOURCE},
+    )
+    chunks = upload_data.finalize_chunks([summary_doc], upload_data.split_summary(text_splitter, summary_doc))
+    if sources:
+        for source, docs in upload_data.iter_pdfs(upload_data.expand_sources(sources)):
+            if docs is not None:
+                chunks.extend(upload_data.finalize_chunks(docs, text_splitter.split_documents(docs)))
+    return chunks
+
+
+def build_index(backend, chunks, embeddings, sparse_embeddings, workdir):
+    """embed chunk ทั้งหมดแล้วสร้าง index คืน (vector_store, timings)"""
+    texts = [chunk.page_content for chunk in chunks]
+    started = time.perf_counter()
+    dense = embeddings.embed_documents(texts)
+    dense_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    sparse = sparse_embeddings.embed_documents(texts)
+    sparse_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    payloads = [{"page_content": chunk.page_content, "metadata": chunk.metadata} for chunk in chunks]
+    if backend == "numpy":
+        path = os.path.join(workdir, "snapshot")
+        write_snapshot(path, payloads, dense, [(vector.indices, vector.values) for vector in sparse], {
+            "collection": "bench",
+            "dense_model": main.DENSE_MODEL_NAME,
+            "sparse_model": main.SPARSE_MODEL_NAME,
+            "sparse_tokenizer": main.SPARSE_TOKENIZER,
+        })
+        vector_store = LocalVectorStore(LocalIndex(path), embeddings, sparse_embeddings)
+    else:
+        client = QdrantClient(location=":memory:")
+        upload_data.create_collection(client, main.COLLECTION_NAME)
+        client.upsert(main.COLLECTION_NAME, points=[
+            models.PointStruct(
+                id=str(uuid.uuid4()),
+                vector={
+                    "dense_vector": dense_vector,
+                    "sparse_vector": models.SparseVector(indices=sparse_vector.indices, values=sparse_vector.values),
+                },
+                payload=payload,
+            )
+            for payload, dense_vector, sparse_vector in zip(payloads, dense, sparse)
+        ])
+        main.active_collection = main.COLLECTION_NAME
+        vector_store = QdrantVectorStore(
+            client=client,
+            collection_name=main.COLLECTION_NAME,
+            embedding=embeddings,
+            sparse_embedding=sparse_embeddings,
+            retrieval_mode=RetrievalMode.HYBRID,
+            vector_name="dense_vector",
+            sparse_vector_name="sparse_vector",
+        )
+    index_seconds = time.perf_counter() - started
+    return vector_store, {
+        "chunks": len(chunks),
+        "dense_chunks_per_s": len(texts) / dense_seconds,
+        "sparse_chunks_per_s": len(texts) / sparse_seconds,
+        "embed_s": dense_seconds + sparse_seconds,
+        "index_s": index_seconds,
+    }
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def at(q):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000
+
+    return {"p50_ms": statistics.median(ordered) * 1000, "p95_ms": at(0.95), "p99_ms": at(0.99)}
+
+
+def evaluate(vector_store, questions, k, reranker=None):
+    """
+    ถามทีละคำถาม (ไม่ผ่าน micro-batcher) วัด rank ของ chunk แรกที่เป็นฟอร์มที่ถูกต้อง
+    มี reranker: ค้น k chunk เป็น candidate แล้ววัดผลหลัง rerank (เหลือ reranker.top_n)
+    """
+    ranks, embed_times, search_times, rerank_times, tokens, misses = [], [], [], [], [], []
+    for row in questions:
+        started = time.perf_counter()
+        [(dense, sparse)] = main.embed_queries(vector_store, [row["question"]])
+        embed_times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        [docs] = main.hybrid_search_batch(vector_store, [(dense, sparse, k)])
+        search_times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        if reranker is not None:
+            docs = reranker.rerank(row["question"], docs)
+        rerank_times.append(time.perf_counter() - started)
+
+        form_ids = [doc.metadata.get("form_id") for doc in docs]
+        rank = form_ids.index(row["form_id"]) + 1 if row["form_id"] in form_ids else None
+        ranks.append(rank)
+        tokens.append(sum(estimate_tokens(doc.page_content) for doc in docs))
+        if rank is None:
+            misses.append({"question": row["question"], "form_id": row["form_id"], "retrieved": form_ids})
+
+    total = len(questions)
+    depth = reranker.top_n if reranker is not None else k
+    result = {
+        "questions": total,
+        "recall": {f"@{n}": sum(1 for rank in ranks if rank and rank <= n) / total for n in RECALL_AT if n <= depth},
+        "mrr": sum(1 / rank for rank in ranks if rank) / total,
+        "avg_retrieved_tokens": statistics.mean(tokens),
+        "embed_latency": percentiles(embed_times),
+        "search_latency": percentiles(search_times),
+        "total_latency": percentiles([sum(times) for times in zip(embed_times, search_times, rerank_times)]),
+        "query_embed_per_s": total / sum(embed_times),
+        "misses": misses,
+    }
+    if reranker is not None:
+        result["rerank_latency"] = percentiles(rerank_times)
+        result["rerank"] = reranker.stats()
+    return result
+
+
+def compare(result, baseline_path, max_recall_drop):
+    """พิมพ์ส่วนต่างกับผลรอบก่อน คืน False ถ้า recall ตัวใดลดลงเกิน max_recall_drop"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    ok = True
+    for name, value in result["retrieval"]["recall"].items():
+        before = baseline["retrieval"]["recall"].get(name)
+        if before is None:
+            continue
+        drop = before - value
+        flag = "❌" if drop > max_recall_drop else "  "
+        ok = ok and drop <= max_recall_drop
+        print(f"{flag} recall{name}: {before:.3f} → {value:.3f} ({-drop:+.3f})")
+    for section, key in (("retrieval", "mrr"), ("retrieval", "avg_retrieved_tokens")):
+        print(f"   {key}: {baseline[section][key]:.3f} → {result[section][key]:.3f}")
+    before, after = baseline["retrieval"]["total_latency"]["p95_ms"], result["retrieval"]["total_latency"]["p95_ms"]
+    print(f"   p95 latency: {before:.1f}ms → {after:.1f}ms")
+    return ok
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=["numpy", "qdrant-memory"], default="numpy")
+    parser.add_argument("--k", type=int, default=main.RETRIEVAL_K, help="จำนวน chunk ที่ค้นต่อคำถาม (ค่าเริ่มต้น RETRIEVAL_K)")
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--source", action="append", help="PDF / โฟลเดอร์ในเครื่องเพิ่มเติม (เหมือน upload_data.py --source)")
+    parser.add_argument("--rerank", action="store_true", help="rerank candidate --k ตัวด้วย RERANK_MODEL (ตั้งค่าด้วย env RERANK_*)")
+    parser.add_argument("--json", help="บันทึกผลเป็นไฟล์ JSON")
+    parser.add_argument("--baseline", help="JSON ของรอบก่อน เพื่อเทียบผล")
+    parser.add_argument("--max-recall-drop", type=float, default=0.0, help="exit 1 ถ้า recall ลดลงเกินค่านี้เทียบกับ --baseline")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    embeddings = FastEmbedEmbeddings(model_name=main.DENSE_MODEL_NAME)
+    sparse_embeddings = FastEmbedSparse(model_name=main.SPARSE_MODEL_NAME)
+    if main.THAI_SEGMENTATION:
+        sparse_embeddings = ThaiSparseEmbeddings(sparse_embeddings)
+    reranker = None
+    if args.rerank:
+        reranker = Reranker(
+            main.RERANK_MODEL, top_n=main.RERANK_TOP_N, step=main.RERANK_STEP,
+            dominance_margin=main.RERANK_DOMINANCE_MARGIN,
+        )
+    model_load_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    chunks = load_chunks(args.source)
+    chunk_s = time.perf_counter() - started
+    indexed_forms = {chunk.metadata.get("form_id") for chunk in chunks}
+    questions = load_questions(args.questions)
+    skipped = [row for row in questions if row["form_id"] not in indexed_forms]
+    questions = [row for row in questions if row["form_id"] in indexed_forms]
+    if skipped:
+        print(f"⚠️ ข้าม {len(skipped)} คำถาม: fixture ไม่มี chunk ของ {sorted({row['form_id'] for row in skipped})}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        vector_store, build = build_index(args.backend, chunks, embeddings, sparse_embeddings, workdir)
+        build.update({"model_load_s": model_load_s, "chunk_s": chunk_s})
+        [(dense, sparse)] = main.embed_queries(vector_store, ["warm-up query ลาป่วยใช้ฟอร์มอะไร"])  # warm-up ONNX
+        if reranker is not None:
+            [docs] = main.hybrid_search_batch(vector_store, [(dense, sparse, args.k)])
+            reranker.rerank("warm-up query ลาป่วยใช้ฟอร์มอะไร", docs)
+        retrieval = evaluate(vector_store, questions, args.k, reranker)
+
+    result = {
+        "config": {
+            "backend": args.backend,
+            "k": args.k,
+            "rerank_model": main.RERANK_MODEL if args.rerank else None,
+            "rerank_top_n": main.RERANK_TOP_N if args.rerank else None,
+            "dense_model": main.DENSE_MODEL_NAME,
+            "sparse_model": main.SPARSE_MODEL_NAME,
+            "sparse_tokenizer": main.SPARSE_TOKENIZER,
+            "summary_section_max_chars": upload_data.SUMMARY_SECTION_MAX_CHARS,
+            "sources": args.source or [],
+            "skipped_questions": len(skipped),
+        },
+        "build": build,
+        "retrieval": retrieval,
+    }
+
+    recall = "  ".join(f"R{name}={value:.3f}" for name, value in retrieval["recall"].items())
+    print(f"📦 build: {build['chunks']} chunks, embed {build['embed_s']:.2f}s "
+          f"({build['dense_chunks_per_s']:.1f} dense chunks/s), index {build['index_s'] * 1000:.1f}ms")
+    print(f"🎯 {retrieval['questions']} questions  {recall}  MRR={retrieval['mrr']:.3f}  "
+          f"~{retrieval['avg_retrieved_tokens']:.0f} tokens/query")
+    latency = retrieval["total_latency"]
+    print(f"⏱️ latency p50={latency['p50_ms']:.1f}ms p95={latency['p95_ms']:.1f}ms p99={latency['p99_ms']:.1f}ms "
+          f"(search p95={retrieval['search_latency']['p95_ms']:.2f}ms)")
+    if reranker is not None:
+        rerank = retrieval["rerank"]
+        print(f"🏅 rerank p50={retrieval['rerank_latency']['p50_ms']:.1f}ms p95={retrieval['rerank_latency']['p95_ms']:.1f}ms "
+              f"scored {rerank['avg_scored']:.1f}/{rerank['avg_candidates']:.1f} candidates, "
+              f"{rerank['early_exits']} early exits")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    if args.baseline and not compare(result, args.baseline, args.max_recall_drop):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_benchmark()
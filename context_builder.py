@@ -0,0 +1,118 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text):
+    """
+    ประมาณจำนวน token แบบไม่ต้องโหลด tokenizer: ภาษาอังกฤษ/ตัวเลข ~4 ตัวอักษรต่อ token
+    ภาษาไทย (ไม่มีช่องว่างระหว่างคำ) ~2 ตัวอักษรต่อ token
+    """
+    ascii_chars = sum(1 for ch in text if ch < "\x80")
+    return ascii_chars // 4 + (len(text) - ascii_chars) // 2 + 1
+
+
+def _shingles(text, size=5):
+    text = " ".join(text.split())
+    return {text[i:i + size] for i in range(max(1, len(text) - size + 1))}
+
+
+def _join_overlap(left, right, max_overlap=200):
+    """ต่อ chunk ที่อยู่ติดกัน โดยตัดส่วนที่ซ้อนกัน (chunk_overlap ของ text splitter) ออก"""
+    for size in range(min(max_overlap, len(left), len(right)), 0, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return f"{left}\n{right}"
+
+
+class ContextBuilder:
+    """
+    สร้าง context สำหรับ prompt จาก chunk ที่ค้นได้ (เรียงตามอันดับจาก Qdrant แล้ว)
+    1. ตัด chunk ที่เนื้อหาแทบซ้ำกับ chunk ที่อันดับดีกว่า (shingle containment >= dedup_threshold)
+       เช่น ข้อความเดียวกันจาก PDF และ SUMMARY_TEXT
+    2. รวม chunk ที่อยู่ติดกันจาก source เดียวกัน (chunk_index ต่อกัน) เป็นก้อนเดียว ตัดส่วนที่ซ้อนกันออก
+    3. เรียงก้อนตามอันดับที่ดีที่สุดของ chunk ในก้อน แล้วใส่จนเต็ม token_budget
+    """
+
+    def __init__(self, token_budget=1200, dedup_threshold=0.85):
+        self.token_budget = token_budget
+        self.dedup_threshold = dedup_threshold
+        self.requests = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self._lock = threading.Lock()
+
+    def _dedupe(self, docs):
+        kept, kept_shingles = [], []
+        for doc in docs:
+            shingles = _shingles(doc.page_content)
+            duplicate = any(
+                len(shingles & other) / min(len(shingles), len(other)) >= self.dedup_threshold
+                for other in kept_shingles
+            )
+            if not duplicate:
+                kept.append(doc)
+                kept_shingles.append(shingles)
+        return kept
+
+    def _merge_adjacent(self, docs):
+        """คืน list ของ (rank, [docs]) — docs ในแต่ละก้อนเรียงตาม chunk_index"""
+        groups = []  # [rank, source, last_index, docs]
+        ranked = sorted(enumerate(docs), key=lambda pair: (
+            str(pair[1].metadata.get("source")), pair[1].metadata.get("chunk_index", -1)
+        ))
+        for rank, doc in ranked:
+            source = doc.metadata.get("source")
+            index = doc.metadata.get("chunk_index")
+            last = groups[-1] if groups else None
+            if last and index is not None and last[1] == source and last[2] is not None and index == last[2] + 1:
+                last[0] = min(last[0], rank)
+                last[2] = index
+                last[3].append(doc)
+            else:
+                groups.append([rank, source, index, [doc]])
+        return sorted(((rank, members) for rank, _, _, members in groups), key=lambda group: group[0])
+
+    def build(self, docs):
+        """คืน (context_text, docs ที่ถูกใส่ใน context จริง)"""
+        tokens_in = sum(estimate_tokens(doc.page_content) + 1 for doc in docs)
+        blocks, used, remaining = [], [], self.token_budget
+        for _, members in self._merge_adjacent(self._dedupe(docs)):
+            text = members[0].page_content
+            for doc in members[1:]:
+                text = _join_overlap(text, doc.page_content)
+            tokens = estimate_tokens(text) + 1
+            if tokens > remaining:
+                if blocks:
+                    continue  # ลองก้อนถัดไปที่อาจเล็กพอ
+                # ก้อนแรก (อันดับดีที่สุด) ใหญ่เกิน budget: ตัดให้พอดีดีกว่าไม่มี context เลย
+                text = text[: int(len(text) * remaining / tokens)]
+                tokens = remaining
+            blocks.append(text)
+            used.extend(members)
+            remaining -= tokens
+
+        context_text = "".join(f"{block}\n\n" for block in blocks)
+        tokens_out = self.token_budget - remaining
+        with self._lock:
+            self.requests += 1
+            self.tokens_in += tokens_in
+            self.tokens_out += tokens_out
+        logger.info(
+            "🧮 Context: %d chunks ~%d tokens -> %d blocks ~%d tokens (saved ~%d)",
+            len(docs), tokens_in, len(blocks), tokens_out, tokens_in - tokens_out,
+        )
+        return context_text, used
+
+    def stats(self):
+        with self._lock:
+            return {
+                "token_budget": self.token_budget,
+                "dedup_threshold": self.dedup_threshold,
+                "requests": self.requests,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "tokens_saved": self.tokens_in - self.tokens_out,
+                "avg_tokens_saved": (self.tokens_in - self.tokens_out) / self.requests if self.requests else 0.0,
+            }
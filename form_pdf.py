@@ -0,0 +1,284 @@
+"""
+Render แบบฟอร์มเป็น PDF โดยตรง (ไม่ต้องผ่าน Word) สำหรับ /generate-form?format=pdf
+
+แม่แบบ .docx ใน templates/ คือภาพสแกนฟอร์มทางการเต็มหน้า (อยู่ใน header) + text box ที่วางทับตามตำแหน่งช่องกรอก
+ไฟล์นี้อ่านตำแหน่ง text box เหล่านั้นมาเป็น field/coordinate map ของแต่ละฟอร์ม แล้ว
+- สร้างหน้า PDF ต้นแบบจากภาพสแกน (หรือใช้ PDF ทางการใน PDF_FORM_DIR ถ้ามี) ครั้งเดียวต่อ process
+- ทุก render เปิดต้นแบบจาก bytes ใน memory แล้วเขียนข้อความทับด้วย TextWriter (ไม่มี layout engine)
+cache จะโหลดใหม่เมื่อ mtime ของแม่แบบเปลี่ยน เหมือน form_templates
+"""
+import os
+import re
+import subprocess
+import threading
+from functools import lru_cache
+from zipfile import ZipFile
+
+import pymupdf
+from lxml import etree
+
+# ฟอนต์ภาษาไทย (.ttf) ที่ใช้เขียนข้อความลง PDF เช่น TH Sarabun New ตามแม่แบบ .docx
+PDF_THAI_FONT = os.environ.get("PDF_THAI_FONT", os.path.join("fonts", "THSarabunNew.ttf"))
+# ถ้าไม่มีไฟล์ที่ PDF_THAI_FONT ใช้ฟอนต์ไทยของระบบตัวแรกที่เจอ (fonts-thai-tlwg / fonts-noto-core ของ Debian/Ubuntu)
+# แล้วจึงถาม fontconfig (fc-list :lang=th)
+SYSTEM_THAI_FONTS = (
+    "/usr/share/fonts/truetype/thai/THSarabunNew.ttf",
+    "/usr/share/fonts/truetype/tlwg/Garuda.ttf",
+    "/usr/share/fonts/opentype/tlwg/Garuda.otf",
+    "/usr/share/fonts/truetype/tlwg/Loma.ttf",
+    "/usr/share/fonts/opentype/tlwg/Loma.otf",
+    "/usr/share/fonts/truetype/noto/NotoSansThai-Regular.ttf",
+    "/usr/share/fonts/truetype/noto/NotoSerifThai-Regular.ttf",
+)
+# ถ้ามี PDF ทางการชื่อเดียวกับแม่แบบ (เช่น RO-16_Sick_Leave.pdf) ในโฟลเดอร์นี้ จะใช้แทนภาพสแกน
+PDF_FORM_DIR = os.environ.get("PDF_FORM_DIR", os.path.join("templates", "pdf"))
+
+EMU_PER_PT = 12700
+TWIPS_PER_PT = 20
+_DEFAULT_INSETS = (91440, 45720, 91440, 45720)  # lIns, tIns, rIns, bIns ของ text box (EMU)
+_ALIGN = {"center": pymupdf.TEXT_ALIGN_CENTER, "right": pymupdf.TEXT_ALIGN_RIGHT, "both": pymupdf.TEXT_ALIGN_JUSTIFY}
+_PLACEHOLDER_RE = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+NS = {
+    "w": "http://schemas.openxmlformats.org/wordprocessingml/2006/main",
+    "wp": "http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing",
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "wps": "http://schemas.microsoft.com/office/word/2010/wordprocessingShape",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+
+_layouts = {}  # docx path -> PdfLayout
+_fonts = {}  # font path -> pymupdf.Font
+_lock = threading.Lock()
+
+
+class PdfField:
+    __slots__ = ("template", "rect", "fontsize", "align")
+
+    def __init__(self, template, rect, fontsize, align):
+        self.template = template  # ข้อความใน text box เช่น "{{ date_day }}/{{ date_month }}"
+        self.rect = rect
+        self.fontsize = fontsize
+        self.align = align
+
+    def text(self, context):
+        return _PLACEHOLDER_RE.sub(lambda m: _to_text(context.get(m.group(1))), self.template)
+
+
+class PdfLayout:
+    __slots__ = ("mtime", "base_pdf", "fields")
+
+    def __init__(self, mtime, base_pdf, fields):
+        self.mtime = mtime
+        self.base_pdf = base_pdf
+        self.fields = fields
+
+
+def _to_text(value):
+    return "" if value is None else str(value)
+
+
+def _emu(value):
+    return int(value) / EMU_PER_PT
+
+
+def _anchor_origin(anchor, page_width, margins, top):
+    """
+    ตำแหน่งมุมบนซ้ายของ anchor (pt)
+    margins=(left, right) และ top คือขอบที่ใช้เมื่อ relativeFrom ไม่ใช่ "page" (text box ทุกอันในแม่แบบผูกกับ
+    ย่อหน้าแรกของหน้า จึงใช้ขอบบนของย่อหน้านั้นแทน paragraph/margin ได้)
+    """
+    width = _emu(anchor.find("wp:extent", NS).get("cx"))
+    pos_h = anchor.find("wp:positionH", NS)
+    left, right = (0, page_width) if pos_h.get("relativeFrom") == "page" else (margins[0], page_width - margins[1])
+    offset = pos_h.findtext("wp:posOffset", namespaces=NS)
+    if offset is not None:
+        x = left + _emu(offset)
+    else:
+        align = pos_h.findtext("wp:align", namespaces=NS)
+        x = {"right": right - width, "center": (left + right - width) / 2}.get(align, left)
+    pos_v = anchor.find("wp:positionV", NS)
+    offset = pos_v.findtext("wp:posOffset", namespaces=NS) or 0
+    y = _emu(offset) + (0 if pos_v.get("relativeFrom") == "page" else top)
+    return x, y
+
+
+def _section_geometry(document):
+    sect = document.find(".//w:body/w:sectPr", NS)
+    pg_sz = sect.find("w:pgSz", NS)
+    pg_mar = sect.find("w:pgMar", NS)
+    w = lambda el, name: int(el.get(f"{{{NS['w']}}}{name}")) / TWIPS_PER_PT
+    page_size = (w(pg_sz, "w"), w(pg_sz, "h"))
+    return page_size, (w(pg_mar, "left"), w(pg_mar, "right")), w(pg_mar, "top"), w(pg_mar, "header")
+
+
+def _read_fields(document, page_size, margins, top):
+    fields = []
+    for anchor in document.iter(f"{{{NS['wp']}}}anchor"):
+        content = anchor.find(".//wps:txbx/w:txbxContent", NS)
+        if content is None:
+            continue
+        text = "\n".join("".join(p.itertext()) for p in content.iterfind("w:p", NS)).strip()
+        if not _PLACEHOLDER_RE.search(text):
+            continue
+        x, y = _anchor_origin(anchor, page_size[0], margins, top)
+        extent = anchor.find("wp:extent", NS)
+        body_pr = anchor.find(".//wps:bodyPr", NS)
+        insets = [
+            _emu(body_pr.get(name, default)) if body_pr is not None else _emu(default)
+            for name, default in zip(("lIns", "tIns", "rIns", "bIns"), _DEFAULT_INSETS)
+        ]
+        size = content.find(".//w:sz", NS)
+        fontsize = int(size.get(f"{{{NS['w']}}}val")) / 2 if size is not None else 14
+        jc = content.find(".//w:jc", NS)
+        align = _ALIGN.get(jc.get(f"{{{NS['w']}}}val") if jc is not None else None, pymupdf.TEXT_ALIGN_LEFT)
+        x0, y0 = x + insets[0], y + insets[1]
+        x1 = x + _emu(extent.get("cx")) - insets[2]
+        # text box ในแม่แบบเตี้ยกว่า 1 บรรทัดได้ (Word ปล่อยล้น) จึงขยายให้พออย่างน้อย 1 บรรทัด
+        y1 = max(y + _emu(extent.get("cy")) - insets[3], y0 + fontsize * 1.5)
+        fields.append(PdfField(text, pymupdf.Rect(x0, y0, x1, y1), fontsize, align))
+    return fields
+
+
+def _background_image(zipf, page_size, header_top):
+    """ภาพสแกนฟอร์มใน header ของแม่แบบ -> (bytes, rect)"""
+    rels = etree.fromstring(zipf.read("word/_rels/header1.xml.rels"))
+    targets = {rel.get("Id"): rel.get("Target") for rel in rels.iterfind("rel:Relationship", NS)}
+    header = etree.fromstring(zipf.read("word/header1.xml"))
+    for anchor in header.iter(f"{{{NS['wp']}}}anchor"):
+        blip = anchor.find(".//a:blip", NS)
+        if blip is None:
+            continue
+        image = zipf.read("word/" + targets[blip.get(f"{{{NS['r']}}}embed")])
+        x, y = _anchor_origin(anchor, page_size[0], (0, 0), header_top)
+        extent = anchor.find("wp:extent", NS)
+        return image, pymupdf.Rect(x, y, x + _emu(extent.get("cx")), y + _emu(extent.get("cy")))
+    raise ValueError("ไม่พบภาพฟอร์มใน header ของแม่แบบ")
+
+
+def build_layout(path):
+    """อ่าน field/coordinate map + สร้างหน้า PDF ต้นแบบจากแม่แบบ .docx"""
+    mtime = os.stat(path).st_mtime
+    with ZipFile(path) as zipf:
+        document = etree.fromstring(zipf.read("word/document.xml"))
+        page_size, margins, top, header_top = _section_geometry(document)
+        fields = _read_fields(document, page_size, margins, top)
+
+        official = os.path.join(PDF_FORM_DIR, os.path.splitext(os.path.basename(path))[0] + ".pdf")
+        if os.path.exists(official):
+            with pymupdf.open(official) as src:
+                base = pymupdf.open()
+                base.insert_pdf(src, from_page=0, to_page=0)
+        else:
+            image, rect = _background_image(zipf, page_size, header_top)
+            base = pymupdf.open()
+            page = base.new_page(width=page_size[0], height=page_size[1])
+            page.insert_image(rect, stream=image)
+    base_pdf = base.tobytes(garbage=3, deflate=True)
+    base.close()
+    return PdfLayout(mtime, base_pdf, fields)
+
+
+def get_layout(path):
+    mtime = os.stat(path).st_mtime
+    layout = _layouts.get(path)
+    if layout is not None and layout.mtime == mtime:
+        return layout
+    with _lock:
+        layout = _layouts.get(path)
+        if layout is None or layout.mtime != mtime:
+            layout = build_layout(path)
+            _layouts[path] = layout
+    return layout
+
+
+@lru_cache(maxsize=1)
+def _fontconfig_thai_fonts():
+    """ไฟล์ฟอนต์ที่ fontconfig บอกว่ารองรับภาษาไทย (ไม่มี fc-list = ว่าง)"""
+    try:
+        output = subprocess.run(
+            ["fc-list", ":lang=th", "file"], capture_output=True, text=True, timeout=5, check=False,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return ()
+    paths = (line.rstrip().rstrip(":") for line in output.splitlines())
+    return tuple(sorted(path for path in paths if path.lower().endswith((".ttf", ".otf", ".ttc"))))
+
+
+def font_path():
+    """ไฟล์ฟอนต์ที่ใช้: PDF_THAI_FONT ถ้ามี ไม่งั้นฟอนต์ไทยของระบบตัวแรกที่เจอ (None = ใช้ฟอนต์ในตัว MuPDF)"""
+    for path in (PDF_THAI_FONT, *SYSTEM_THAI_FONTS, *_fontconfig_thai_fonts()):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _builtin_thai_font():
+    """Noto Serif Thai ที่มากับ MuPDF (None ถ้า build นี้ไม่ได้ฝังฟอนต์ไทยไว้)"""
+    try:
+        font = pymupdf.Font(script=pymupdf.UCDN_SCRIPT_THAI)
+    except Exception:
+        return None
+    return font if font.has_glyph(ord("ก")) else None
+
+
+def get_font(path=None):
+    path = path or font_path() or "builtin"
+    font = _fonts.get(path)
+    if font is None:
+        font = pymupdf.Font(fontfile=path) if path != "builtin" else _builtin_thai_font()
+        if font is None:
+            raise FileNotFoundError(f"No Thai font for PDF output: set PDF_THAI_FONT (missing: {PDF_THAI_FONT})")
+        _fonts[path] = font
+    return font
+
+
+def font_available():
+    """มีฟอนต์ไทยให้ใช้หรือไม่ (ไม่มี = ใช้ ?format=pdf ไม่ได้)"""
+    try:
+        get_font()
+    except Exception:
+        return False
+    return True
+
+
+def font_name():
+    return get_font().name
+
+
+def preload(paths):
+    """สร้าง layout ของทุกแม่แบบ + โหลดฟอนต์ล่วงหน้า (ข้ามถ้ายังไม่มีไฟล์ฟอนต์)"""
+    for path in paths:
+        if os.path.exists(path):
+            get_layout(path)
+    if font_available():
+        get_font()
+
+
+def render_pdf(path, context):
+    """
+    กรอกข้อมูลลงหน้า PDF ต้นแบบแล้วคืนเป็น bytes (thread-safe / ใช้ใน process pool ได้)
+    หมายเหตุ: TextWriter ไม่ทำ text shaping สระ/วรรณยุกต์จึงใช้ตำแหน่ง default ของฟอนต์
+    """
+    layout = get_layout(path)
+    font = get_font()
+    doc = pymupdf.open("pdf", layout.base_pdf)
+    page = doc[0]
+    writer = pymupdf.TextWriter(page.rect)
+    for field in layout.fields:
+        text = field.text(context)
+        if not text.strip():
+            continue
+        if field.rect.height < field.fontsize * 2.5 and "\n" not in text:
+            # ช่องบรรทัดเดียว: เขียนล้นกรอบได้เหมือนใน Word (fill_textbox จะตัดคำที่ยาวกว่าช่องทิ้ง)
+            width = font.text_length(text, fontsize=field.fontsize)
+            shift = {pymupdf.TEXT_ALIGN_CENTER: 0.5, pymupdf.TEXT_ALIGN_RIGHT: 1}.get(field.align, 0)
+            x = field.rect.x0 + (field.rect.width - width) * shift if width < field.rect.width else field.rect.x0
+            writer.append((x, field.rect.y0 + font.ascender * field.fontsize), text, font=font, fontsize=field.fontsize)
+        else:
+            writer.fill_textbox(field.rect, text, font=font, fontsize=field.fontsize, align=field.align)
+    writer.write_text(page)
+    data = doc.tobytes(deflate=True)
+    doc.close()
+    return data
@@ -0,0 +1,159 @@
+"""
+Cache + render แม่แบบ .docx สำหรับ /generate-form
+
+- แต่ละ template ถูกอ่านจาก disk, patch XML และ compile Jinja ของ body ไว้ครั้งเดียว
+  (โหลดใหม่อัตโนมัติเมื่อ mtime ของไฟล์เปลี่ยน)
+- ทุก render ใช้ DocxTemplate ตัวใหม่ที่ clone จาก bytes ใน memory จึง render พร้อมกันได้
+- ฟังก์ชันในไฟล์นี้เป็น top-level ทั้งหมด เพื่อให้เรียกผ่าน ProcessPoolExecutor ได้
+  (แต่ละ worker process มี cache ของตัวเอง)
+"""
+import os
+import re
+import threading
+from io import BytesIO
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+
+from docx.opc.pkgwriter import PackageWriter
+from docxtpl import DocxTemplate
+from jinja2 import Environment
+
+# ไฟล์ที่บีบอัดมาแล้ว (รูปภาพ) ไม่ต้อง deflate ซ้ำทุกครั้งที่ save
+_STORED_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif")
+
+_cache = {}  # path -> TemplateEntry
+_cache_lock = threading.Lock()
+
+
+class TemplateEntry:
+    __slots__ = ("path", "mtime", "data", "body_template")
+
+    def __init__(self, path, mtime, data, body_template):
+        self.path = path
+        self.mtime = mtime
+        self.data = data
+        self.body_template = body_template
+
+
+def compile_template(path):
+    """อ่านไฟล์ + patch XML + compile Jinja ของ body (ส่วนที่แพงที่สุดของ DocxTemplate.render)"""
+    mtime = os.stat(path).st_mtime
+    with open(path, "rb") as f:
+        data = f.read()
+    doc = DocxTemplate(BytesIO(data))
+    doc.init_docx()
+    # ขั้นตอนเดียวกับ DocxTemplate.build_xml / render_xml_part ก่อนเรียก Jinja
+    xml = doc.patch_xml(doc.get_xml())
+    xml = re.sub(r"<w:p([ >])", r"\n<w:p\1", xml)
+    return TemplateEntry(path, mtime, data, Environment().from_string(xml))
+
+
+def get_template(path):
+    """คืน TemplateEntry จาก cache (compile ใหม่ถ้ายังไม่มีหรือไฟล์ถูกแก้ไข)"""
+    mtime = os.stat(path).st_mtime
+    entry = _cache.get(path)
+    if entry is not None and entry.mtime == mtime:
+        return entry
+    with _cache_lock:
+        entry = _cache.get(path)
+        if entry is None or entry.mtime != mtime:
+            entry = compile_template(path)
+            _cache[path] = entry
+    return entry
+
+
+def preload(paths):
+    """compile template ทั้งหมดล่วงหน้า (ใช้ตอน startup และเป็น initializer ของ worker process)"""
+    for path in paths:
+        if os.path.exists(path):
+            get_template(path)
+
+
+class CompiledDocxTemplate(DocxTemplate):
+    """DocxTemplate ที่ใช้ body template ที่ compile ไว้แล้ว แทนการ patch + compile ใหม่ทุก request"""
+
+    def __init__(self, entry):
+        super().__init__(BytesIO(entry.data))
+        self._body_template = entry.body_template
+
+    def build_xml(self, context, jinja_env=None):
+        if jinja_env is not None:
+            return super().build_xml(context, jinja_env)
+        # เหมือน DocxTemplate.render_xml_part แต่ข้ามการ patch_xml + from_string
+        self.current_rendering_part = self.docx._part
+        dst_xml = self._body_template.render(context)
+        dst_xml = re.sub(r"\n<w:p([ >])", r"<w:p\1", dst_xml)
+        dst_xml = (
+            dst_xml.replace("{_{", "{{")
+            .replace("}_}", "}}")
+            .replace("{_%", "{%")
+            .replace("%_}", "%}")
+        )
+        return self.resolve_listing(dst_xml)
+
+
+class _FastZipWriter:
+    """PhysPkgWriter ที่เก็บรูปภาพแบบ ZIP_STORED (python-docx deflate ทุก part ซึ่งกินเวลาเกือบครึ่งของการ save)"""
+
+    def __init__(self, stream):
+        self._zipf = ZipFile(stream, "w", compression=ZIP_DEFLATED)
+
+    def write(self, pack_uri, blob):
+        name = pack_uri.membername
+        compress_type = ZIP_STORED if name.lower().endswith(_STORED_EXTENSIONS) else ZIP_DEFLATED
+        self._zipf.writestr(name, blob, compress_type=compress_type)
+
+    def close(self):
+        self._zipf.close()
+
+
+def to_bytes(doc):
+    """เหมือน DocxTemplate.save (OpcPackage.save) แต่เขียนด้วย _FastZipWriter และคืนเป็น bytes"""
+    package = doc.docx.part.package
+    for part in package.parts:
+        part.before_marshal()
+    stream = BytesIO()
+    writer = _FastZipWriter(stream)
+    PackageWriter._write_content_types_stream(writer, package.parts)
+    PackageWriter._write_pkg_rels(writer, package.rels)
+    PackageWriter._write_parts(writer, package.parts)
+    writer.close()
+    return stream.getvalue()
+
+
+def render_docx(path, context):
+    """render template ด้วย context แล้วคืนไฟล์ .docx เป็น bytes (thread-safe / ใช้ใน process pool ได้)"""
+    doc = CompiledDocxTemplate(get_template(path))
+    doc.render(context)
+    return to_bytes(doc)
+
+
+class ZipStream:
+    """
+    เขียน ZIP ลง buffer ที่ไม่ seek ได้ แล้วดึง bytes ที่เขียนเสร็จออกไปทีละช่วง (ใช้กับ StreamingResponse)
+    memory ที่ใช้ขึ้นกับขนาดไฟล์ที่กำลังเขียนเท่านั้น ไม่ใช่ขนาดของ ZIP ทั้งก้อน
+    """
+
+    def __init__(self):
+        self._chunks = []
+        # .docx เป็น ZIP อยู่แล้ว บีบอัดซ้ำไม่ได้อะไร
+        self._zipf = ZipFile(self, "w", compression=ZIP_STORED)
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def add(self, name, data):
+        self._zipf.writestr(name, data)
+        return self._drain()
+
+    def close(self):
+        self._zipf.close()
+        return self._drain()
+
+    def _drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
@@ -0,0 +1,533 @@
+# ข้อมูลฟอร์ม (Master Data + สรุปขั้นตอน) ใช้ร่วมกันระหว่าง main.py และ upload_data.py
+import re
+from collections import deque
+
+# ✅ 1. ฐานข้อมูลฟอร์มฉบับสมบูรณ์ (Master Data) – รักษาไว้สำหรับ extract URLs
+# รวมรหัส, ชื่อไทย, และลิงก์ไว้ในที่เดียว เพื่อง่ายต่อการจัดการ
+FORM_MASTER_DATA = [
+    {
+        "id": "RO.01",
+        "name": "คำร้องทั่วไป (General Request)",
+        "url": "https://regis.kmutt.ac.th/service/form/RO-01.pdf",
+        "keywords": ["คำร้องทั่วไป", "ro01", "ro.01", "general", "อื่นๆ", "เรื่องทั่วไป", "สทน.01"]
+    },
+    {
+        "id": "RO.03",
+        "name": "หนังสือรับรองของผู้ปกครอง",
+        "url": "https://regis.kmutt.ac.th/service/form/RO-03.pdf",
+        "keywords": ["ผู้ปกครอง", "ro03", "ro.03", "หนังสือรับรอง", "ยินยอม", "parent", "สทน.03"]
+    },
+    {
+        "id": "RO.04",
+        "name": "ใบมอบฉันทะ",
+        "url": "https://regis.kmutt.ac.th/service/form/RO-04.pdf",
+        "keywords": ["มอบฉันทะ", "ro04", "ro.04", "แทน", "คนอื่นรับแทน", "authorization", "สทน.04"]
+    },
+    {
+        "id": "RO.08",
+        "name": "คำร้องขอคืนเงินค่าลงทะเบียน",
+        "url": "https://regis.kmutt.ac.th/service/form/RO-08.pdf",
+        "keywords": ["คืนเงิน", "ro08", "ro.08", "refund", "ค่าลงทะเบียน", "จ่ายเกิน", "ขอคืนเงิน", "สทน.08"]
+    },
+    {
+        "id": "RO.11",
+        "name": "คำร้องขอเลื่อนรับพระราชทานปริญญาบัตร",
+        "url": "https://regis.kmutt.ac.th/service/form/RO-11.pdf",
+        "keywords": ["รับปริญญา", "ro11", "ro.11", "เลื่อนรับ", "ไม่รับปริญญา", "สทน.11"]
+    },
+    {
+        "id": "RO.12",
+        "name": "คำร้องขอลาพักการศึกษา",
+        "url": "https://regis.kmutt.ac.th/service/form/RO-12Updated.pdf",
+        "keywords": ["ลาพักการศึกษา", "ro12", "ro.12", "ดรอปเรียน", "drop", "พักการเรียน", "รักษาสถานภาพ", "สทน.12"]
+    },
+    {
+        "id": "RO.13",
+        "name": "คำร้องขอลาออก",
+        "url": "https://regis.kmutt.ac.th/service/form/RO-13Updated.pdf",
+        "keywords": ["ลาออก", "ro13", "ro.13", "resignation", "ออก", "quit", "สทน.13"]
+    },
+    {
+        "id": "RO.14",
+        "name": "คำร้องขอเปลี่ยนแปลงข้อมูลประวัติ",
+        "url": "https://regis.kmutt.ac.th/service/form/RO-14.pdf",
+        "keywords": ["เปลี่ยนชื่อ", "ro14", "ro.14", "เปลี่ยนนามสกุล", "แก้ประวัติ", "ที่อยู่ผิด", "คำนำหน้า", "สทน.14"]
+    },
+    {
+        "id": "RO.15",
+        "name": "คำร้องขอทำบัตรนักศึกษาใหม่",
+        "url": "https://regis.kmutt.ac.th/service/form/RO-15_160718.pdf",
+        "keywords": ["บัตรหาย", "ro15", "ro.15", "บัตรนักศึกษา", "ทำบัตรใหม่", "บัตรชำรุด", "สทน.15"]
+    },
+    {
+        "id": "RO.16",
+        "name": "คำร้องขอลาป่วย/ลากิจ",
+        "url": "https://regis.kmutt.ac.th/service/form/RO-16.pdf",
+        "keywords": ["ลาป่วย", "ro16", "ro.16", "ลากิจ", "ป่วย", "ใบรับรองแพทย์", "หยุดเรียน", "sick", "สทน.16"]
+    },
+    {
+        "id": "RO.18",
+        "name": "คำร้องลงทะเบียนต่ำกว่า/เกินกว่าหน่วยกิต",
+        "url": "https://regis.kmutt.ac.th/service/form/RO-18Updated.pdf",
+        "keywords": ["หน่วยกิตเกิน", "ro18", "ro.18", "หน่วยกิตต่ำ", "ลงทะเบียนเกิน", "ลงทะเบียนต่ำกว่า", "credits", "สทน.18"]
+    },
+    {
+        "id": "RO.19",
+        "name": "คำร้องลงทะเบียนวิชาสอบซ้อน",
+        "url": "https://regis.kmutt.ac.th/service/form/RO-19.pdf",
+        "keywords": ["สอบซ้อน", "ro19", "ro.19", "เวลาสอบชน", "exam conflict", "สทน.19"]
+    },
+    {
+        "id": "RO.20",
+        "name": "คำร้องลงทะเบียนวิชานอกหลักสูตร",
+        "url": "https://regis.kmutt.ac.th/service/form/RO-20.pdf",
+        "keywords": ["นอกหลักสูตร", "ro20", "ro.20", "วิชาเลือกเสรี", "free elective", "สทน.20"]
+    },
+    {
+        "id": "RO.21",
+        "name": "คำร้องลงทะเบียนเรียนแบบบุคคลภายนอก",
+        "url": "https://regis.kmutt.ac.th/service/form/RO-21.pdf",
+        "keywords": ["บุคคลภายนอก", "ro21", "ro.21", "visitor", "คนนอก", "สทน.21"]
+    },
+    {
+        "id": "RO.22",
+        "name": "คำร้องขอสมัครสอบโดยไม่ต้องเข้าเรียน / ผ่อนผัน",
+        "url": "https://regis.kmutt.ac.th/service/form/RO-22.pdf",
+        "keywords": ["ขาดเรียน", "ro22", "ro.22", "ผ่อนผัน", "ไม่ได้เข้าเรียน", "สมัครสอบ", "สทน.22"]
+    },
+    {
+        "id": "RO.23",
+        "name": "คำร้องขอเปลี่ยน/เทียบรายวิชา",
+        "url": "https://regis.kmutt.ac.th/service/form/RO-23.pdf",
+        "keywords": ["เทียบวิชา", "ro23", "ro.23", "เปลี่ยนวิชา", "transfer", "เทียบโอน", "สทน.23"]
+    },
+    {
+        "id": "RO.25",
+        "name": "ใบลงทะเบียนเรียน",
+        "url": "https://regis.kmutt.ac.th/service/form/RO-25.pdf",
+        "keywords": ["ใบลงทะเบียน", "ro25", "ro.25", "register", "regis", "สทน.25"]
+    },
+    {
+        "id": "RO.26",
+        "name": "ใบเพิ่ม-ลด-ถอน-เปลี่ยนกลุ่ม",
+        "url": "https://regis.kmutt.ac.th/service/form/RO-26Updated.pdf",
+        "keywords": ["เพิ่มวิชา", "ro26", "ro.26", "ถอนวิชา", "เปลี่ยนเซค", "เปลี่ยน sec", "add/drop", "ลดวิชา", "ถอน w", "ติด w", "สทน.26"]
+    },
+]
+
+# ✅ 2. สร้างตัวแปรช่วยค้นหา (Lookup & Prompt Generation) – ลบ FORM_LIST_TEXT เพราะไม่ใช้ rule-based แล้ว
+FORM_DB = {}
+for item in FORM_MASTER_DATA:
+    # สร้าง Dictionary สำหรับค้นหา URL เร็วๆ
+    FORM_DB[item["id"]] = item["url"] # ค้นด้วยรหัส (เช่น "RO.01")
+    FORM_DB[item["name"]] = item["url"] # ค้นด้วยชื่อ (เช่น "คำร้องทั่วไป")
+   
+    # เพิ่มรูปแบบย่อยๆ เผื่อ AI หรือ User พิมพ์ผิด
+    FORM_DB[item["id"].replace(".", "")] = item["url"] # "RO01"
+    FORM_DB[item["id"].replace(".", ". ")] = item["url"] # "RO. 01"
+   
+    if "keywords" in item:
+        for kw in item["keywords"]:
+            FORM_DB[kw] = item["url"]
+
+# เพิ่ม: ข้อมูลสรุปทั้งหมดจากตัวอย่างของคุณ (paste ข้อมูลทั้งหมดที่นี่เป็น string)
+SUMMARY_TEXT = """
+ตัวอย่างคำตอบที่ดี:
+"2.1 คำร้องขอลาพักการศึกษา (สทน. 12 / RO.12)
+• ชื่อกรณี: การขอลาพักการศึกษาเนื่องจากเหตุจำเป็นต่างๆ เช่น ไม่มีรายวิชาให้ลงทะเบียน, ไม่สามารถศึกษาต่อในภาคนั้นได้, หรือเพื่อรักษาสภาพนักศึกษา
+• แบบฟอร์ม/ระบบที่ใช้: คำร้องออนไลน์ในระบบ New ACIS
+• ช่องทาง: ยื่นผ่านระบบ New ACIS เท่านั้น โดยเลือกเมนู > คำร้องผ่านเว็บ > ยื่นคำร้องการลาต่างๆ > ใบคำร้องขอลาพักการศึกษา
+• ขั้นตอน/เงื่อนไข:
+1. ยื่นคำร้อง: Login เข้าระบบ New ACIS, เลือกภาคการศึกษาและปีการศึกษาที่ต้องการลาพักให้ถูกต้อง และระบุเหตุผลในการขอลาพักให้ชัดเจน
+2. ติดตามผล: สามารถติดตามสถานะการอนุมัติของคำร้องได้ผ่านเมนู > คำร้องผ่านเว็บ > ติดตามคำร้อง
+3. ยืนยันและชำระเงิน: เมื่อคำร้องได้รับการอนุมัติแล้ว ในหน้าจอติดตามคำร้องจะปรากฏจำนวนเงินที่ต้องชำระ นักศึกษาสามารถสั่งพิมพ์ใบแจ้งชำระเงินจากหน้านี้ได้โดยตรง หรือเข้าไปที่เมนู > รายการลงทะเบียนรายวิชา > ชำระเงินค่าลงทะเบียน/ค่าลาพัก
+4. การชำระเงิน: นำใบแจ้งชำระเงินไปชำระที่ ธนาคารกรุงเทพ ภายในเวลาที่ระบุ การลาพักการศึกษาจึงจะถือว่าสมบูรณ์
+• การอนุมัติ: คำร้องจะถูกส่งเพื่อพิจารณาอนุมัติตามลำดับขั้น ได้แก่ อาจารย์ที่ปรึกษา, หัวหน้าภาควิชา, และ คณบดี
+• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-12Updated.pdf
+• หมายเหตุ: อัตราค่าธรรมเนียมการลาพักการศึกษา (รักษาสภาพ)
+o ระดับปริญญาตรี: 800 บาท/ภาคการศึกษา
+o ระดับบัณฑิตศึกษา: 1,600 บาท/ภาคการศึกษา
+o กรณีเป็นการลาพักในภาคการศึกษาแรก จะมีค่าประกันอุบัติเหตุเพิ่มอีก 200 บาท
+o มีค่าปรับกรณีดำเนินการล่าช้า 50 บาท/วัน (นับรวมวันหยุด)
+--------------------------------------------------------------------------------
+2.2 คำร้องขอถอนรายวิชา (W) (ส่วนหนึ่งของ สทน. 26 / RO.26)
+• ชื่อกรณี: การขอถอนรายวิชาเรียน (Withdrawal) หลังจากพ้นกำหนดช่วงเวลาเพิ่ม-ลดรายวิชาตามปฏิทินการศึกษาแล้ว
+• แบบฟอร์ม/ระบบที่ใช้: คำร้องออนไลน์ในระบบ New ACIS
+• ช่องทาง: ยื่นผ่านระบบ New ACIS
+• ขั้นตอน/เงื่อนไข: นักศึกษาสามารถยื่นคำร้องผ่านระบบ New ACIS โดยต้องเข้าสู่ระบบ, เลือกรายวิชาที่ต้องการถอน (W), และระบุเหตุผลประกอบการพิจารณาอย่างชัดเจน จากนั้นคำร้องจะถูกส่งเข้าระบบเพื่อรอการอนุมัติตามลำดับขั้น
+• การอนุมัติ: ต้องผ่านการอนุมัติจากอาจารย์ที่ปรึกษาและหน่วยงานที่เกี่ยวข้องตามลำดับขั้นที่กำหนดไว้ในระบบ
+• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-26Updated.pdf
+--------------------------------------------------------------------------------
+2.3 คำร้องขอลงทะเบียนต่ำกว่า/เกินกว่าหน่วยกิตที่กำหนด (สทน. 18 / RO.18)
+• ชื่อกรณี: การขอลงทะเบียนเรียนด้วยจำนวนหน่วยกิตที่น้อยกว่า หรือมากกว่าเกณฑ์มาตรฐานที่หลักสูตรกำหนดในแต่ละภาคการศึกษา
+• แบบฟอร์ม/ระบบที่ใช้: มีคำร้องออนไลน์ในระบบ New ACIS ควบคู่ไปกับแบบฟอร์มเอกสาร
+• ช่องทาง: สามารถยื่นผ่านระบบ New ACIS ซึ่งเป็นช่องทางที่แนะนำ หรือใช้แบบฟอร์มเอกสาร (RO-18) โดยนักศึกษาควรตรวจสอบช่องทางที่ภาควิชากำหนด
+• ขั้นตอน/เงื่อนไข: นักศึกษาต้องระบุเหตุผลและความจำเป็นในการขอลงทะเบียนเรียนนอกเกณฑ์ที่กำหนด
+• การอนุมัติ: ต้องได้รับการอนุมัติจากอาจารย์ที่ปรึกษา และหัวหน้าภาควิชาตามลำดับ
+• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-18Updated.pdf
+--------------------------------------------------------------------------------
+3. การยื่นคำร้องแบบฟอร์มเอกสาร (Paper/PDF)
+แม้ว่าระบบออนไลน์จะเข้ามามีบทบาทสำคัญ แต่คำร้องบางประเภทยังคงจำเป็นต้องใช้รูปแบบเอกสาร (Paper/PDF) เนื่องจากเป็นกรณีที่มีความเฉพาะเจาะจงสูง ต้องการเอกสารหลักฐานประกอบจำนวนมาก หรือต้องอาศัยการพิจารณาและลงนามจากหลายฝ่ายอย่างเป็นทางการ การยื่นคำร้องประเภทนี้ นักศึกษาจำเป็นต้องดาวน์โหลดแบบฟอร์มจากเว็บไซต์สำนักงานทะเบียนนักศึกษา กรอกข้อมูลให้ครบถ้วนสมบูรณ์ และยื่นต่อหน่วยงานที่รับผิดชอบตามขั้นตอน
+3.1 คำร้องทั่วไป (สทน. 01 / RO.01)
+• ชื่อกรณี: ใช้สำหรับยื่นคำร้องในเรื่องอื่นๆ ที่ไม่มีแบบฟอร์มเฉพาะเจาะจงให้ใช้งาน
+• แบบฟอร์ม/ระบบที่ใช้: สทน. 01 / RO.01
+• ช่องทาง: ยื่นเอกสารที่ภาควิชา/หน่วยงานที่เกี่ยวข้องโดยตรง
+• ขั้นตอน/เงื่อนไข: นักศึกษาต้องกรอกรายละเอียดความประสงค์ที่ต้องการยื่นเรื่องให้ชัดเจนและครบถ้วนที่สุด
+• การอนุมัติ: ต้องผ่านความเห็นจาก อาจารย์ที่ปรึกษา, หัวหน้าภาควิชา, และ คณบดี ตามลำดับที่ระบุในแบบฟอร์ม
+• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-01.pdf
+--------------------------------------------------------------------------------
+3.2 หนังสือรับรองของผู้ปกครอง (สทน. 03 / RO.03)
+• ชื่อกรณี: เป็นเอกสารประกอบที่ใช้ในกรณีที่ต้องให้ผู้ปกครองรับรองเรื่องต่างๆ เช่น การขอลาออกจากการเป็นนักศึกษา
+• แบบฟอร์ม/ระบบที่ใช้: สทน. 03 / RO.03
+• ช่องทาง: ยื่นเอกสารนี้แนบประกอบไปกับคำร้องหลักที่เกี่ยวข้อง
+• ขั้นตอน/เงื่อนไข: ผู้ปกครองเป็นผู้กรอกข้อมูลและลงนามรับรอง
+• การอนุมัติ: เอกสารนี้ใช้เพื่อประกอบการพิจารณาคำร้องอื่นๆ
+• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-03.pdf
+--------------------------------------------------------------------------------
+3.3 ใบมอบฉันทะ (สทน. 04 / RO.04)
+• ชื่อกรณี: การมอบอำนาจให้บุคคลอื่นดำเนินการหรือรับเอกสารทางการศึกษาที่สำคัญแทนตนเอง
+• แบบฟอร์ม/ระบบที่ใช้: สทน. 04 / RO.04
+• ช่องทาง: ยื่นเอกสาร ณ หน่วยงานที่ต้องการติดต่อ (เช่น สำนักงานทะเบียนนักศึกษา)
+• ขั้นตอน/เงื่อนไข: กรอกรายละเอียดของผู้มอบฉันทะและผู้รับมอบฉันทะให้ครบถ้วน
+• การอนุมัติ: เจ้าหน้าที่ ณ หน่วยงานที่รับเรื่องจะทำการตรวจสอบเอกสาร
+• หมายเหตุ: ต้องแนบสำเนาบัตรประจำตัวประชาชนของผู้มอบฉันทะและผู้รับมอบฉันทะ พร้อมลงนามรับรองสำเนาถูกต้องกำกับมาด้วยทุกครั้ง
+• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-04.pdf
+--------------------------------------------------------------------------------
+3.4 คำร้องขอคืนเงินค่าลงทะเบียน (สทน. 08 / RO.08)
+• ชื่อกรณี: การขอเงินค่าหน่วยกิตหรือค่าธรรมเนียมคืน ในกรณีที่มีการลดรายวิชาตามกำหนดเวลา หรือกรณีที่รายวิชาที่ลงทะเบียนไว้ถูกยกเลิก
+• แบบฟอร์ม/ระบบที่ใช้: สทน. 08 / RO.08
+• ช่องทาง: ยื่นเอกสารที่สำนักงานทะเบียนนักศึกษา
+• การอนุมัติ: ต้องผ่านความเห็นจากอาจารย์ที่ปรึกษา และหัวหน้าภาควิชา
+• หมายเหตุ: ต้องแนบเอกสารประกอบหลายรายการ ได้แก่ 1) แบบ กค. 18 (ใบแจ้งความจำนงโอนเงิน), 2) ใบเสร็จรับเงินฉบับจริง, 3) รายงานรายวิชาที่จะขอเงินคืน, 4) สำเนาบัตรนักศึกษาและบัตรประชาชน, 5) สำเนาสมุดบัญชีธนาคารหน้าแรก
+• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-08.pdf
+--------------------------------------------------------------------------------
+3.5 คำร้องขอเลื่อนรับพระราชทานปริญญาบัตร (สทน. 11 / RO.11)
+• ชื่อกรณี: สำหรับบัณฑิตที่สำเร็จการศึกษาแล้ว แต่ไม่สามารถเข้ารับพระราชทานปริญญาบัตรในปีนั้นได้ และมีความประสงค์จะขอเลื่อนไปเข้ารับในปีถัดไป
+• แบบฟอร์ม/ระบบที่ใช้: สทน. 11 / RO.11
+• ช่องทาง: ยื่นเอกสารที่สำนักงานทะเบียนนักศึกษา
+• ขั้นตอน/เงื่อนไข: ต้องยื่นคำร้องก่อนกำหนดวันซ้อมรับปริญญาบัตรประมาณ 1 สัปดาห์ และสามารถขอเลื่อนได้ไม่เกิน 3 ปีการศึกษานับจากปีที่สำเร็จการศึกษา
+• การอนุมัติ: เสนอต่อรองอธิการบดีฝ่ายพัฒนานักศึกษาเพื่อพิจารณาอนุมัติ
+• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-11.pdf
+--------------------------------------------------------------------------------
+3.6 คำร้องขอลาออก (สทน. 13 / RO.13)
+• ชื่อกรณี: การยื่นเรื่องเพื่อขอลาออกจากการเป็นนักศึกษาของมหาวิทยาลัย
+• แบบฟอร์ม/ระบบที่ใช้: สทน. 13 / RO.13
+• ช่องทาง: ยื่นเอกสารที่ภาควิชาที่สังกัด
+• ขั้นตอน/เงื่อนไข: นักศึกษาต้องตรวจสอบและจัดการภาระหนี้สินทั้งหมดที่มีกับทางมหาวิทยาลัยให้เรียบร้อยก่อนยื่นคำร้อง
+• การอนุมัติ: ต้องผ่านความเห็นจาก อาจารย์ที่ปรึกษา, หัวหน้าภาควิชา, และ คณบดี
+• หมายเหตุ: ต้องแนบ "หนังสือรับรองของผู้ปกครอง (สทน. 03)" มาพร้อมกับคำร้องขอลาออกด้วย การแนบ สทน. 03 เป็นการยืนยันว่าผู้ปกครองรับทราบการตัดสินใจที่สำคัญนี้ ซึ่งเป็นส่วนหนึ่งของกระบวนการตรวจสอบของมหาวิทยาลัย
+• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-13Updated.pdf
+--------------------------------------------------------------------------------
+3.7 คำร้องขอเปลี่ยนแปลงข้อมูลในทะเบียนประวัติ (สทน. 14 / RO.14)
+• ชื่อกรณี: การขอแก้ไขข้อมูลส่วนตัวในทะเบียนประวัตินักศึกษา เช่น การเปลี่ยนชื่อ-นามสกุล, คำนำหน้าชื่อ, หรือที่อยู่ปัจจุบัน
+• แบบฟอร์ม/ระบบที่ใช้: สทน. 14 / RO.14
+• ช่องทาง: ยื่นเอกสารที่สำนักงานทะเบียนนักศึกษา
+• ขั้นตอน/เงื่อนไข: กรอกข้อมูลเดิมและข้อมูลใหม่ที่ต้องการเปลี่ยนแปลงให้ถูกต้อง
+• การอนุมัติ: เจ้าหน้าที่สำนักงานทะเบียนนักศึกษาเป็นผู้ตรวจสอบและดำเนินการแก้ไขในระบบ
+• หมายเหตุ: ต้องแนบสำเนาเอกสารทางราชการที่ยืนยันการเปลี่ยนแปลง (เช่น ใบเปลี่ยนชื่อ-สกุล, ทะเบียนบ้าน) พร้อมลงนามรับรองสำเนาถูกต้อง
+• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-14.pdf
+--------------------------------------------------------------------------------
+3.8 คำร้องขอทำบัตรนักศึกษา (สทน. 15 / RO.15)
+• ชื่อกรณี: การขอทำบัตรนักศึกษาใหม่ (สำหรับนักศึกษาใหม่) หรือทำบัตรทดแทน (กรณีบัตรหาย, ชำรุด, หรือหมดอายุ)
+• แบบฟอร์ม/ระบบที่ใช้: สทน. 15 / RO.15
+• ช่องทาง: แบบฟอร์มมี 2 ส่วน โดยส่วนที่ 1 นำไปยื่นที่ธนาคารกรุงเทพสาขาที่กำหนด และส่วนที่ 2 สำหรับเก็บไว้ที่สำนักงานทะเบียนนักศึกษา
+• ขั้นตอน/เงื่อนไข: นักศึกษาต้องนำแบบฟอร์มมายื่นที่สำนักงานทะเบียนนักศึกษาเพื่อรับการประทับตราและลงนามจากเจ้าหน้าที่ในส่วนที่ 1 ก่อน จึงจะสามารถนำไปยื่นที่ธนาคารได้
+• การอนุมัติ: ดำเนินการโดยเจ้าหน้าที่ทะเบียนและเจ้าหน้าที่ธนาคาร
+• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-15_160718.pdf
+--------------------------------------------------------------------------------
+3.9 คำร้องขอลาป่วย/ลากิจ (สทน. 16 / RO.16)
+• ชื่อกรณี: การขอลาเรียนเนื่องจากมีอาการป่วย หรือมีกิจธุระที่จำเป็นและไม่สามารถเข้าชั้นเรียนได้
+• แบบฟอร์ม/ระบบที่ใช้: สทน. 16 / RO.16
+• ช่องทาง: ยื่นเอกสารต่ออาจารย์ผู้สอนรายวิชาหรือภาควิชาที่สังกัด
+• การอนุมัติ: ต้องมีคำรับรองจากผู้ปกครอง และผ่านความเห็นจาก อาจารย์ที่ปรึกษา, อาจารย์ผู้สอน, และหัวหน้าภาควิชา ตามลำดับ
+• หมายเหตุ: กรณีลาป่วย ควรแนบใบรับรองแพทย์เพื่อประกอบการพิจารณาด้วย
+• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-16.pdf
+--------------------------------------------------------------------------------
+3.10 คำร้องขอลงทะเบียนในรายวิชาที่มีเวลาสอบซ้อน (สทน. 19 / RO.19)
+• ชื่อกรณี: การขอลงทะเบียนเรียนใน 2 รายวิชา ซึ่งมีตารางสอบปลายภาคตรงกันหรือคาบเกี่ยวกัน
+• แบบฟอร์ม/ระบบที่ใช้: สทน. 19 / RO.19
+• ช่องทาง: ยื่นเอกสารที่ภาควิชา
+• ขั้นตอน/เงื่อนไข: สามารถยื่นขอได้เฉพาะนักศึกษาชั้นปีสุดท้ายเท่านั้น และสามารถขอสอบซ้อนได้ไม่เกิน 2 รายวิชา
+• การอนุมัติ: ต้องได้รับความเห็นชอบจากอาจารย์ที่ปรึกษาและหัวหน้าภาควิชา
+• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-19.pdf
+--------------------------------------------------------------------------------
+3.11 คำร้องขอลงทะเบียนรายวิชานอกหลักสูตร (สทน. 20 / RO.20)
+• ชื่อกรณี: การขอลงทะเบียนเรียนในรายวิชาที่ไม่ได้ถูกกำหนดไว้ในโครงสร้างหลักสูตรของตนเอง
+• แบบฟอร์ม/ระบบที่ใช้: สทน. 20 / RO.20
+• ช่องทาง: ยื่นเอกสารที่ภาควิชา
+• ขั้นตอน/เงื่อนไข: สามารถเลือกลงทะเบียนได้ 3 รูปแบบ คือ 1) คิดเกรด A-F และนำไปคำนวณ GPA, 2) คิดเกรด S/U (ผ่าน/ไม่ผ่าน), 3) ลงทะเบียนแบบ Audit (เข้าฟังการบรรยายแต่ไม่นับหน่วยกิตและไม่คิดเกรด, ยกเว้นรายวิชาฝึกงานอุตสาหกรรม และภาษาต่างประเทศ)
+• การอนุมัติ: ต้องได้รับความเห็นชอบจากอาจารย์ที่ปรึกษาและหัวหน้าภาควิชา
+• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-20.pdf
+--------------------------------------------------------------------------------
+3.12 คำร้องขอลงทะเบียนเรียนแบบบุคคลภายนอก (สทน. 21 / RO.21)
+• ชื่อกรณี: สำหรับบุคคลทั่วไปที่ไม่ได้มีสถานะเป็นนักศึกษาของ มจธ. แต่มีความประสงค์จะลงทะเบียนเรียนในบางรายวิชาที่มหาวิทยาลัยเปิดสอน
+• แบบฟอร์ม/ระบบที่ใช้: สทน. 21 / RO.21
+• ช่องทาง: ยื่นเอกสารที่ภาควิชาเจ้าของรายวิชาที่ต้องการลงทะเบียน
+• การอนุมัติ: ต้องได้รับความเห็นชอบจากหัวหน้าภาควิชาเจ้าของรายวิชานั้นๆ
+• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-21.pdf
+--------------------------------------------------------------------------------
+3.13 คำร้องขอสมัครสอบโดยไม่ต้องเข้าเรียน (สทน. 22 / RO.22)
+• ชื่อกรณี: การขอสิทธิ์เข้าสอบปลายภาคในรายวิชาที่เคยลงทะเบียนเรียนมาแล้วแต่ได้ผลการเรียนต่ำกว่า C หรือขาดสอบด้วยเหตุสุดวิสัย โดยไม่ต้องกลับเข้าไปเรียนใหม่
+• แบบฟอร์ม/ระบบที่ใช้: สทน. 22 / RO.22
+• ช่องทาง: ยื่นเอกสารที่ภาควิชา
+• ขั้นตอน/เงื่อนไข: สำหรับนักศึกษาชั้นปีสุดท้ายเท่านั้น, ต้องเป็นรายวิชาที่ไม่มีภาคปฏิบัติ, และเคยมีเวลาเรียนในวิชานั้นไม่ต่ำกว่า 80%
+• การอนุมัติ: ต้องได้รับความเห็นชอบจากอาจารย์ที่ปรึกษา, อาจารย์ผู้สอน และหัวหน้าภาควิชา
+• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-22.pdf
+--------------------------------------------------------------------------------
+3.14 คำร้องขอเปลี่ยน/เทียบรายวิชาเรียน (สทน. 23 / RO.23)
+• ชื่อกรณี: การขอเทียบโอนหน่วยกิตจากรายวิชาที่เคยเรียนมาจากสถาบันอื่น หรือการขอเปลี่ยนไปเรียนรายวิชาอื่นที่มีเนื้อหาเทียบเท่ากันภายในมหาวิทยาลัย
+• แบบฟอร์ม/ระบบที่ใช้: สทน. 23 / RO.23
+• ช่องทาง: ยื่นเอกสารที่ภาควิชา
+• การอนุมัติ: ต้องผ่านความเห็นชอบจากอาจารย์ที่ปรึกษา, หัวหน้าภาควิชา และคณบดี
+• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-23.pdf
+"""
+# ถ้าข้อมูลยาวเกิน ให้ตัดเป็นหลาย string แล้ว concat หรือ paste ให้ครบ
+
+
+# ================= FORM INTENT FAST PATH =================
+# จับคู่ข้อความกับ key ทั้งหมดใน FORM_DB ด้วย Aho–Corasick (สร้างครั้งเดียวตอน import)
+# ถ้าคำถามระบุฟอร์มเพียงฟอร์มเดียว ตอบจาก "การ์ดฟอร์ม" ที่เตรียมไว้ได้ทันทีโดยไม่ต้องค้น Qdrant/เรียก Groq
+
+FORM_BY_ID = {item["id"]: item for item in FORM_MASTER_DATA}
+FORM_ID_BY_URL = {item["url"]: item["id"] for item in FORM_MASTER_DATA}
+
+
+def form_id_variants(form_id):
+    """รูปแบบที่นักศึกษาใช้เรียกรหัสฟอร์ม เช่น RO.16 → ro16, ro 16, ro-16, สทน.16, สทน. 16"""
+    number = form_id.split(".")[-1]
+    variants = set()
+    for prefix in ("ro", "สทน"):
+        for sep in ("", ".", ". ", " ", "-", "_"):
+            variants.add(f"{prefix}{sep}{number}")
+    return variants
+
+
+class FormMatcher:
+    """Aho–Corasick automaton: หา pattern ทั้งหมดที่ปรากฏในข้อความได้ในรอบเดียว O(len(text))"""
+
+    def __init__(self, patterns):
+        # patterns: {pattern: (form_id, strong)}
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for pattern, value in patterns.items():
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append((pattern, value))
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text):
+        """คืน list ของ (pattern, value) ที่เจอในข้อความ (ข้าม match ที่อยู่กลางคำภาษาอังกฤษ/ตัวเลข)"""
+        matches = []
+        node = 0
+        for end, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for pattern, value in self._out[node]:
+                start = end - len(pattern) + 1
+                if _is_boundary(text, start - 1, pattern[0]) and _is_boundary(text, end + 1, pattern[-1]):
+                    matches.append((pattern, value))
+        return matches
+
+
+def _is_boundary(text, index, edge_char):
+    # ภาษาไทยไม่มีช่องว่างระหว่างคำ จึงเช็คขอบคำเฉพาะ pattern ที่ขึ้นต้น/ลงท้ายด้วยอักษรอังกฤษหรือตัวเลข
+    if index < 0 or index >= len(text) or not (edge_char.isascii() and edge_char.isalnum()):
+        return True
+    return not (text[index].isascii() and text[index].isalnum())
+
+
+def _build_form_patterns():
+    patterns = {}
+    # keyword ทั่วไป (weak) — ใช้บอกว่าคำถามพูดถึงฟอร์มนี้ แต่ไม่พอจะตอบทันที
+    for key, url in FORM_DB.items():
+        patterns[key.lower()] = (FORM_ID_BY_URL[url], False)
+    # รหัส/ชื่อฟอร์ม (strong) — ถือว่าผู้ใช้ "ระบุ" ฟอร์มนี้แล้ว
+    for item in FORM_MASTER_DATA:
+        strong = form_id_variants(item["id"]) | {item["id"].lower(), item["name"].lower()}
+        for key in strong:
+            patterns[key] = (item["id"], True)
+    return patterns
+
+
+FORM_MATCHER = FormMatcher(_build_form_patterns())
+
+
+def match_forms(text):
+    """
+    คืน (strong_ids, weak_ids): ฟอร์มที่ถูกระบุด้วยรหัส/ชื่อ และฟอร์มที่ถูกพูดถึงผ่าน keyword
+    """
+    strong_ids, weak_ids = set(), set()
+    for _, (form_id, strong) in FORM_MATCHER.find(text.lower()):
+        (strong_ids if strong else weak_ids).add(form_id)
+    return strong_ids, weak_ids
+
+
+def form_topic(text):
+    """ฟอร์มทั้งหมดที่ข้อความพูดถึง (รหัส/ชื่อ/keyword) ใช้แยกคำถามที่คล้ายกันแต่คนละฟอร์ม"""
+    strong_ids, weak_ids = match_forms(text)
+    return frozenset(strong_ids | weak_ids)
+
+
+def detect_single_form(text):
+    """
+    ถ้าคำถามระบุฟอร์มชัดเจนเพียงฟอร์มเดียว (และไม่มี keyword ของฟอร์มอื่นปน) คืน form_id
+    ถ้ากำกวม (ไม่เจอเลย หรือเจอหลายฟอร์ม) คืน None → ให้ไปใช้ RAG + LLM ตามปกติ
+    """
+    strong_ids, weak_ids = match_forms(text)
+    if len(strong_ids) != 1 or not weak_ids <= strong_ids:
+        return None
+    return next(iter(strong_ids))
+
+
+_SUMMARY_HEADER_RE = re.compile(r"^\"?\d+\.\d+\s+(.+\(.*?RO\.(\d+)\))\s*$")
+_SUMMARY_FIELD_RE = re.compile(r"^•\s*([^:]+):\s*(.*)$")
+_CARD_FIELDS = ["ชื่อกรณี", "แบบฟอร์ม/ระบบที่ใช้", "ช่องทาง", "ขั้นตอน/เงื่อนไข", "การอนุมัติ", "หมายเหตุ"]
+
+
+_SECTION_START_RE = re.compile(r"^\"?\d+\.\d+\s")
+
+
+def split_summary_sections(summary_text):
+    """
+    แยก SUMMARY_TEXT เป็นก้อนข้อความตามหัวข้อย่อย (เช่น "2.1 คำร้อง...") และเส้นคั่น -----
+    ให้ upload_data.py ทำ chunk ละหัวข้อ (ข้อมูลของฟอร์มเดียวกันไม่ถูกตัดแยก chunk)
+    """
+    sections, current = [], []
+    for line in summary_text.splitlines():
+        stripped = line.strip()
+        is_separator = stripped.startswith("-----")
+        if is_separator or _SECTION_START_RE.match(stripped):
+            if any(part.strip() for part in current):
+                sections.append("\n".join(current).strip())
+            current = [] if is_separator else [line]
+            continue
+        current.append(line)
+    if any(part.strip() for part in current):
+        sections.append("\n".join(current).strip())
+    return sections
+
+
+def parse_summary_sections(summary_text):
+    """
+    แยก SUMMARY_TEXT เป็น {form_id: [{"title": ..., field: value}, ...]}
+    ฟอร์มที่มีหลายหัวข้อ (เช่น กรณีต่างๆ ของฟอร์มเดียวกัน) ได้ครบทุก section ตามลำดับที่เจอ
+    """
+    sections = {}
+    current, name = None, None
+    for raw_line in summary_text.splitlines():
+        line = raw_line.strip()
+        header = _SUMMARY_HEADER_RE.match(line)
+        if header:
+            current = {"title": header.group(1)}
+            sections.setdefault(f"RO.{header.group(2)}", []).append(current)
+            continue
+        if current is None:
+            continue
+        if line.startswith("-----"):
+            current = None
+            continue
+        field = _SUMMARY_FIELD_RE.match(line)
+        if field:
+            name = field.group(1).strip()
+            current[name] = field.group(2).strip()
+        elif line and name in current:
+            # บรรทัดต่อของ field ก่อนหน้า (ขั้นตอนแบบมีเลขข้อ, รายการ "o ..." ใต้หมายเหตุ)
+            current[name] = f"{current[name]}\n{line}".strip()
+    return sections
+
+
+def build_form_card(item, sections):
+    """
+    การ์ดตอบกลับแบบสำเร็จรูปของฟอร์มหนึ่งฟอร์ม (รูปแบบเดียวกับตัวอย่างใน SYSTEM_PROMPT)
+    ฟอร์มที่มีหลาย section แสดงทุก section ต่อกัน แล้วปิดด้วยลิงก์ดาวน์โหลดครั้งเดียว
+    """
+    blocks = []
+    for section in sections or [{}]:
+        lines = [section.get("title") or f"{item['name']} ({item['id']})"]
+        for field in _CARD_FIELDS:
+            if section.get(field):
+                first, *rest = section[field].split("\n")
+                lines.append(f" - {field}: {first}".rstrip())
+                lines.extend(f"   {line}" for line in rest)
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks) + f"\n - ดาวน์โหลดแบบฟอร์ม: {item['url']}"
+
+
+_SUMMARY_SECTIONS = parse_summary_sections(SUMMARY_TEXT)
+FORM_CARDS = {
+    item["id"]: build_form_card(item, _SUMMARY_SECTIONS.get(item["id"]))
+    for item in FORM_MASTER_DATA
+}
+# ฟอร์มที่ SUMMARY_TEXT สรุปไว้แค่บางกรณี (หัวข้อ "ส่วนหนึ่งของ สทน. ...") เช่น RO.26 มีแต่การถอน W
+# การ์ดตอบคำถามเรื่องเพิ่ม/ลด/เปลี่ยนกลุ่มไม่ได้ จึงไม่ใช้ fast path ให้ไป RAG + LLM แทน
+PARTIAL_FORMS = frozenset(
+    form_id for form_id, sections in _SUMMARY_SECTIONS.items()
+    if all("ส่วนหนึ่งของ" in section["title"] for section in sections)
+)
+
+
+def form_fast_answer(text):
+    """คืน {reply, sources} จากการ์ดฟอร์ม ถ้าคำถามระบุฟอร์มเดียวชัดเจนและการ์ดครอบคลุมทั้งฟอร์ม ไม่งั้นคืน None"""
+    form_id = detect_single_form(text)
+    if form_id is None or form_id in PARTIAL_FORMS:
+        return None
+    item = FORM_BY_ID[form_id]
+    return {
+        "reply": FORM_CARDS[form_id],
+        "sources": [{"doc": f"{item['id']} {item['name']}", "page": 1, "url": item["url"]}],
+    }
+
+
+# ================= SOURCE ATTRIBUTION =================
+# upload_data.py เรียก resolve_source ตอน ingest แล้วเก็บผลใน payload ของแต่ละ chunk
+# main.py อ่าน payload ตรงๆ และเรียกซ้ำเฉพาะ point เก่าที่ ingest ก่อนมี field เหล่านี้
+
+ATTRIBUTION_FIELDS = ("form_id", "form_name", "form_url", "display_name")
+_FORM_ORDER = {item["id"]: index for index, item in enumerate(FORM_MASTER_DATA)}
+_FORM_ID_RE = re.compile("|".join(re.escape(form_id) for form_id in sorted(FORM_BY_ID, key=len, reverse=True)))
+_URL_RE = re.compile(r"(https?://[^\s\)]+)")
+
+
+def resolve_source(file_path, text):
+    """
+    หาฟอร์มที่ chunk อ้างถึง (URL ของไฟล์ตรงกับฟอร์ม หรือมีรหัสฟอร์มในเนื้อหา)
+    ถ้าเจอหลายฟอร์มใช้ฟอร์มที่มาก่อนใน FORM_MASTER_DATA ถ้าไม่เจอใช้ URL แรกในเนื้อหาแทน
+    """
+    candidates = set(_FORM_ID_RE.findall(text))
+    if file_path in FORM_ID_BY_URL:
+        candidates.add(FORM_ID_BY_URL[file_path])
+    if candidates:
+        item = FORM_BY_ID[min(candidates, key=_FORM_ORDER.get)]
+        return {
+            "form_id": item["id"],
+            "form_name": item["name"],
+            "form_url": item["url"],
+            "display_name": f"{item['id']} {item['name']}",
+        }
+    found = _URL_RE.search(text)
+    return {
+        "form_id": None,
+        "form_name": None,
+        "form_url": found.group(1) if found else None,
+        "display_name": file_path.split("/")[-1],
+    }
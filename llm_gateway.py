@@ -0,0 +1,372 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import groq
+from groq import Groq, AsyncGroq
+
+import metrics
+from context_builder import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# error ที่ลองใหม่ได้: 429 (rate limit), 5xx, timeout, ต่อไม่ติด
+RETRYABLE_ERRORS = (groq.RateLimitError, groq.InternalServerError, groq.APIConnectionError)
+
+
+class LLMOverloaded(Exception):
+    """คิวเต็ม/quota หมด ให้ client ลองใหม่หลัง retry_after วินาที (main.py แปลงเป็น 503 + Retry-After)"""
+
+    def __init__(self, retry_after, reason):
+        super().__init__(reason)
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class TokenBucket:
+    """
+    Token bucket แบบจองล่วงหน้า: reserve(n) คืนเวลาที่ต้องรอจนกว่าจะมี n token (ติดลบได้ = ต่อคิว)
+    ใช้ร่วมกันได้ทั้ง thread และ asyncio เพราะไม่ได้ sleep เอง
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount, max_wait):
+        """จอง token แล้วคืนเวลาที่ต้องรอ หรือ None (ไม่จอง) ถ้าต้องรอเกิน max_wait"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            amount = min(amount, self.capacity)
+            wait_seconds = max(0.0, (amount - self._tokens) / self.rate)
+            if wait_seconds > max_wait:
+                return None
+            self._tokens -= amount
+            return wait_seconds
+
+    def wait_time(self, amount):
+        with self._lock:
+            tokens = min(self.capacity, self._tokens + (time.monotonic() - self._updated) * self.rate)
+            return max(0.0, (min(amount, self.capacity) - tokens) / self.rate)
+
+
+class LLMGateway:
+    """
+    ตัวกลางเรียก Groq chat completions ทั้ง sync (complete) และ async (acomplete, stream)
+    - Admission control: รับงานค้าง (รอ quota + กำลังเรียก) ได้ไม่เกิน max_pending เกินแล้ว LLMOverloaded ทันที
+    - Token bucket ตาม quota ของ Groq (requests/min และ tokens/min) ถ้าต้องรอนานเกิน max_queue_wait ก็ LLMOverloaded
+    - Timeout ต่อครั้ง + retry แบบ exponential backoff (+jitter) เมื่อเจอ 429/5xx/timeout
+    - ถ้า model หลักล้มเหลวครบทุก retry และตั้ง fallback_model ไว้ จะลอง model สำรองต่อ
+      (ทุก retry / fallback จอง quota ใหม่ ถ้าต้องรอเกิน max_queue_wait ก็ LLMOverloaded)
+    - Hedging (non-stream เท่านั้น): ถ้าครั้งแรกยังไม่ตอบภายใน hedge_after_ms ยิงซ้ำอีก 1 ครั้งแล้วใช้อันที่เสร็จก่อน
+    """
+
+    def __init__(
+        self,
+        api_key,
+        model,
+        fallback_model=None,
+        base_url=None,
+        requests_per_minute=30,
+        tokens_per_minute=6000,
+        max_pending=64,
+        max_queue_wait=10.0,
+        timeout=20.0,
+        max_retries=2,
+        backoff_base=0.5,
+        backoff_max=8.0,
+        hedge_after_ms=0,
+    ):
+        self.model = model
+        self.fallback_model = fallback_model or None
+        self.max_pending = max_pending
+        self.max_queue_wait = max_queue_wait
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after_ms / 1000
+        # retry ของ SDK ปิดไว้ ให้ gateway คุมเองทั้งหมด
+        self.client = Groq(api_key=api_key, base_url=base_url, max_retries=0)
+        self.async_client = AsyncGroq(api_key=api_key, base_url=base_url, max_retries=0)
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        # thread สำหรับยิงซ้ำของ hedging (ไม่ hedge ก็ไม่ต้องมี pool เรียก _create ตรงๆ)
+        self._hedge_pool = (
+            ThreadPoolExecutor(max_workers=max(2, max_pending), thread_name_prefix="llm-hedge")
+            if self.hedge_after else None
+        )
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.counters = {
+            "calls": 0, "rejected": 0, "retries": 0, "fallbacks": 0, "hedges": 0, "hedge_wins": 0, "failures": 0,
+        }
+
+    # ---------- admission + rate limit ----------
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def check_admission(self, max_tokens=500):
+        """เช็คแบบไม่จอง (ใช้ก่อนเริ่ม StreamingResponse เพื่อตอบ 503 ได้ก่อนส่ง header)"""
+        with self._lock:
+            pending = self._pending
+        if pending >= self.max_pending:
+            self._count("rejected")
+            raise LLMOverloaded(self.max_queue_wait, "LLM queue is full")
+        wait_seconds = max(self.request_bucket.wait_time(1), self.token_bucket.wait_time(max_tokens))
+        if wait_seconds > self.max_queue_wait:
+            self._count("rejected")
+            raise LLMOverloaded(wait_seconds, "LLM quota exhausted")
+
+    def _admit(self, messages, max_tokens):
+        """จองที่ในคิว + quota คืนเวลาที่ต้องรอก่อนยิง request"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.counters["rejected"] += 1
+                raise LLMOverloaded(self.max_queue_wait, "LLM queue is full")
+            self._pending += 1
+        metrics.LLM_PENDING.inc()
+        try:
+            return self._reserve(messages, max_tokens)
+        except LLMOverloaded:
+            self._release()
+            raise
+
+    def _reserve(self, messages, max_tokens):
+        """จอง quota 1 request + token ของ messages คืนเวลาที่ต้องรอ หรือ LLMOverloaded ถ้าต้องรอเกิน max_queue_wait"""
+        tokens = sum(estimate_tokens(m["content"]) for m in messages) + max_tokens
+        request_wait = self.request_bucket.reserve(1, self.max_queue_wait)
+        token_wait = self.token_bucket.reserve(tokens, self.max_queue_wait) if request_wait is not None else None
+        if token_wait is None:
+            # ไม่คืน token ที่จองไปแล้วใน request_bucket: ถือว่าเป็นค่าปรับของการโดน reject (เล็กน้อย)
+            self._count("rejected")
+            raise LLMOverloaded(
+                max(self.request_bucket.wait_time(1), self.token_bucket.wait_time(tokens)), "LLM quota exhausted"
+            )
+        return max(request_wait, token_wait)
+
+    def _retry_wait(self, messages, max_tokens, delay):
+        """retry / fallback ก็เป็น request ใหม่ของ Groq ต้องจอง quota ก่อนยิง คืนเวลาที่ต้องรอ (backoff หรือ quota)"""
+        return max(delay, self._reserve(messages, max_tokens))
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+        metrics.LLM_PENDING.dec()
+
+    def _record_usage(self, model, messages, usage, completion):
+        """นับ token ตาม usage ที่ Groq ส่งกลับ (ถ้าไม่มี เช่น fake server ใช้ค่าประมาณแทน)"""
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or sum(estimate_tokens(m["content"]) for m in messages)
+        completion_tokens = getattr(usage, "completion_tokens", None) or estimate_tokens(completion)
+        metrics.LLM_TOKENS.labels(model, "prompt").inc(prompt_tokens)
+        metrics.LLM_TOKENS.labels(model, "completion").inc(completion_tokens)
+
+    def _backoff(self, attempt, error):
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                retry_after = None
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        delay = delay * (0.5 + random.random() / 2)
+        return min(self.backoff_max, max(delay, retry_after or 0))
+
+    def _models(self):
+        return [self.model] + ([self.fallback_model] if self.fallback_model else [])
+
+    # ---------- sync (/chat) ----------
+
+    def _create(self, model, messages, **kwargs):
+        return self.client.chat.completions.create(model=model, messages=messages, timeout=self.timeout, **kwargs)
+
+    def _create_hedged(self, model, messages, **kwargs):
+        if not self.hedge_after:
+            return self._create(model, messages, **kwargs)
+        first = self._hedge_pool.submit(self._create, model, messages, **kwargs)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done or self.request_bucket.reserve(1, 0) is None:
+            return first.result()
+        self._count("hedges")
+        second = self._hedge_pool.submit(self._create, model, messages, **kwargs)
+        futures = [first, second]
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                futures.remove(future)
+                if future.exception() is None or not futures:
+                    if future is second and future.exception() is None:
+                        self._count("hedge_wins")
+                    return future.result()
+
+    def complete(self, messages, temperature=0.1, max_tokens=500):
+        """คืนข้อความคำตอบ (raise LLMOverloaded หรือ error จาก Groq เมื่อ retry ครบแล้วยังไม่สำเร็จ)"""
+        wait_seconds = self._admit(messages, max_tokens)
+        metrics.observe("llm_queue_wait", wait_seconds)
+        time.sleep(wait_seconds)
+        try:
+            self._count("calls")
+            error, delay = None, 0.0
+            for index, model in enumerate(self._models()):
+                if index:
+                    self._count("fallbacks")
+                for attempt in range(self.max_retries + 1):
+                    if index or attempt:
+                        time.sleep(self._retry_wait(messages, max_tokens, delay))
+                    try:
+                        with metrics.span("llm_total"):
+                            response = self._create_hedged(
+                                model, messages, temperature=temperature, max_tokens=max_tokens
+                            )
+                        answer = response.choices[0].message.content
+                        self._record_usage(model, messages, response.usage, answer)
+                        return answer
+                    except RETRYABLE_ERRORS as e:
+                        error, delay = e, 0.0
+                        if attempt < self.max_retries:
+                            self._count("retries")
+                            delay = self._backoff(attempt, e)
+                            logger.warning("🔁 LLM %s failed (%s), retry in %.1fs", model, type(e).__name__, delay)
+            self._count("failures")
+            raise error
+        finally:
+            self._release()
+
+    # ---------- async (/chat และ /chat/stream) ----------
+
+    async def _acreate(self, model, messages, **kwargs):
+        return await self.async_client.chat.completions.create(
+            model=model, messages=messages, timeout=self.timeout, **kwargs
+        )
+
+    async def _acreate_hedged(self, model, messages, **kwargs):
+        if not self.hedge_after:
+            return await self._acreate(model, messages, **kwargs)
+        first = asyncio.ensure_future(self._acreate(model, messages, **kwargs))
+        done, _ = await asyncio.wait([first], timeout=self.hedge_after)
+        if done or self.request_bucket.reserve(1, 0) is None:
+            return await first
+        self._count("hedges")
+        second = asyncio.ensure_future(self._acreate(model, messages, **kwargs))
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=lambda task: task.exception() is not None):
+                    if task.exception() is None or not pending:
+                        if task is second and task.exception() is None:
+                            self._count("hedge_wins")
+                        return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def acomplete(self, messages, temperature=0.1, max_tokens=500):
+        """complete แบบ async (รอ quota / backoff ด้วย asyncio.sleep ไม่กิน thread)"""
+        wait_seconds = self._admit(messages, max_tokens)
+        metrics.observe("llm_queue_wait", wait_seconds)
+        await asyncio.sleep(wait_seconds)
+        try:
+            self._count("calls")
+            error, delay = None, 0.0
+            for index, model in enumerate(self._models()):
+                if index:
+                    self._count("fallbacks")
+                for attempt in range(self.max_retries + 1):
+                    if index or attempt:
+                        await asyncio.sleep(self._retry_wait(messages, max_tokens, delay))
+                    try:
+                        with metrics.span("llm_total"):
+                            response = await self._acreate_hedged(
+                                model, messages, temperature=temperature, max_tokens=max_tokens
+                            )
+                        answer = response.choices[0].message.content
+                        self._record_usage(model, messages, response.usage, answer)
+                        return answer
+                    except RETRYABLE_ERRORS as e:
+                        error, delay = e, 0.0
+                        if attempt < self.max_retries:
+                            self._count("retries")
+                            delay = self._backoff(attempt, e)
+                            logger.warning("🔁 LLM %s failed (%s), retry in %.1fs", model, type(e).__name__, delay)
+            self._count("failures")
+            raise error
+        finally:
+            self._release()
+
+    async def stream(self, messages, temperature=0.1, max_tokens=500):
+        """
+        async generator ของ token ต่างๆ ของคำตอบ
+        retry/fallback ได้เฉพาะก่อนได้ token แรก (ส่งให้ client ไปแล้วย้อนไม่ได้) และไม่ hedge
+        """
+        wait_seconds = self._admit(messages, max_tokens)
+        metrics.observe("llm_queue_wait", wait_seconds)
+        await asyncio.sleep(wait_seconds)
+        try:
+            self._count("calls")
+            error, delay = None, 0.0
+            for index, model in enumerate(self._models()):
+                if index:
+                    self._count("fallbacks")
+                for attempt in range(self.max_retries + 1):
+                    if index or attempt:
+                        await asyncio.sleep(self._retry_wait(messages, max_tokens, delay))
+                    started = False
+                    call_started = time.perf_counter()
+                    try:
+                        stream = await self.async_client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            temperature=temperature,
+                            max_tokens=max_tokens,
+                            stream=True,
+                            timeout=self.timeout,
+                        )
+                        tokens, usage = [], None
+                        async for chunk in stream:
+                            # Groq ส่ง usage มาใน x_groq ของ chunk สุดท้าย
+                            usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+                            if not chunk.choices:
+                                continue
+                            token = chunk.choices[0].delta.content
+                            if token:
+                                if not started:
+                                    metrics.observe("llm_first_token", time.perf_counter() - call_started)
+                                started = True
+                                tokens.append(token)
+                                yield token
+                        metrics.observe("llm_total", time.perf_counter() - call_started)
+                        self._record_usage(model, messages, usage, "".join(tokens))
+                        return
+                    except RETRYABLE_ERRORS as e:
+                        if started:
+                            raise
+                        error, delay = e, 0.0
+                        if attempt < self.max_retries:
+                            self._count("retries")
+                            delay = self._backoff(attempt, e)
+                            logger.warning("🔁 LLM %s stream failed (%s), retry in %.1fs", model, type(e).__name__, delay)
+            self._count("failures")
+            raise error
+        finally:
+            self._release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counters,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "model": self.model,
+                "fallback_model": self.fallback_model,
+            }
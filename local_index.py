@@ -0,0 +1,140 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+# ค่าคงที่ของ Fusion.RRF แบบเดียวกับ Qdrant (qdrant_client.hybrid.fusion): score = Σ 1 / (rank + RRF_K), rank เริ่มที่ 0
+RRF_K = 2
+SNAPSHOT_FORMAT = 1
+
+
+def write_snapshot(path, payloads, dense, sparse, manifest):
+    """
+    เขียน snapshot สำหรับ VECTOR_BACKEND=numpy (upload_data.py --export-snapshot)
+    - dense.npy: matrix float32 (N x dim) normalize แล้ว (cosine = dot product) โหลดแบบ mmap
+    - sparse_*.npy: inverted index ของ BM25 แบบ CSR (term → [(doc, weight)])
+    - payloads.jsonl: payload ของแต่ละ point ({"page_content", "metadata"}) เรียงตามแถวของ dense.npy
+    เขียนลงโฟลเดอร์ชั่วคราวก่อนแล้วค่อยสลับ ให้ snapshot เดิมใช้ได้จนกว่าของใหม่จะเขียนเสร็จ
+    """
+    matrix = np.asarray(dense, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1, norms)
+
+    terms = np.concatenate([np.asarray(indices, dtype=np.int64) for indices, _ in sparse] or [np.empty(0, np.int64)])
+    weights = np.concatenate([np.asarray(values, dtype=np.float32) for _, values in sparse] or [np.empty(0, np.float32)])
+    docs = np.repeat(np.arange(len(sparse), dtype=np.int32), [len(indices) for indices, _ in sparse])
+    order = np.argsort(terms, kind="stable")
+    unique_terms, counts = np.unique(terms[order], return_counts=True)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, "dense.npy"), matrix)
+    np.save(os.path.join(tmp_path, "sparse_terms.npy"), unique_terms)
+    np.save(os.path.join(tmp_path, "sparse_offsets.npy"), offsets)
+    np.save(os.path.join(tmp_path, "sparse_docs.npy"), docs[order])
+    np.save(os.path.join(tmp_path, "sparse_weights.npy"), weights[order])
+    with open(os.path.join(tmp_path, "payloads.jsonl"), "w", encoding="utf-8") as f:
+        for payload in payloads:
+            f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+    with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({**manifest, "format": SNAPSHOT_FORMAT, "points": len(payloads), "dim": int(matrix.shape[1])}, f, indent=2)
+
+    old_path = f"{path}.old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def _top_k(scores, k):
+    """index ของ k คะแนนสูงสุด เรียงจากมากไปน้อย (argpartition ก่อน ไม่ต้อง sort ทั้ง corpus)"""
+    if len(scores) > k:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class LocalIndex:
+    """
+    Hybrid index ใน process (dense cosine + BM25 sparse dot product แล้วรวมด้วย RRF)
+    ให้ผลเหมือน hybrid_request ของ main.py ที่ค้นบน Qdrant แต่ไม่มี network hop
+    อ่านอย่างเดียวหลังโหลด จึงเรียกพร้อมกันจากหลาย thread ได้
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format: {self.manifest.get('format')}")
+        self.dense = np.load(os.path.join(path, "dense.npy"), mmap_mode="r")
+        self.terms = np.load(os.path.join(path, "sparse_terms.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "sparse_offsets.npy"), mmap_mode="r")
+        self.docs = np.load(os.path.join(path, "sparse_docs.npy"), mmap_mode="r")
+        self.weights = np.load(os.path.join(path, "sparse_weights.npy"), mmap_mode="r")
+        with open(os.path.join(path, "payloads.jsonl"), encoding="utf-8") as f:
+            self.payloads = [json.loads(line) for line in f]
+        if len(self.payloads) != self.dense.shape[0]:
+            raise ValueError(f"Snapshot is inconsistent: {len(self.payloads)} payloads, {self.dense.shape[0]} vectors")
+        self.path = path
+        self.version = f"snapshot:{self.manifest.get('collection')}@{self.manifest.get('ingest_version')}"
+
+    def __len__(self):
+        return len(self.payloads)
+
+    def _sparse_scores(self, indices, values):
+        scores = np.zeros(len(self.payloads), dtype=np.float32)
+        for term, value in zip(indices, values):
+            position = np.searchsorted(self.terms, term)
+            if position < len(self.terms) and self.terms[position] == term:
+                start, end = self.offsets[position], self.offsets[position + 1]
+                # doc ซ้ำกันไม่ได้ภายใน term เดียว จึงใช้ += แบบ fancy index ได้
+                scores[self.docs[start:end]] += value * self.weights[start:end]
+        return scores
+
+    def _sparse_top_k(self, indices, values, k):
+        """เหมือน sparse search ของ Qdrant: คืนเฉพาะ doc ที่มี term ตรงกับคำถามอย่างน้อย 1 ตัว"""
+        scores = self._sparse_scores(indices, values)
+        matched = np.flatnonzero(scores)
+        return matched[_top_k(scores[matched], k)]
+
+    def search_batch(self, queries):
+        """queries = [(dense, sparse, k)] คืน list ของ payload ที่เรียงตามคะแนน RRF ต่อคำถาม"""
+        if not queries or not len(self.payloads):
+            return [[] for _ in queries]
+        matrix = np.asarray([dense for dense, _, _ in queries], dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        dense_scores = matrix @ self.dense.T  # matrix multiply ครั้งเดียวทั้ง batch
+
+        results = []
+        for row, (_, sparse, k) in enumerate(queries):
+            fused = {}
+            rankings = (_top_k(dense_scores[row], k), self._sparse_top_k(sparse.indices, sparse.values, k))
+            for ranking in rankings:
+                for rank, doc in enumerate(ranking):
+                    fused[int(doc)] = fused.get(int(doc), 0.0) + 1 / (rank + RRF_K)
+            ranked = sorted(fused, key=fused.get, reverse=True)[:k]
+            results.append([self.payloads[doc] for doc in ranked])
+        return results
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "points": len(self.payloads),
+            "terms": len(self.terms),
+            "postings": len(self.docs),
+            "version": self.version,
+        }
+
+
+class LocalVectorStore:
+    """แทน QdrantVectorStore เมื่อ VECTOR_BACKEND=numpy (main.py ใช้แค่ embeddings, sparse_embeddings และ index)"""
+
+    def __init__(self, index, embeddings, sparse_embeddings):
+        self.index = index
+        self.embeddings = embeddings
+        self.sparse_embeddings = sparse_embeddings
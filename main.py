@@ -1,26 +1,151 @@
-from fastapi import FastAPI, HTTPException, Body
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Body, Request
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 from fastapi.middleware.cors import CORSMiddleware
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient, QdrantClient, models
 from langchain_qdrant import QdrantVectorStore, FastEmbedSparse, RetrievalMode
 from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
-from groq import Groq
+from langchain_core.documents import Document
 from dotenv import load_dotenv
-from docxtpl import DocxTemplate
 from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import asyncio
+import csv
+import hashlib
+import io
+import logging
 import os
-import re
 import uvicorn
 import json
+import time
+import threading
+from contextlib import asynccontextmanager
+from typing import Optional
+from answer_cache import AnswerCache, normalize_query
+from batching import MicroBatcher
+from context_builder import ContextBuilder
+from llm_gateway import LLMGateway, LLMOverloaded
+from local_index import LocalIndex, LocalVectorStore
+from thai_text import ThaiSparseEmbeddings
+from reranker import Reranker
+from singleflight import SingleFlight
+from sessions import SessionStore, SqliteSessionStore, condense_query, history_messages
+import metrics
+from metrics import span
+from model_config import DENSE_MODEL_NAME, SPARSE_MODEL_NAME, RERANK_ENABLED, RERANK_MODEL
+from forms import form_fast_answer, form_topic, resolve_source
+import form_templates
+import form_pdf
 
 load_dotenv()
 
+# 📈 Log พร้อม request id (X-Request-ID) ทุกบรรทัด และ Prometheus metrics ที่ /metrics
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+metrics.setup_logging(LOG_LEVEL)
+logger = logging.getLogger("kmutt")
+
 # ================= CONFIGURATION =================
 QDRANT_URL = os.environ.get("QDRANT_URL")
 QDRANT_API_KEY = os.environ.get("QDRANT_API_KEY")
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
-COLLECTION_NAME = "demo_collection_railway_v2"
+COLLECTION_NAME = "demo_collection_railway_v2"  # collection เดิม (ใช้เมื่อยังไม่มี alias)
+# 🔀 Blue/Green: upload_data.py --rebuild สร้าง collection ใหม่แล้วสลับ alias นี้ไปชี้ (ไม่มี downtime)
+COLLECTION_ALIAS = os.environ.get("COLLECTION_ALIAS", "kmutt_forms")
+COLLECTION_CHECK_SECONDS = int(os.environ.get("COLLECTION_CHECK_SECONDS", 30))  # ความถี่เช็ค alias/ingest_version
+GROQ_MODEL = "llama-3.1-8b-instant"
+GROQ_FALLBACK_MODEL = os.environ.get("GROQ_FALLBACK_MODEL")  # model สำรองเมื่อ model หลักล้มเหลวครบทุก retry
+GROQ_BASE_URL = os.environ.get("GROQ_BASE_URL")  # ชี้ไป fake server ตอนทดสอบ (bench/fake_llm.py)
+
+# 🗄️ Vector backend: qdrant (Qdrant server ที่ QDRANT_URL, ค่าเดิม)
+# | qdrant-local (Qdrant แบบ embedded เก็บไฟล์ที่ QDRANT_PATH ไม่ต้องมี server, เปิดได้ทีละ process)
+# | numpy (โหลด snapshot จาก upload_data.py --export-snapshot ครั้งเดียวตอน startup แล้วค้นใน process)
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "qdrant")
+QDRANT_PATH = os.environ.get("QDRANT_PATH", "qdrant_data")
+VECTOR_SNAPSHOT_PATH = os.environ.get("VECTOR_SNAPSHOT_PATH", "vector_snapshot")
+
+# 🌊 Async retrieval: /chat เป็น async def และค้น Qdrant server ผ่าน AsyncQdrantClient ตัวเดียวทั้ง process
+# (gRPC ที่ QDRANT_GRPC_PORT, connection pool QDRANT_POOL_SIZE ช่อง keep-alive ไว้) ระหว่างรอ network ไม่กิน thread
+# ตั้ง ASYNC_RETRIEVAL=0 เพื่อกลับไปใช้ handler แบบ sync บน threadpool, QDRANT_PREFER_GRPC=0 ถ้าเปิดได้แค่ REST port
+ASYNC_RETRIEVAL = os.environ.get("ASYNC_RETRIEVAL", "1") == "1"
+QDRANT_PREFER_GRPC = os.environ.get("QDRANT_PREFER_GRPC", "1") == "1"
+QDRANT_GRPC_PORT = int(os.environ.get("QDRANT_GRPC_PORT", 6334))
+QDRANT_POOL_SIZE = int(os.environ.get("QDRANT_POOL_SIZE", 4))
+QDRANT_TIMEOUT_SECONDS = int(os.environ.get("QDRANT_TIMEOUT_SECONDS", 10))
+QDRANT_GRPC_OPTIONS = {
+    "grpc.keepalive_time_ms": 30000,
+    "grpc.keepalive_timeout_ms": 10000,
+    "grpc.keepalive_permit_without_calls": 1,
+    "grpc.http2.max_pings_without_data": 0,
+}
+
+# 🇹🇭 ตัดคำไทย (pythainlp) ก่อนทำ BM25 ทั้งตอน index และ query ต้องตั้งให้ตรงกับ upload_data.py
+# (เปลี่ยนค่าแล้วต้อง upload_data.py --rebuild) และจำนวน chunk ที่ค้นต่อคำถาม
+THAI_SEGMENTATION = os.environ.get("THAI_SEGMENTATION", "1") == "1"
+SPARSE_TOKENIZER = "thai-newmm" if THAI_SEGMENTATION else "whitespace"
+RETRIEVAL_K = int(os.environ.get("RETRIEVAL_K", 5))
+
+# 🏅 Rerank (ปิดไว้เป็นค่าเริ่มต้น): ค้นมา RERANK_CANDIDATES chunk แล้วให้ cross-encoder เลือก RERANK_TOP_N อันเข้า prompt
+# ให้คะแนนทีละ RERANK_STEP chunk และหยุดเมื่ออันดับหนึ่งทิ้งห่างอันดับสองเกิน RERANK_DOMINANCE_MARGIN (logit)
+# (RERANK / RERANK_MODEL อยู่ใน model_config.py ใช้ร่วมกับ preload.py)
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", 30))
+RERANK_TOP_N = int(os.environ.get("RERANK_TOP_N", 3))
+RERANK_STEP = int(os.environ.get("RERANK_STEP", 10))
+RERANK_DOMINANCE_MARGIN = float(os.environ.get("RERANK_DOMINANCE_MARGIN", 2.0))
+
+# 💬 Session: ส่ง session_id มากับคำถามเพื่อถามต่อเนื่องได้ (เก็บ SESSION_MAX_TURNS turn ล่าสุด + summary ของ turn ที่เก่ากว่า)
+# คำถามที่ไม่พูดถึงฟอร์มใดและยาวไม่เกิน SESSION_CONDENSE_MAX_RATIO เท่าของคำถามก่อนหน้าจะค้นพร้อมคำถามก่อนหน้า
+# ส่งประวัติให้ LLM ไม่เกิน SESSION_HISTORY_TOKEN_BUDGET
+# SESSION_BACKEND: memory (ค่าเริ่มต้น) | sqlite (ไฟล์ SESSION_SQLITE_PATH ใช้ร่วมกันได้หลาย worker และไม่หายตอน restart)
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "memory")
+SESSION_SQLITE_PATH = os.environ.get("SESSION_SQLITE_PATH", "sessions.db")
+SESSION_MAX = int(os.environ.get("SESSION_MAX", 10000))
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", 1800))
+SESSION_MAX_TURNS = int(os.environ.get("SESSION_MAX_TURNS", 4))
+SESSION_HISTORY_TOKEN_BUDGET = int(os.environ.get("SESSION_HISTORY_TOKEN_BUDGET", 600))
+SESSION_CONDENSE_MAX_RATIO = float(os.environ.get("SESSION_CONDENSE_MAX_RATIO", 1.5))
+
+# 🛬 Coalescing: คำถามเดียวกัน (normalize แล้ว, ไม่มีประวัติ session) หรือ /generate-form ที่ payload เหมือนกัน
+# ที่เข้ามาระหว่างที่งานแรกยังไม่เสร็จ รอผลจากงานเดียวกัน (ไม่ค้น/เรียก LLM/render ซ้ำ) ตั้ง COALESCE_REQUESTS=0 เพื่อปิด
+COALESCE_REQUESTS = os.environ.get("COALESCE_REQUESTS", "1") == "1"
+
+# 🔥 Warm-up: โหลดโมเดลใน background thread ตอน startup (ตั้ง WARMUP_ON_STARTUP=0 เพื่อกลับไป lazy load)
+WARMUP_ON_STARTUP = os.environ.get("WARMUP_ON_STARTUP", "1") == "1"
+
+# 🧵 จำนวน thread ของ ONNX Runtime (dense embedding / reranker) ต่อ process ไม่ตั้ง = ใช้ทุก core
+# serve.py ตั้งให้เป็น CPU / จำนวน worker กันหลาย worker แย่ง core กันเอง (oversubscription)
+ONNX_THREADS = int(os.environ.get("ONNX_THREADS", 0)) or None
+
+# ⚡ Answer Cache (ตอบคำถามซ้ำๆ ช่วงลงทะเบียนโดยไม่ต้องเรียก Groq)
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 512))
+ANSWER_CACHE_TTL_SECONDS = int(os.environ.get("ANSWER_CACHE_TTL_SECONDS", 3600))
+# < 1 = ตอบจาก cache เมื่อ embedding ของคำถามใกล้กันถึงค่านี้ (เฉพาะคำถามที่พูดถึงฟอร์มชุดเดียวกัน) ค่าเริ่มต้น 1 = ปิด
+# โมเดล embedding เป็นภาษาอังกฤษ คำถามภาษาไทยที่ต่างกันแค่ชื่อฟอร์ม/การกระทำอาจใกล้กันเกิน 0.95
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", 1.0))
+
+# 📦 Micro-batching: รวมคำถามที่เข้ามาภายใน EMBED_BATCH_MAX_WAIT_MS เป็น batch เดียว
+# (embed dense ครั้งเดียว + ส่ง hybrid query ไป Qdrant ใน request เดียว) ตั้ง EMBED_BATCH_MAX_SIZE=1 เพื่อปิด
+EMBED_BATCH_MAX_SIZE = int(os.environ.get("EMBED_BATCH_MAX_SIZE", 32))
+EMBED_BATCH_MAX_WAIT_MS = float(os.environ.get("EMBED_BATCH_MAX_WAIT_MS", 5))
+
+# 🎯 Form Fast Path: ถ้าคำถามระบุฟอร์มเดียวชัดเจน (เช่น "ขอ ro16") ตอบจากการ์ดฟอร์มทันที
+# เรียก RAG + LLM เฉพาะคำถามที่กำกวมเท่านั้น (ตั้ง FORM_FAST_PATH=0 เพื่อปิด)
+FORM_FAST_PATH = os.environ.get("FORM_FAST_PATH", "1") == "1"
+
+# 🚦 LLM Gateway: จำกัด rate ตาม quota ของ Groq + คิวจำกัดขนาด (เต็มแล้วตอบ 503 + Retry-After ทันที)
+# retry แบบ exponential backoff เมื่อเจอ 429/5xx/timeout, hedging ตั้ง LLM_HEDGE_AFTER_MS > 0 เพื่อเปิด
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get("LLM_REQUESTS_PER_MINUTE", 30))
+LLM_TOKENS_PER_MINUTE = int(os.environ.get("LLM_TOKENS_PER_MINUTE", 6000))
+LLM_MAX_PENDING = int(os.environ.get("LLM_MAX_PENDING", 64))
+LLM_MAX_QUEUE_WAIT_SECONDS = float(os.environ.get("LLM_MAX_QUEUE_WAIT_SECONDS", 10))
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", 20))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 2))
+LLM_HEDGE_AFTER_MS = float(os.environ.get("LLM_HEDGE_AFTER_MS", 0))
+
+# 🧮 Context Builder: ตัด chunk ซ้ำ รวม chunk ติดกัน แล้วใส่ context ไม่เกิน CONTEXT_TOKEN_BUDGET (ประมาณการ)
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 1200))
+CONTEXT_DEDUP_THRESHOLD = float(os.environ.get("CONTEXT_DEDUP_THRESHOLD", 0.85))
 
 # 📂 ตั้งค่า Template (ต้องสร้างโฟลเดอร์ templates และใส่ไฟล์ .docx ไว้ข้างใน)
 TEMPLATE_DIR = "templates"
@@ -31,175 +156,233 @@ TEMPLATE_MAP = {
     "RO.13": os.path.join(TEMPLATE_DIR, "RO-13_Resignation.docx"),
     "RO.16": os.path.join(TEMPLATE_DIR, "RO-16_Sick_Leave.docx"),
 }
-
-# ✅ 1. ฐานข้อมูลฟอร์มฉบับสมบูรณ์ (Master Data) – รักษาไว้สำหรับ extract URLs
-# รวมรหัส, ชื่อไทย, และลิงก์ไว้ในที่เดียว เพื่อง่ายต่อการจัดการ
-FORM_MASTER_DATA = [
-    {
-        "id": "RO.01",
-        "name": "คำร้องทั่วไป (General Request)",
-        "url": "https://regis.kmutt.ac.th/service/form/RO-01.pdf",
-        "keywords": ["คำร้องทั่วไป", "ro01", "ro.01", "general", "อื่นๆ", "เรื่องทั่วไป", "สทน.01"]
-    },
-    {
-        "id": "RO.03",
-        "name": "หนังสือรับรองของผู้ปกครอง",
-        "url": "https://regis.kmutt.ac.th/service/form/RO-03.pdf",
-        "keywords": ["ผู้ปกครอง", "ro03", "ro.03", "หนังสือรับรอง", "ยินยอม", "parent", "สทน.03"]
-    },
-    {
-        "id": "RO.04",
-        "name": "ใบมอบฉันทะ",
-        "url": "https://regis.kmutt.ac.th/service/form/RO-04.pdf",
-        "keywords": ["มอบฉันทะ", "ro04", "ro.04", "แทน", "คนอื่นรับแทน", "authorization", "สทน.04"]
-    },
-    {
-        "id": "RO.08",
-        "name": "คำร้องขอคืนเงินค่าลงทะเบียน",
-        "url": "https://regis.kmutt.ac.th/service/form/RO-08.pdf",
-        "keywords": ["คืนเงิน", "ro08", "ro.08", "refund", "ค่าลงทะเบียน", "จ่ายเกิน", "ขอคืนเงิน", "สทน.08"]
-    },
-    {
-        "id": "RO.11",
-        "name": "คำร้องขอเลื่อนรับพระราชทานปริญญาบัตร",
-        "url": "https://regis.kmutt.ac.th/service/form/RO-11.pdf",
-        "keywords": ["รับปริญญา", "ro11", "ro.11", "เลื่อนรับ", "ไม่รับปริญญา", "สทน.11"]
-    },
-    {
-        "id": "RO.12",
-        "name": "คำร้องขอลาพักการศึกษา",
-        "url": "https://regis.kmutt.ac.th/service/form/RO-12Updated.pdf",
-        "keywords": ["ลาพักการศึกษา", "ro12", "ro.12", "ดรอปเรียน", "drop", "พักการเรียน", "รักษาสถานภาพ", "สทน.12"]
-    },
-    {
-        "id": "RO.13",
-        "name": "คำร้องขอลาออก",
-        "url": "https://regis.kmutt.ac.th/service/form/RO-13Updated.pdf",
-        "keywords": ["ลาออก", "ro13", "ro.13", "resignation", "ออก", "quit", "สทน.13"]
-    },
-    {
-        "id": "RO.14",
-        "name": "คำร้องขอเปลี่ยนแปลงข้อมูลประวัติ",
-        "url": "https://regis.kmutt.ac.th/service/form/RO-14.pdf",
-        "keywords": ["เปลี่ยนชื่อ", "ro14", "ro.14", "เปลี่ยนนามสกุล", "แก้ประวัติ", "ที่อยู่ผิด", "คำนำหน้า", "สทน.14"]
-    },
-    {
-        "id": "RO.15",
-        "name": "คำร้องขอทำบัตรนักศึกษาใหม่",
-        "url": "https://regis.kmutt.ac.th/service/form/RO-15_160718.pdf",
-        "keywords": ["บัตรหาย", "ro15", "ro.15", "บัตรนักศึกษา", "ทำบัตรใหม่", "บัตรชำรุด", "สทน.15"]
-    },
-    {
-        "id": "RO.16",
-        "name": "คำร้องขอลาป่วย/ลากิจ",
-        "url": "https://regis.kmutt.ac.th/service/form/RO-16.pdf",
-        "keywords": ["ลาป่วย", "ro16", "ro.16", "ลากิจ", "ป่วย", "ใบรับรองแพทย์", "หยุดเรียน", "sick", "สทน.16"]
-    },
-    {
-        "id": "RO.18",
-        "name": "คำร้องลงทะเบียนต่ำกว่า/เกินกว่าหน่วยกิต",
-        "url": "https://regis.kmutt.ac.th/service/form/RO-18Updated.pdf",
-        "keywords": ["หน่วยกิตเกิน", "ro18", "ro.18", "หน่วยกิตต่ำ", "ลงทะเบียนเกิน", "ลงทะเบียนต่ำกว่า", "credits", "สทน.18"]
-    },
-    {
-        "id": "RO.19",
-        "name": "คำร้องลงทะเบียนวิชาสอบซ้อน",
-        "url": "https://regis.kmutt.ac.th/service/form/RO-19.pdf",
-        "keywords": ["สอบซ้อน", "ro19", "ro.19", "เวลาสอบชน", "exam conflict", "สทน.19"]
-    },
-    {
-        "id": "RO.20",
-        "name": "คำร้องลงทะเบียนวิชานอกหลักสูตร",
-        "url": "https://regis.kmutt.ac.th/service/form/RO-20.pdf",
-        "keywords": ["นอกหลักสูตร", "ro20", "ro.20", "วิชาเลือกเสรี", "free elective", "สทน.20"]
-    },
-    {
-        "id": "RO.21",
-        "name": "คำร้องลงทะเบียนเรียนแบบบุคคลภายนอก",
-        "url": "https://regis.kmutt.ac.th/service/form/RO-21.pdf",
-        "keywords": ["บุคคลภายนอก", "ro21", "ro.21", "visitor", "คนนอก", "สทน.21"]
-    },
-    {
-        "id": "RO.22",
-        "name": "คำร้องขอสมัครสอบโดยไม่ต้องเข้าเรียน / ผ่อนผัน",
-        "url": "https://regis.kmutt.ac.th/service/form/RO-22.pdf",
-        "keywords": ["ขาดเรียน", "ro22", "ro.22", "ผ่อนผัน", "ไม่ได้เข้าเรียน", "สมัครสอบ", "สทน.22"]
-    },
-    {
-        "id": "RO.23",
-        "name": "คำร้องขอเปลี่ยน/เทียบรายวิชา",
-        "url": "https://regis.kmutt.ac.th/service/form/RO-23.pdf",
-        "keywords": ["เทียบวิชา", "ro23", "ro.23", "เปลี่ยนวิชา", "transfer", "เทียบโอน", "สทน.23"]
-    },
-    {
-        "id": "RO.25",
-        "name": "ใบลงทะเบียนเรียน",
-        "url": "https://regis.kmutt.ac.th/service/form/RO-25.pdf",
-        "keywords": ["ใบลงทะเบียน", "ro25", "ro.25", "register", "regis", "สทน.25"]
-    },
-    {
-        "id": "RO.26",
-        "name": "ใบเพิ่ม-ลด-ถอน-เปลี่ยนกลุ่ม",
-        "url": "https://regis.kmutt.ac.th/service/form/RO-26Updated.pdf",
-        "keywords": ["เพิ่มวิชา", "ro26", "ro.26", "ถอนวิชา", "เปลี่ยนเซค", "เปลี่ยน sec", "add/drop", "ลดวิชา", "ถอน w", "ติด w", "สทน.26"]
-    },
-]
-
-# ✅ 2. สร้างตัวแปรช่วยค้นหา (Lookup & Prompt Generation) – ลบ FORM_LIST_TEXT เพราะไม่ใช้ rule-based แล้ว
-FORM_DB = {}
-for item in FORM_MASTER_DATA:
-    # สร้าง Dictionary สำหรับค้นหา URL เร็วๆ
-    FORM_DB[item["id"]] = item["url"] # ค้นด้วยรหัส (เช่น "RO.01")
-    FORM_DB[item["name"]] = item["url"] # ค้นด้วยชื่อ (เช่น "คำร้องทั่วไป")
-   
-    # เพิ่มรูปแบบย่อยๆ เผื่อ AI หรือ User พิมพ์ผิด
-    FORM_DB[item["id"].replace(".", "")] = item["url"] # "RO01"
-    FORM_DB[item["id"].replace(".", ". ")] = item["url"] # "RO. 01"
-   
-    if "keywords" in item:
-        for kw in item["keywords"]:
-            FORM_DB[kw] = item["url"]
+# 🖨️ Render .docx ใน process pool (template ถูก compile ไว้ในแต่ละ worker และโหลดใหม่เมื่อไฟล์เปลี่ยน)
+FORM_RENDER_WORKERS = int(os.environ.get("FORM_RENDER_WORKERS", 2))
+# 🧾 ?format= ของ /generate-form: docx (ค่าเดิม) หรือ pdf (กรอกลงหน้าฟอร์มทางการโดยตรง ดู form_pdf.py)
+FORM_OUTPUT_FORMATS = {
+    "docx": (form_templates.render_docx, "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    "pdf": (form_pdf.render_pdf, "application/pdf"),
+}
+# 📚 /generate-form/batch: จำนวนแถวสูงสุดต่อ request และจำนวนเอกสารที่ render ค้างพร้อมกัน (คุม memory ให้คงที่)
+FORM_BATCH_MAX_ROWS = int(os.environ.get("FORM_BATCH_MAX_ROWS", 5000))
+FORM_BATCH_IN_FLIGHT = int(os.environ.get("FORM_BATCH_IN_FLIGHT", FORM_RENDER_WORKERS * 2))
 
 # ================= GLOBAL VARIABLES (LAZY LOAD) =================
 # We declare them as None so they don't take up memory at startup
 vector_store_instance = None
-groq_client_instance = None
+groq_client_instance = None  # LLMGateway (ห่อ Groq + AsyncGroq)
+reranker_instance = None  # Reranker เมื่อ RERANK=1
+async_qdrant_instance = None  # AsyncQdrantClient (สร้างใน event loop ตอนใช้ครั้งแรก)
+answer_cache = AnswerCache(
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+    similarity_threshold=ANSWER_CACHE_SIMILARITY,
+    topic_fn=form_topic,
+)
+context_builder = ContextBuilder(
+    token_budget=CONTEXT_TOKEN_BUDGET,
+    dedup_threshold=CONTEXT_DEDUP_THRESHOLD,
+)
+_session_options = dict(max_sessions=SESSION_MAX, ttl_seconds=SESSION_TTL_SECONDS, max_turns=SESSION_MAX_TURNS)
+if SESSION_BACKEND == "sqlite":
+    session_store = SqliteSessionStore(SESSION_SQLITE_PATH, **_session_options)
+elif SESSION_BACKEND == "memory":
+    session_store = SessionStore(**_session_options)
+else:
+    raise ValueError(f"Unknown SESSION_BACKEND: {SESSION_BACKEND}")
+chat_flight = SingleFlight("chat", enabled=COALESCE_REQUESTS)
+form_flight = SingleFlight("form", enabled=COALESCE_REQUESTS)
+active_collection = COLLECTION_NAME  # collection จริงที่ alias ชี้อยู่ (อัปเดตทุก COLLECTION_CHECK_SECONDS)
+_collection_checked_at = 0.0
+_rag_lock = threading.Lock()  # กัน request แรกๆ ที่เข้ามาพร้อมกันโหลดโมเดลซ้ำหลายรอบ
+rag_ready = threading.Event()  # set เมื่อโหลดโมเดล + warm-up ONNX เสร็จ หรือโหลดครบตอน lazy load (ใช้ใน /readyz)
+warmup_error = None
+render_pool = None
+preloaded_models = None  # (embeddings, sparse_embeddings, reranker, index) จาก load_models()
+
+def load_models():
+    """
+    โหลดโมเดล embedding / reranker และ snapshot ของ VECTOR_BACKEND=numpy (ไม่เปิด connection ใดๆ)
+    serve.py เรียกใน master ก่อน fork worker ทุก worker จึงใช้ weight ชุดเดียวกันแบบ copy-on-write
+    ถ้าไม่ได้เรียกไว้ก่อน get_rag_system จะเรียกเองตอนโหลดครั้งแรก
+    """
+    global preloaded_models
+    if preloaded_models is None:
+        embeddings = FastEmbedEmbeddings(model_name=DENSE_MODEL_NAME, threads=ONNX_THREADS)
+        # ห่อเสมอ: ตัดคำตาม sparse_tokenizer ของ collection ที่ค้นจริง (use_collection_tokenizer)
+        sparse_embeddings = ThaiSparseEmbeddings(
+            FastEmbedSparse(model_name=SPARSE_MODEL_NAME), thai_segmentation=THAI_SEGMENTATION,
+        )
+        reranker = None
+        if RERANK_ENABLED:
+            reranker = Reranker(
+                RERANK_MODEL, top_n=RERANK_TOP_N, step=RERANK_STEP, dominance_margin=RERANK_DOMINANCE_MARGIN,
+                threads=ONNX_THREADS,
+            )
+        index = load_snapshot(VECTOR_SNAPSHOT_PATH) if VECTOR_BACKEND == "numpy" else None
+        preloaded_models = (embeddings, sparse_embeddings, reranker, index)
+    return preloaded_models
 
 def get_rag_system():
     """
     This function loads the models ONLY when they are needed.
     It prevents the server from crashing during startup.
+    Thread-safe: โหลดครั้งเดียวเท่านั้น แม้จะถูกเรียกพร้อมกันหลาย request
     """
-    global vector_store_instance, groq_client_instance
+    global vector_store_instance, groq_client_instance, reranker_instance, active_collection
    
-    if vector_store_instance is None:
-        print("⏳ Lazy Loading: Initializing AI Models...")
-       
-        # 1. Setup Embeddings
-        embeddings = FastEmbedEmbeddings(model_name="BAAI/bge-small-en-v1.5")
-        sparse_embeddings = FastEmbedSparse(model_name="Qdrant/bm25")
-        # 2. Connect Qdrant
-        client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
-        # 3. Setup Vector Store
-        vector_store_instance = QdrantVectorStore(
-            client=client,
-            collection_name=COLLECTION_NAME,
-            embedding=embeddings,
-            sparse_embedding=sparse_embeddings,
-            retrieval_mode=RetrievalMode.HYBRID,
-            vector_name="dense_vector",
-            sparse_vector_name="sparse_vector",
-        )
-       
-        # 4. Setup Groq
-        groq_client_instance = Groq(api_key=GROQ_API_KEY)
-       
-        print("✅ Lazy Loading: Models are ready!")
+    if vector_store_instance is not None:
+        return vector_store_instance, groq_client_instance
+
+    with _rag_lock:
+        if vector_store_instance is None:
+            logger.info("⏳ Lazy Loading: Initializing AI Models...")
+            started = time.perf_counter()
+           
+            # 1. Setup Embeddings (+ snapshot เมื่อ VECTOR_BACKEND=numpy) ใช้ชุดที่ serve.py preload ไว้ถ้ามี
+            embeddings, sparse_embeddings, reranker_instance, index = load_models()
+            # 2. Connect Qdrant
+            client = None
+            if VECTOR_BACKEND == "qdrant-local":
+                client = QdrantClient(path=QDRANT_PATH)
+            elif VECTOR_BACKEND == "qdrant":
+                client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+            elif VECTOR_BACKEND != "numpy":
+                raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND}")
+            if client is not None:
+                active_collection = resolve_collection(client)
+                use_collection_tokenizer(sparse_embeddings, active_collection, client.get_collection(active_collection))
+            # 3. Setup Groq (ผ่าน LLMGateway: rate limit + retry + fallback)
+            groq_client_instance = LLMGateway(
+                api_key=GROQ_API_KEY,
+                model=GROQ_MODEL,
+                fallback_model=GROQ_FALLBACK_MODEL,
+                base_url=GROQ_BASE_URL,
+                requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+                max_pending=LLM_MAX_PENDING,
+                max_queue_wait=LLM_MAX_QUEUE_WAIT_SECONDS,
+                timeout=LLM_TIMEOUT_SECONDS,
+                max_retries=LLM_MAX_RETRIES,
+                hedge_after_ms=LLM_HEDGE_AFTER_MS,
+            )
+            # 4. Setup Vector Store (assign เป็นตัวสุดท้าย เพราะใช้เป็นตัวบอกว่าโหลดครบแล้ว)
+            if index is not None:
+                vector_store_instance = LocalVectorStore(index, embeddings, sparse_embeddings)
+            else:
+                vector_store_instance = QdrantVectorStore(
+                    client=client,
+                    collection_name=active_collection,
+                    embedding=embeddings,
+                    sparse_embedding=sparse_embeddings,
+                    retrieval_mode=RetrievalMode.HYBRID,
+                    vector_name="dense_vector",
+                    sparse_vector_name="sparse_vector",
+                )
+           
+            metrics.observe("model_init", time.perf_counter() - started)
+            logger.info("✅ Lazy Loading: Models are ready!")
+            if not WARMUP_ON_STARTUP:
+                rag_ready.set()  # ไม่มี warm-up thread: พร้อมรับ traffic ทันทีที่โหลดครบ
        
     return vector_store_instance, groq_client_instance
 
+async def get_rag_system_async():
+    """get_rag_system สำหรับ handler แบบ async (โหลดครั้งแรกใน threadpool ไม่บล็อก event loop)"""
+    if vector_store_instance is not None:
+        return vector_store_instance, groq_client_instance
+    return await run_in_threadpool(get_rag_system)
+
+def get_async_qdrant():
+    """
+    AsyncQdrantClient ที่ใช้ร่วมกันทุก request (gRPC channel / HTTP connection ต่อค้างไว้ใน pool)
+    คืน None เมื่อไม่ได้ค้นผ่าน Qdrant server หรือปิด ASYNC_RETRIEVAL ไว้ (ค้นผ่าน search_batcher แทน)
+    """
+    global async_qdrant_instance
+    if VECTOR_BACKEND != "qdrant" or not ASYNC_RETRIEVAL:
+        return None
+    if async_qdrant_instance is None:
+        async_qdrant_instance = AsyncQdrantClient(
+            url=QDRANT_URL,
+            api_key=QDRANT_API_KEY,
+            prefer_grpc=QDRANT_PREFER_GRPC,
+            grpc_port=QDRANT_GRPC_PORT,
+            grpc_options=QDRANT_GRPC_OPTIONS,
+            pool_size=QDRANT_POOL_SIZE,
+            timeout=QDRANT_TIMEOUT_SECONDS,
+        )
+    return async_qdrant_instance
+
+def load_snapshot(path):
+    """โหลด snapshot ของ VECTOR_BACKEND=numpy (dense matrix แบบ mmap + BM25 inverted index) และเช็คว่าใช้โมเดล/ตัวตัดคำเดียวกัน"""
+    started = time.perf_counter()
+    index = LocalIndex(path)
+    expected_manifest = (
+        ("dense_model", DENSE_MODEL_NAME), ("sparse_model", SPARSE_MODEL_NAME), ("sparse_tokenizer", SPARSE_TOKENIZER),
+    )
+    for key, expected in expected_manifest:
+        if index.manifest.get(key) != expected:
+            raise ValueError(f"Snapshot {key} is {index.manifest.get(key)}, expected {expected}")
+    logger.info("🗄️ Loaded vector snapshot %s: %d points in %.2fs", index.version, len(index), time.perf_counter() - started)
+    return index
+
+def warm_up(retry_seconds=10):
+    """
+    โหลดโมเดล แล้ว embed คำถามหลอก 1 ครั้งเพื่อให้ ONNX session พร้อม ก่อนรับ traffic จริง
+    ถ้าล้มเหลว (เช่น Qdrant ยังไม่พร้อม) จะลองใหม่เรื่อยๆ ทุก retry_seconds
+    """
+    global warmup_error
+    started = time.perf_counter()
+    while True:
+        try:
+            vector_store, _ = get_rag_system()
+            dense, sparse = embed_query(vector_store, "warm-up query ลาป่วยใช้ฟอร์มอะไร")
+            if reranker_instance is not None:
+                docs = hybrid_search(vector_store, dense, sparse, k=RERANK_STEP)
+                reranker_instance.rerank("warm-up query ลาป่วยใช้ฟอร์มอะไร", docs)
+            warmup_error = None
+            rag_ready.set()
+            logger.info("🔥 Warm-up done in %.1fs", time.perf_counter() - started)
+            return
+        except Exception as e:
+            warmup_error = str(e)
+            logger.error("❌ Warm-up failed, retrying in %ss: %s", retry_seconds, e)
+            time.sleep(retry_seconds)
+
+def get_render_pool():
+    """Process pool สำหรับ render .docx (ใช้ spawn เพื่อไม่ fork process ที่มี thread/ONNX session อยู่)"""
+    global render_pool
+    if render_pool is None:
+        render_pool = ProcessPoolExecutor(
+            max_workers=FORM_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=form_templates.preload,
+            initargs=(list(TEMPLATE_MAP.values()),),
+        )
+    return render_pool
+
 # ================= API SERVER =================
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    if not form_pdf.font_available():
+        logger.warning("⚠️ No Thai font for PDF output (PDF_THAI_FONT=%s): /generate-form?format=pdf returns 503",
+                       form_pdf.PDF_THAI_FONT)
+    else:
+        logger.info("🔤 PDF font: %s", form_pdf.font_path() or form_pdf.font_name())
+    if WARMUP_ON_STARTUP:
+        threading.Thread(target=warm_up, name="rag-warm-up", daemon=True).start()
+        # ปลุก worker ของ render pool ให้ compile template (.docx ใน initializer, หน้า PDF ต้นแบบที่นี่) ไว้ก่อน request แรก
+        pool = get_render_pool()
+        for _ in range(FORM_RENDER_WORKERS):
+            pool.submit(form_pdf.preload, list(TEMPLATE_MAP.values()))
+    yield
+    if render_pool is not None:
+        render_pool.shutdown(wait=False, cancel_futures=True)
+    if async_qdrant_instance is not None:
+        await async_qdrant_instance.close()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(metrics.RequestMetricsMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -211,9 +394,9 @@ app.add_middleware(
 
 class UserRequest(BaseModel):
     message: str
+    session_id: Optional[str] = Field(default=None, max_length=64)  # ไม่ส่ง = ถามแบบไม่มีประวัติเหมือนเดิม
 
-def get_ai_response(context, question, groq_client):
-    system_prompt = '''
+SYSTEM_PROMPT = '''
 คุณคือผู้ช่วยอัจฉริยะด้านคำร้องและเอกสารของ มจธ. (KMUTT)
 ตอบให้กระชับ ชัดเจน เป็นขั้นตอน ใช้ภาษาไทยที่เป็นมิตรกับนักศึกษา
 ถ้ามีแบบฟอร์มหรือลิงก์ต้องใส่ให้ครบ โดยต้องมีความถูกต้อง แม่นยำ และอ้างอิงจากเอกสารที่ได้รับมอบหมาย (Source Documents) เท่านั้น
@@ -273,78 +456,524 @@ Step 3: Response Structure (โครงสร้างคำตอบ) ให
 • การอนุมัติ: ต้องผ่านความเห็นจาก อาจารย์ที่ปรึกษา, หัวหน้าภาควิชา, และ คณบดี ตามลำดับที่ระบุในแบบฟอร์ม
 • ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-01.pdf"
 '''
-   
-    messages = [
-        {"role": "system", "content": system_prompt},
+
+def build_messages(context, question, session=None):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        *history_messages(session, SESSION_HISTORY_TOKEN_BUDGET),
         {"role": "user", "content": f"Context:\n{context}\n\nQuestion:\n{question}"}
     ]
-   
-    try:
-        response = groq_client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=messages,
-            temperature=0.1,
-            max_tokens=500  # Limit เพื่อป้องกัน response ยาวซ้ำ
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"AI Error: {str(e)}"
+
+def get_ai_response(context, question, groq_client, session=None):
+    """เรียก LLM ผ่าน LLMGateway (raise LLMOverloaded เมื่อคิว/quota เต็ม หรือ error เมื่อ retry ครบแล้ว)"""
+    return groq_client.complete(build_messages(context, question, session), temperature=0.1, max_tokens=500)  # Limit เพื่อป้องกัน response ยาวซ้ำ
+
+async def get_ai_response_async(context, question, groq_client, session=None):
+    return await groq_client.acomplete(build_messages(context, question, session), temperature=0.1, max_tokens=500)
+
+def load_session(req):
+    """ประวัติของ session (None เมื่อไม่ได้ส่ง session_id หรือยังไม่เคยถาม)"""
+    return session_store.get(req.session_id) if req.session_id else None
+
+def remember_turn(req, reply, sources):
+    if req.session_id:
+        session_store.append(req.session_id, req.message, reply, sources)
+
+# async handler: session store อาจเป็น SQLite (blocking I/O + รอ write lock) จึงรันบน threadpool ไม่ให้บล็อก event loop
+async def load_session_async(req):
+    return await run_in_threadpool(load_session, req) if req.session_id else None
+
+async def remember_turn_async(req, reply, sources):
+    if req.session_id:
+        await run_in_threadpool(remember_turn, req, reply, sources)
 
 @app.get("/")
 def read_root():
     return {"status": "Server is running 🚀"}
 
-@app.post("/chat")
+# Liveness: process ยังตอบได้ (ไม่ต้องรอโมเดล)
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+# Readiness: ให้ load balancer ส่ง traffic มาเมื่อโหลดโมเดล + warm-up เสร็จแล้วเท่านั้น
+@app.get("/readyz")
+def readyz():
+    if not rag_ready.is_set():
+        detail = {"status": "warming_up"} if warmup_error is None else {"status": "error", "error": warmup_error}
+        return JSONResponse(status_code=503, content=detail)
+    return {"status": "ready"}
+
+def resolve_collection(client):
+    """คืนชื่อ collection จริงที่ COLLECTION_ALIAS ชี้อยู่ ถ้ายังไม่มี alias ใช้ COLLECTION_NAME เดิม"""
+    for alias in client.get_aliases().aliases:
+        if alias.alias_name == COLLECTION_ALIAS:
+            return alias.collection_name
+    return COLLECTION_NAME
+
+def use_collection_tokenizer(sparse_embeddings, collection, info):
+    """
+    ตัดคำคำถามแบบเดียวกับตอน index collection (sparse_tokenizer ใน metadata ที่ upload_data.py เขียนไว้
+    collection เก่าที่ไม่มี field นี้คือ whitespace) ถ้าไม่ตรงกับ THAI_SEGMENTATION ใช้แบบของ collection ไปก่อน
+    BM25 ที่ตัดคำต่างจากตอน index จะได้ term ที่ไม่ตรงกับ document เลย
+    """
+    tokenizer = (info.config.metadata or {}).get("sparse_tokenizer", "whitespace")
+    if tokenizer == sparse_embeddings.tokenizer:
+        return
+    sparse_embeddings.thai_segmentation = tokenizer == "thai-newmm"
+    if tokenizer != SPARSE_TOKENIZER:
+        logger.warning(
+            "⚠️ %s was indexed with sparse_tokenizer=%s (configured %s): using %s until upload_data.py --rebuild",
+            collection, tokenizer, SPARSE_TOKENIZER, tokenizer,
+        )
+    else:
+        logger.info("🇹🇭 %s uses sparse_tokenizer=%s", collection, tokenizer)
+
+def refresh_collection(vector_store):
+    """
+    ทุก COLLECTION_CHECK_SECONDS:
+    - ตามการสลับ alias (blue/green rebuild หรือ rollback) → ค้นหาจาก collection ใหม่
+    - upload_data.py เขียน ingest_version ไว้ใน metadata ของ collection ทุกครั้งที่โหลดข้อมูลใหม่
+      ถ้า collection หรือ version เปลี่ยน ให้ล้าง Answer Cache ทิ้ง
+    """
+    global active_collection, _collection_checked_at
+    now = time.monotonic()
+    if now - _collection_checked_at < COLLECTION_CHECK_SECONDS:
+        return
+    _collection_checked_at = now
+    if isinstance(vector_store, LocalVectorStore):
+        # snapshot โหลดครั้งเดียว (ใช้ snapshot ใหม่ต้อง restart) version จึงไม่เปลี่ยนระหว่างทำงาน
+        if answer_cache.set_version(vector_store.index.version):
+            logger.info("🧹 Answer cache reset (version=%s)", vector_store.index.version)
+        return
+    try:
+        collection = resolve_collection(vector_store.client)
+        info = vector_store.client.get_collection(collection)
+        version = f"{collection}@{(info.config.metadata or {}).get('ingest_version')}"
+    except Exception as e:
+        logger.warning("⚠️ Cannot read collection version: %s", e)
+        return
+    if collection != active_collection:
+        logger.info("🔀 Switching collection: %s → %s", active_collection, collection)
+        active_collection = collection
+    use_collection_tokenizer(vector_store.sparse_embeddings, collection, info)
+    if answer_cache.set_version(version):
+        logger.info("🧹 Answer cache reset (version=%s)", version)
+
+def embed_queries(vector_store, messages):
+    """
+    Embed หลายคำถามในครั้งเดียว คืน list ของ (dense, sparse)
+    - dense: ONNX batch เดียว (FastEmbedEmbeddings แบบ doc_embed_type="default" ใช้โมเดลเดียวกันทั้ง query/document)
+    - sparse: BM25 ไม่ได้รันโมเดล (tokenize + hash) ทำทีละคำถามได้เลย และต้องใช้ embed_query (ไม่ถ่วง TF)
+    """
+    with span("embed_dense"):
+        dense = vector_store.embeddings.embed_documents(messages)
+    with span("embed_sparse"):
+        sparse = [vector_store.sparse_embeddings.embed_query(message) for message in messages]
+    return list(zip(dense, sparse))
+
+def hybrid_request(dense, sparse, k):
+    """Hybrid query (dense + BM25, RRF) แบบเดียวกับ QdrantVectorStore.similarity_search ในโหมด HYBRID"""
+    return models.QueryRequest(
+        prefetch=[
+            models.Prefetch(using="dense_vector", query=dense, limit=k),
+            models.Prefetch(
+                using="sparse_vector",
+                query=models.SparseVector(indices=sparse.indices, values=sparse.values),
+                limit=k,
+            ),
+        ],
+        query=models.FusionQuery(fusion=models.Fusion.RRF),
+        limit=k,
+        with_payload=True,
+    )
+
+def hybrid_search_batch(vector_store, queries):
+    """
+    ส่งหลาย hybrid query ไป Qdrant ใน request เดียว (query_batch_points) queries = [(dense, sparse, k)]
+    VECTOR_BACKEND=numpy ค้นใน LocalIndex แทน (fusion แบบเดียวกัน ไม่มี network hop)
+    """
+    if isinstance(vector_store, LocalVectorStore):
+        payloads = vector_store.index.search_batch(queries)
+    else:
+        responses = vector_store.client.query_batch_points(
+            collection_name=active_collection,
+            requests=[hybrid_request(dense, sparse, k) for dense, sparse, k in queries],
+        )
+        payloads = [[point.payload for point in response.points] for response in responses]
+    return [to_documents(results) for results in payloads]
+
+def to_documents(payloads):
+    return [
+        Document(
+            page_content=payload.get("page_content", ""),
+            metadata=payload.get("metadata") or {},
+        )
+        for payload in payloads
+    ]
+
+# ตัวรวม batch (item = (vector_store, ...) ทุก item ใช้ vector_store เดียวกัน)
+embedding_batcher = MicroBatcher(
+    lambda items: embed_queries(items[0][0], [message for _, message in items]),
+    max_batch_size=EMBED_BATCH_MAX_SIZE,
+    max_wait_ms=EMBED_BATCH_MAX_WAIT_MS,
+    name="embed-batcher",
+)
+search_batcher = MicroBatcher(
+    lambda items: hybrid_search_batch(items[0][0], [query for _, query in items]),
+    max_batch_size=EMBED_BATCH_MAX_SIZE,
+    max_wait_ms=EMBED_BATCH_MAX_WAIT_MS,
+    name="search-batcher",
+)
+
+def embed_query(vector_store, message):
+    """Embed คำถามครั้งเดียว (dense + sparse) ใช้ทั้งค้น cache และค้น Qdrant"""
+    return embedding_batcher((vector_store, message))
+
+def hybrid_search(vector_store, dense, sparse, k=5):
+    """Hybrid search ด้วย vector ที่ embed ไว้แล้ว (รวม batch กับ request อื่นที่เข้ามาพร้อมกัน)"""
+    return search_batcher((vector_store, (dense, sparse, k)))
+
+async def embed_query_async(vector_store, message):
+    return await embedding_batcher.submit_async((vector_store, message))
+
+async def hybrid_search_async(vector_store, dense, sparse, k=5):
+    """
+    Qdrant server: ส่ง hybrid query (dense + sparse prefetch, RRF) เป็น request เดียวผ่าน AsyncQdrantClient
+    backend อื่น (ค้นใน process เป็นงาน CPU) ส่งเข้า search_batcher แล้ว await ผลแทน
+    """
+    client = get_async_qdrant()
+    if client is None:
+        return await search_batcher.submit_async((vector_store, (dense, sparse, k)))
+    [response] = await client.query_batch_points(
+        collection_name=active_collection,
+        requests=[hybrid_request(dense, sparse, k)],
+    )
+    return to_documents([point.payload for point in response.points])
+
+def prepare_query(vector_store, message, use_cache=True):
+    """
+    เช็ค Answer Cache ก่อนค้นหา
+    คืน (cache_key, dense, sparse, cached) — ถ้า cached ไม่ใช่ None แปลว่าตอบจาก cache ได้เลย
+    use_cache=False (คำถามที่มีประวัติ session คำตอบขึ้นกับประวัติ) embed อย่างเดียว ไม่ค้น cache
+    """
+    refresh_collection(vector_store)
+    if not use_cache:
+        metrics.CACHE_LOOKUPS.labels("answer", "skip").inc()
+        with span("query_embed"):
+            dense, sparse = embed_query(vector_store, message)
+        return None, dense, sparse, None
+    cache_key = normalize_query(message)
+    cached = answer_cache.get(cache_key)
+    if cached is not None:
+        metrics.CACHE_LOOKUPS.labels("answer", "hit").inc()
+        return cache_key, None, None, cached
+    with span("query_embed"):  # รวมเวลารอ micro-batch
+        dense, sparse = embed_query(vector_store, message)
+    cached = answer_cache.get_similar(cache_key, dense)
+    metrics.CACHE_LOOKUPS.labels("answer", "miss" if cached is None else "semantic_hit").inc()
+    return cache_key, dense, sparse, cached
+
+async def prepare_query_async(vector_store, message, use_cache=True):
+    """prepare_query สำหรับ handler แบบ async (เช็ค alias/ingest_version ใน threadpool เฉพาะรอบที่ถึงเวลา)"""
+    if time.monotonic() - _collection_checked_at >= COLLECTION_CHECK_SECONDS:
+        await run_in_threadpool(refresh_collection, vector_store)
+    if not use_cache:
+        metrics.CACHE_LOOKUPS.labels("answer", "skip").inc()
+        with span("query_embed"):
+            dense, sparse = await embed_query_async(vector_store, message)
+        return None, dense, sparse, None
+    cache_key = normalize_query(message)
+    cached = answer_cache.get(cache_key)
+    if cached is not None:
+        metrics.CACHE_LOOKUPS.labels("answer", "hit").inc()
+        return cache_key, None, None, cached
+    with span("query_embed"):
+        dense, sparse = await embed_query_async(vector_store, message)
+    cached = answer_cache.get_similar(cache_key, dense)
+    metrics.CACHE_LOOKUPS.labels("answer", "miss" if cached is None else "semantic_hit").inc()
+    return cache_key, dense, sparse, cached
+
+def retrieve_context(vector_store, dense, sparse, message):
+    """ค้นหา Vector DB แล้วคืน (context_text, sources) ใช้ใน /chat แบบ sync (ASYNC_RETRIEVAL=0)"""
+    # ✅ Pure RAG: ค้นหา Vector DB (Qdrant) ตรงๆ เหมือน notebook (k=RETRIEVAL_K)
+    # เปิด rerank: ค้นกว้างขึ้นเป็น RERANK_CANDIDATES แล้วให้ cross-encoder เลือกเหลือ RERANK_TOP_N
+    k = RERANK_CANDIDATES if reranker_instance is not None else RETRIEVAL_K
+    with span("vector_search"):
+        search_results = hybrid_search(vector_store, dense, sparse, k=k)
+    if reranker_instance is not None:
+        search_results = reranker_instance.rerank(message, search_results)
+    return build_context(search_results)
+
+async def retrieve_context_async(vector_store, dense, sparse, message):
+    """retrieve_context แบบ async ใช้ใน /chat (ASYNC_RETRIEVAL=1) และ /chat/stream"""
+    k = RERANK_CANDIDATES if reranker_instance is not None else RETRIEVAL_K
+    with span("vector_search"):
+        search_results = await hybrid_search_async(vector_store, dense, sparse, k=k)
+    if reranker_instance is not None:
+        search_results = await run_in_threadpool(reranker_instance.rerank, message, search_results)
+    return build_context(search_results)
+
+def build_context(search_results):
+    """คืน (context_text, sources) จากผลค้นหา"""
+    sources = []
+    # ตัด chunk ซ้ำ/รวม chunk ติดกัน แล้วใส่ให้พอดี token budget (แหล่งอ้างอิงมาจาก chunk ที่ใช้จริงเท่านั้น)
+    with span("context_build"):
+        context_text, used_docs = context_builder.build(search_results)
+   
+    seen_urls = set()
+    for doc in used_docs:
+        # ฟอร์ม/ลิงก์ของ chunk ถูก resolve ไว้ตั้งแต่ตอน ingest (upload_data.py) อ่านจาก payload ได้เลย
+        metadata = doc.metadata
+        if "display_name" not in metadata:
+            # point เก่าที่ ingest ก่อนมี field นี้: resolve ตอนนี้แทน
+            metadata = resolve_source(metadata.get("file", "เอกสารทั่วไป"), doc.page_content)
+        doc_url = metadata.get("form_url")
+        if doc_url and doc_url not in seen_urls:
+            seen_urls.add(doc_url)
+            sources.append({
+                "doc": metadata["display_name"],
+                "page": 1,
+                "url": doc_url
+            })
+    return context_text, sources
+
+def check_fast_path(message):
+    if not FORM_FAST_PATH:
+        return None
+    fast_answer = form_fast_answer(message)
+    metrics.CACHE_LOOKUPS.labels("form_fast_path", "miss" if fast_answer is None else "hit").inc()
+    return fast_answer
+
+def answer_question(vector_store, groq_client, message, session):
+    """RAG + LLM ของ /chat คืน {reply, sources} (raise LLMOverloaded / error ให้ handler จัดการ)"""
+    # มีประวัติ session: ค้นด้วยคำถามที่เติมบริบทแล้ว และไม่ใช้ Answer Cache (คำตอบขึ้นกับประวัติ)
+    query = condense_query(session, message, SESSION_CONDENSE_MAX_RATIO)
+    cache_key, dense, sparse, cached = prepare_query(vector_store, query, use_cache=session is None)
+    if cached is not None:
+        logger.info("⚡ Answer cache hit")
+        return cached
+
+    context_text, sources = retrieve_context(vector_store, dense, sparse, query)
+    answer = get_ai_response(context_text, message, groq_client, session)
+    result = { "reply": answer, "sources": sources }
+    if cache_key is not None:
+        answer_cache.put(cache_key, dense, result)
+    return result
+
+async def answer_question_async(vector_store, groq_client, message, session):
+    """answer_question แบบ async"""
+    query = condense_query(session, message, SESSION_CONDENSE_MAX_RATIO)
+    cache_key, dense, sparse, cached = await prepare_query_async(vector_store, query, use_cache=session is None)
+    if cached is not None:
+        logger.info("⚡ Answer cache hit")
+        return cached
+
+    context_text, sources = await retrieve_context_async(vector_store, dense, sparse, query)
+    answer = await get_ai_response_async(context_text, message, groq_client, session)
+    result = { "reply": answer, "sources": sources }
+    if cache_key is not None:
+        answer_cache.put(cache_key, dense, result)
+    return result
+
 def chat_endpoint(req: UserRequest):
-    print(f"📩 คำถาม: {req.message}")
+    logger.info("📩 คำถาม: %s", req.message)
+    fast_answer = check_fast_path(req.message)
+    if fast_answer is not None:
+        logger.info("🎯 Form fast path")
+        remember_turn(req, fast_answer["reply"], fast_answer["sources"])
+        return fast_answer
+
     vector_store, groq_client = get_rag_system()
-    user_query = req.message.lower()
    
     try:
-        context_text = ""
-        sources = []
-       
-        # ✅ Pure RAG: ค้นหา Vector DB (Qdrant) ตรงๆ เหมือน notebook (k=5)
-        search_results = vector_store.similarity_search(req.message, k=5)
-       
-        for doc in search_results:
-            context_text += f"{doc.page_content}\n\n"
-           
-            # (ส่วนหาลิงก์จาก PDF เหมือนเดิม เผื่อกรณี Keyword ไม่ครอบคลุม)
-            file_path = doc.metadata.get("file", "เอกสารทั่วไป")
-            doc_url = ""
-            display_name = file_path.split("/")[-1]
-            # พยายาม Match ลิงก์จาก FORM_MASTER_DATA (สำหรับ display สวยๆ)
-            for item in FORM_MASTER_DATA:
-                if item["url"] in file_path or item["id"] in doc.page_content:
-                    doc_url = item["url"]
-                    display_name = f"{item['id']} {item['name']}"
-                    break
-           
-            if not doc_url:
-                found_urls = re.findall(r'(https?://[^\s\)]+)', doc.page_content)
-                if found_urls: doc_url = found_urls[0]
-            if doc_url:
-                if not any(s['url'] == doc_url for s in sources):
-                    sources.append({
-                        "doc": display_name,
-                        "page": 1,
-                        "url": doc_url
-                    })
-        answer = get_ai_response(context_text, req.message, groq_client)
-        return { "reply": answer, "sources": sources }
-   
+        session = load_session(req)
+        if session is None:
+            # คำถามเดียวกันที่กำลังตอบอยู่: รอคำตอบเดียวกัน
+            result = chat_flight.run(
+                normalize_query(req.message), lambda: answer_question(vector_store, groq_client, req.message, None)
+            )
+        else:
+            result = answer_question(vector_store, groq_client, req.message, session)
+        remember_turn(req, result["reply"], result["sources"])
+        return result
+
+    except LLMOverloaded as e:
+        logger.warning("🚦 LLM overloaded: %s", e)
+        raise HTTPException(status_code=503, detail="ระบบกำลังมีผู้ใช้งานจำนวนมาก กรุณาลองใหม่อีกครั้ง",
+                            headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.exception("Error: %s", e)
+        return { "reply": "เกิดข้อผิดพลาดในระบบ", "sources": [] }
+
+async def chat_endpoint_async(req: UserRequest):
+    logger.info("📩 คำถาม: %s", req.message)
+    fast_answer = check_fast_path(req.message)
+    if fast_answer is not None:
+        logger.info("🎯 Form fast path")
+        await remember_turn_async(req, fast_answer["reply"], fast_answer["sources"])
+        return fast_answer
+
+    vector_store, groq_client = await get_rag_system_async()
+
+    try:
+        session = await load_session_async(req)
+        if session is None:
+            result = await chat_flight.run_async(
+                normalize_query(req.message),
+                lambda: answer_question_async(vector_store, groq_client, req.message, None),
+            )
+        else:
+            result = await answer_question_async(vector_store, groq_client, req.message, session)
+        await remember_turn_async(req, result["reply"], result["sources"])
+        return result
+
+    except LLMOverloaded as e:
+        logger.warning("🚦 LLM overloaded: %s", e)
+        raise HTTPException(status_code=503, detail="ระบบกำลังมีผู้ใช้งานจำนวนมาก กรุณาลองใหม่อีกครั้ง",
+                            headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
-        print(f"Error: {e}")
+        logger.exception("Error: %s", e)
         return { "reply": "เกิดข้อผิดพลาดในระบบ", "sources": [] }
 
+# ASYNC_RETRIEVAL=1: async handler (I/O ทั้งหมด await บน event loop) | 0: handler เดิมที่ FastAPI รันบน threadpool
+app.post("/chat")(chat_endpoint_async if ASYNC_RETRIEVAL else chat_endpoint)
+
+def ndjson_line(payload):
+    return json.dumps(payload, ensure_ascii=False) + "\n"
+
+# ✅ Streaming: ส่ง sources ก่อน แล้วทยอยส่ง token จาก LLM ตามที่ได้รับ (NDJSON)
+# รูปแบบแต่ละบรรทัด:
+#   {"type": "sources", "sources": [...]}
+#   {"type": "token", "content": "..."}   (หลายบรรทัด)
+#   {"type": "done"} หรือ {"type": "error", "message": "..."}
+@app.post("/chat/stream")
+async def chat_stream_endpoint(req: UserRequest):
+    logger.info("📩 คำถาม (stream): %s", req.message)
+    fast_answer = check_fast_path(req.message)
+    if fast_answer is not None:
+        logger.info("🎯 Form fast path")
+        await remember_turn_async(req, fast_answer["reply"], fast_answer["sources"])
+        lines = [
+            ndjson_line({"type": "sources", "sources": fast_answer["sources"]}),
+            ndjson_line({"type": "token", "content": fast_answer["reply"]}),
+            ndjson_line({"type": "done"}),
+        ]
+        return StreamingResponse(iter(lines), media_type="application/x-ndjson")
+
+    vector_store, llm = await get_rag_system_async()
+    # คิว LLM เต็ม: ตอบ 503 ก่อนเริ่ม stream (ถ้าคำถามนั้นมีใน cache ก็ยังโดนปฏิเสธ แต่ช่วงนั้นระบบล้นอยู่แล้ว)
+    try:
+        llm.check_admission()
+    except LLMOverloaded as e:
+        logger.warning("🚦 LLM overloaded: %s", e)
+        raise HTTPException(status_code=503, detail="ระบบกำลังมีผู้ใช้งานจำนวนมาก กรุณาลองใหม่อีกครั้ง",
+                            headers={"Retry-After": str(e.retry_after)})
+
+    async def event_stream():
+        try:
+            session = await load_session_async(req)
+            query = condense_query(session, req.message, SESSION_CONDENSE_MAX_RATIO)
+            cache_key, dense, sparse, cached = await prepare_query_async(vector_store, query, use_cache=session is None)
+            if cached is not None:
+                logger.info("⚡ Answer cache hit")
+                await remember_turn_async(req, cached["reply"], cached["sources"])
+                yield ndjson_line({"type": "sources", "sources": cached["sources"]})
+                yield ndjson_line({"type": "token", "content": cached["reply"]})
+                yield ndjson_line({"type": "done"})
+                return
+            context_text, sources = await retrieve_context_async(vector_store, dense, sparse, query)
+        except Exception as e:
+            logger.exception("Error: %s", e)
+            yield ndjson_line({"type": "sources", "sources": []})
+            yield ndjson_line({"type": "error", "message": "เกิดข้อผิดพลาดในระบบ"})
+            return
+        yield ndjson_line({"type": "sources", "sources": sources})
+
+        try:
+            tokens = []
+            messages = build_messages(context_text, req.message, session)
+            async for token in llm.stream(messages, temperature=0.1, max_tokens=500):
+                tokens.append(token)
+                yield ndjson_line({"type": "token", "content": token})
+            if cache_key is not None:
+                answer_cache.put(cache_key, dense, { "reply": "".join(tokens), "sources": sources })
+            await remember_turn_async(req, "".join(tokens), sources)
+            yield ndjson_line({"type": "done"})
+        except LLMOverloaded as e:
+            logger.warning("🚦 LLM overloaded: %s", e)
+            yield ndjson_line({"type": "error", "message": "ระบบกำลังมีผู้ใช้งานจำนวนมาก กรุณาลองใหม่อีกครั้ง",
+                               "retry_after": e.retry_after})
+        except Exception as e:
+            logger.exception("❌ Stream Error: %s", e)
+            yield ndjson_line({"type": "error", "message": "เกิดข้อผิดพลาดในระบบ"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/metrics")
+def metrics_endpoint():
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/cache/stats")
+def cache_stats():
+    stats = {**answer_cache.stats(), "context": context_builder.stats()}
+    if groq_client_instance is not None:
+        stats["llm"] = groq_client_instance.stats()
+    if isinstance(vector_store_instance, LocalVectorStore):
+        stats["vector_index"] = vector_store_instance.index.stats()
+    if reranker_instance is not None:
+        stats["rerank"] = reranker_instance.stats()
+    stats["sessions"] = session_store.stats()
+    stats["coalescing"] = {"chat": chat_flight.stats(), "form": form_flight.stats()}
+    stats["worker_pid"] = os.getpid()  # ค่าทั้งหมดนี้เป็นของ worker ที่ตอบ request นี้ (serve.py มีหลาย worker)
+    return stats
+
+# ล้างประวัติของ session (ปุ่ม "เริ่มแชทใหม่" ฝั่ง frontend)
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    return {"deleted": session_store.delete(session_id)}
+
 # ✅ API สำหรับสร้างเอกสาร Word (Fill Form) – เหมือนเดิม
+def build_form_context(data):
+    """
+    Frontend ส่งมา key เป็น studentId แต่ Template อาจใช้ student_id
+    เราแปลงให้ครบทุกแบบเพื่อความชัวร์
+    """
+    return {
+        "student_id": data.get("studentId"),
+        "student_name": data.get("name"),
+        "faculty": data.get("faculty"),
+        "year": data.get("year"),
+        "semester": "2/2567", # ตัวอย่างค่า Default
+        "phone": data.get("student_tel") or data.get("phone_mobile"),
+        # เอาทุกอย่างที่ Frontend ส่งมา ใส่เข้าไปใน Context ด้วย
+        **data
+    }
+
+def get_form_renderer(template_path, format):
+    """เลือกฟังก์ชัน render ตาม ?format= และเช็คว่ามีไฟล์ที่ต้องใช้ครบ -> (render, media_type)"""
+    if format not in FORM_OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"ไม่รองรับ format={format} (ใช้ได้: {', '.join(FORM_OUTPUT_FORMATS)})")
+    if format == "pdf" and not form_pdf.font_available():
+        raise HTTPException(
+            status_code=503,
+            detail=f"format=pdf ยังไม่พร้อมใช้งาน (ไม่พบฟอนต์ภาษาไทย {form_pdf.PDF_THAI_FONT}) ใช้ format=docx แทน",
+        )
+    if not os.path.exists(template_path):
+        raise HTTPException(status_code=500, detail=f"Server Missing File: {template_path}")
+    return FORM_OUTPUT_FORMATS[format]
+
 @app.post("/generate-form")
-async def generate_form_endpoint(data: dict = Body(...)):
+async def generate_form_endpoint(data: dict = Body(...), format: str = "docx"):
     """
-    รับข้อมูล JSON จาก Frontend แล้วสร้างไฟล์ Word กลับไป
+    รับข้อมูล JSON จาก Frontend แล้วสร้างไฟล์ Word กลับไป (หรือ PDF เมื่อส่ง ?format=pdf)
     """
-    print(f"📝 กำลังสร้างฟอร์ม: {data}")
+    logger.info("📝 กำลังสร้างฟอร์ม: %s", data)
    
     # 1. เช็คว่าขอฟอร์มไหน
     form_type = data.get("formType") or data.get("form_type") or ""
@@ -352,52 +981,153 @@ async def generate_form_endpoint(data: dict = Body(...)):
     # ถ้าไม่มีรหัส ให้ลองหาจากชื่อ
     if form_type not in TEMPLATE_MAP:
         # ลองแปลง RO.16 เป็น RO-16 หรือหา partial match
-        print(f"⚠️ หา Template {form_type} ไม่เจอใน MAP")
+        logger.warning("⚠️ หา Template %s ไม่เจอใน MAP", form_type)
         # Fallback หรือแจ้ง Error
         raise HTTPException(status_code=404, detail=f"ไม่พบแม่แบบเอกสารสำหรับ {form_type}")
     template_path = TEMPLATE_MAP[form_type]
    
     # เช็คว่ามีไฟล์จริงไหม
-    if not os.path.exists(template_path):
-        raise HTTPException(status_code=500, detail=f"Server Missing File: {template_path}")
+    render, media_type = get_form_renderer(template_path, format)
     try:
-        # 2. โหลด Template
-        doc = DocxTemplate(template_path)
-       
-        # 3. เตรียมข้อมูล (Context)
-        # Frontend ส่งมา key เป็น studentId แต่ Template อาจใช้ student_id
-        # เราแปลงให้ครบทุกแบบเพื่อความชัวร์
-        context = {
-            "student_id": data.get("studentId"),
-            "student_name": data.get("name"),
-            "faculty": data.get("faculty"),
-            "year": data.get("year"),
-            "semester": "2/2567", # ตัวอย่างค่า Default
-            "phone": data.get("student_tel") or data.get("phone_mobile"),
-            # เอาทุกอย่างที่ Frontend ส่งมา ใส่เข้าไปใน Context ด้วย
-            **data
-        }
-       
-        # 4. Render
-        doc.render(context)
-       
-        # 5. Save ลง RAM (BytesIO)
-        file_stream = BytesIO()
-        doc.save(file_stream)
-        file_stream.seek(0)
-       
-        filename = f"Filled_{form_type}_{context['student_id']}.docx"
-       
-        # 6. ส่งไฟล์กลับ
+        # 2. เตรียมข้อมูล (Context)
+        context = build_form_context(data)
+
+        # 3. Render ใน process pool (template ถูก cache + compile ไว้แล้ว ไม่ block event loop)
+        # payload เดียวกันที่กำลัง render อยู่ (เช่นกดปุ่มซ้ำ) รอไฟล์เดียวกัน
+        loop = asyncio.get_running_loop()
+        flight_key = hashlib.sha256(json.dumps([format, data], sort_keys=True, default=str).encode()).hexdigest()
+        with span("form_render"):
+            content = await form_flight.run_async(
+                flight_key, lambda: loop.run_in_executor(get_render_pool(), render, template_path, context)
+            )
+
+        filename = f"Filled_{form_type}_{context['student_id']}.{format}"
+
+        # 4. ส่งไฟล์กลับ
         return StreamingResponse(
-            file_stream,
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            BytesIO(content),
+            media_type=media_type,
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
     except Exception as e:
-        print(f"❌ Error Generating Doc: {e}")
+        logger.exception("❌ Error Generating Doc: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+def iter_upload_rows(upload):
+    """อ่านไฟล์ CSV (แถวแรกเป็น header) หรือ JSON-lines ทีละแถว โดยไม่โหลดทั้งไฟล์เข้า RAM"""
+    text = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+    filename = (upload.filename or "").lower()
+    if filename.endswith((".jsonl", ".ndjson")) or "ndjson" in (upload.content_type or ""):
+        for line in text:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None  # นับเป็นแถวที่ผิดรูปแบบ ไม่หยุดทั้ง batch
+    else:
+        yield from csv.DictReader(text)
+
+async def read_batch_request(request):
+    """
+    รองรับ 2 แบบ:
+    - JSON: {"formType": "RO.16", "rows": [{...}, ...]}
+    - multipart/form-data: formType + file (.csv หรือ .jsonl)
+    """
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="ต้องแนบไฟล์ CSV หรือ JSONL ในช่อง file")
+        form_type = form.get("formType") or form.get("form_type") or request.query_params.get("formType", "")
+        return form_type, iter_upload_rows(upload)
+    try:
+        data = await request.json()
+    except ValueError:  # JSONDecodeError / UnicodeDecodeError
+        raise HTTPException(status_code=400, detail="body ไม่ใช่ JSON ที่ถูกต้อง")
+    rows = data.get("rows") if isinstance(data, dict) else None
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise HTTPException(status_code=400, detail="ต้องส่ง rows เป็น list ของข้อมูลนักศึกษา")
+    form_type = data.get("formType") or data.get("form_type") or ""
+    return form_type, iter(rows)
+
+@app.post("/generate-form/batch")
+async def generate_form_batch_endpoint(request: Request, format: str = "docx"):
+    """
+    สร้างฟอร์มเดียวกันให้นักศึกษาหลายคนในครั้งเดียว แล้วส่งกลับเป็น ZIP
+    render แบบขนานใน process pool และส่งแต่ละไฟล์ออกไปทันทีที่เสร็จ (ไม่รวมทั้งก้อนใน RAM)
+    แถวที่ render ไม่สำเร็จจะถูกสรุปไว้ใน errors.txt ท้าย ZIP
+    """
+    form_type, rows = await read_batch_request(request)
+    if form_type not in TEMPLATE_MAP:
+        raise HTTPException(status_code=404, detail=f"ไม่พบแม่แบบเอกสารสำหรับ {form_type}")
+    template_path = TEMPLATE_MAP[form_type]
+    render, _ = get_form_renderer(template_path, format)
+    logger.info("📚 กำลังสร้างฟอร์ม %s แบบ batch", form_type)
+
+    async def zip_stream():
+        loop = asyncio.get_running_loop()
+        pool = get_render_pool()
+        archive = form_templates.ZipStream()
+        pending = {}  # asyncio future -> (row number, filename, submitted at)
+        errors = []
+        rendered = 0
+        started = time.perf_counter()
+
+        def submit(index, row):
+            context = build_form_context(row)
+            filename = f"{index:05d}_Filled_{form_type}_{context['student_id']}.{format}"
+            future = loop.run_in_executor(pool, render, template_path, context)
+            pending[future] = (index, filename, time.perf_counter())
+
+        try:
+            index = 0
+            exhausted = False
+            end = object()
+            while pending or not exhausted:
+                # เติมงานให้เต็ม FORM_BATCH_IN_FLIGHT
+                while not exhausted and len(pending) < FORM_BATCH_IN_FLIGHT:
+                    row = next(rows, end)
+                    if row is end:
+                        exhausted = True
+                        break
+                    index += 1
+                    if index > FORM_BATCH_MAX_ROWS:
+                        errors.append(f"เกินจำนวนสูงสุด {FORM_BATCH_MAX_ROWS} แถว ข้อมูลที่เหลือไม่ถูกสร้าง")
+                        exhausted = True
+                        break
+                    if not isinstance(row, dict):
+                        errors.append(f"แถว {index}: ข้อมูลต้องเป็น object")
+                        continue
+                    submit(index, row)
+                if not pending:
+                    break
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    row_index, filename, submitted = pending.pop(future)
+                    metrics.observe("form_render", time.perf_counter() - submitted)
+                    try:
+                        content = future.result()
+                    except Exception as e:
+                        errors.append(f"แถว {row_index}: {e}")
+                        continue
+                    rendered += 1
+                    yield archive.add(filename, content)
+            if errors:
+                yield archive.add("errors.txt", "\n".join(errors).encode("utf-8"))
+            yield archive.close()
+            logger.info("✅ Batch %s: %d ไฟล์, error %d แถว ใน %.1fs", form_type, rendered, len(errors), time.perf_counter() - started)
+        finally:
+            # client ตัดการเชื่อมต่อกลางทาง: ยกเลิกงานที่ยังไม่เริ่ม
+            for future in pending:
+                future.cancel()
+
+    return StreamingResponse(
+        zip_stream(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=Filled_{form_type}_batch.zip"}
+    )
+
+# process เดียว (dev) สำหรับ production หลาย worker ใช้ serve.py
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
     uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,137 @@
+import contextvars
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# serve.py หลาย worker: ตั้ง PROMETHEUS_MULTIPROC_DIR ก่อน import โมดูลนี้ ค่าของทุก worker ถูกเขียนลงไฟล์ในโฟลเดอร์นั้น
+# แล้ว /metrics (worker ไหนตอบก็ได้) รวมให้ Gauge ใช้ livesum = ผลรวมของ worker ที่ยังทำงานอยู่
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+# request id ของ request ปัจจุบัน (ติดไปกับ log ทุกบรรทัด และตามไปใน run_in_threadpool เพราะ contextvars ถูก copy)
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "kmutt_stage_seconds",
+    "เวลาของแต่ละขั้นใน pipeline (model_init, embed_dense, embed_sparse, query_embed, vector_search, "
+    "rerank, context_build, llm_queue_wait, llm_first_token, llm_total, form_render)",
+    ["stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "kmutt_request_seconds", "เวลาตอบ HTTP request ทั้งหมด (รวม streaming body)", ["route", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "kmutt_requests_in_flight", "HTTP request ที่กำลังทำงานอยู่", ["route"], multiprocess_mode="livesum",
+)
+CACHE_LOOKUPS = Counter(
+    "kmutt_cache_lookups_total", "ผลการค้น cache (answer: hit / semantic_hit / miss / skip, form_fast_path: hit / miss)",
+    ["cache", "result"],
+)
+LLM_TOKENS = Counter("kmutt_llm_tokens_total", "token ที่ใช้กับ LLM (prompt / completion)", ["model", "kind"])
+COALESCED_REQUESTS = Counter(
+    "kmutt_coalesced_requests_total", "request ที่รอผลจากงานเดียวกันที่กำลังทำอยู่แทนการเริ่มงานใหม่ (chat / form)",
+    ["flight"],
+)
+RERANK_SCORED = Histogram(
+    "kmutt_rerank_scored_candidates", "จำนวน chunk ที่ cross-encoder ให้คะแนนจริงต่อคำถาม (น้อยกว่าที่ค้นมาเมื่อ early exit)",
+    buckets=(1, 5, 10, 15, 20, 30, 50, 100),
+)
+LLM_PENDING = Gauge("kmutt_llm_pending", "LLM call ที่รอ quota หรือกำลังเรียกอยู่", multiprocess_mode="livesum")
+
+logger = logging.getLogger(__name__)
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+def setup_logging(level="INFO"):
+    """log ไป stderr พร้อม request id (ไม่ทำอะไรถ้า root logger ถูกตั้งค่าไว้แล้ว)"""
+    handler = logging.StreamHandler()
+    handler.addFilter(RequestIdFilter())
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"))
+    logging.basicConfig(level=level, handlers=[handler])
+
+
+def observe(stage, seconds):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+@contextmanager
+def span(stage):
+    """จับเวลาขั้นหนึ่งของ pipeline ลง histogram kmutt_stage_seconds{stage=...} (นับทั้งกรณีสำเร็จและ error)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        observe(stage, elapsed)
+        logger.debug("⏱️ %s %.1fms", stage, elapsed * 1000)
+
+
+def render_latest():
+    """คืน (body, content_type) สำหรับ /metrics (รวมทุก worker เมื่อรันหลาย process)"""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def worker_exited(pid):
+    """ลบค่า livesum ของ worker ที่ตายแล้ว (counter / histogram ยังนับรวมต่อ)"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware: ตั้ง request id (ใช้ X-Request-ID จาก client ถ้ามี) ส่งกลับใน response header
+    และวัด in-flight / เวลาทั้ง request ต่อ route (path ที่ไม่รู้จักรวมเป็น "other" กัน label บวม)
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes = None
+
+    def _route(self, scope):
+        if self._routes is None:
+            self._routes = {getattr(route, "path", None) for route in scope["app"].routes}
+        return scope["path"] if scope["path"] in self._routes else "other"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex[:12]
+        token = request_id_var.set(request_id)
+        route = self._route(scope)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(route)
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            in_flight.dec()
+            REQUEST_SECONDS.labels(route, str(status)).observe(time.perf_counter() - started)
+            request_id_var.reset(token)
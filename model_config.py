@@ -0,0 +1,15 @@
+# model_config.py
+# ชื่อโมเดลที่ main.py / upload_data.py / preload.py ใช้ร่วมกัน (ไม่มี side effect ตอน import
+# preload.py ตอน build image จึงไม่ต้อง import main ที่ตั้ง logging / เปิด client / อ่าน config ทั้งหมด)
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()  # RERANK ใน .env ต้องมีผลก่อน main.py เรียก load_dotenv() เอง
+
+DENSE_MODEL_NAME = "BAAI/bge-small-en-v1.5"
+SPARSE_MODEL_NAME = "Qdrant/bm25"
+
+# 🏅 Rerank (ปิดไว้เป็นค่าเริ่มต้น) ตั้ง RERANK=1 ตอน build ด้วย preload.py จึงจะโหลดโมเดลลง image
+RERANK_ENABLED = os.environ.get("RERANK", "0") == "1"
+RERANK_MODEL = os.environ.get("RERANK_MODEL", "jinaai/jina-reranker-v2-base-multilingual")  # รองรับภาษาไทย
@@ -1,10 +1,14 @@
 # preload.py
-from langchain_huggingface import HuggingFaceEmbeddings
+# Bake โมเดลที่ main.py ใช้จริงลง image (ตั้ง FASTEMBED_CACHE_PATH ให้ตรงกันทั้งตอน build และตอนรัน)
+from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
 from langchain_qdrant import FastEmbedSparse
-# or whatever library you use in main.py
+from fastembed.rerank.cross_encoder import TextCrossEncoder
+from model_config import DENSE_MODEL_NAME, SPARSE_MODEL_NAME, RERANK_ENABLED, RERANK_MODEL
 
 print("Downloading models...")
 # Initialize the model here to force the download
-embeddings = HuggingFaceEmbeddings(model_name='BAAI/bge-m3')
-sparse_embeddings = FastEmbedSparse(model_name="Qdrant/bm25")
-print("Download complete!")
\ No newline at end of file
+embeddings = FastEmbedEmbeddings(model_name=DENSE_MODEL_NAME)
+sparse_embeddings = FastEmbedSparse(model_name=SPARSE_MODEL_NAME)
+if RERANK_ENABLED:  # ตั้ง RERANK=1 ตอน build ด้วย ถ้าจะเปิด rerank ตอนรัน
+    TextCrossEncoder(model_name=RERANK_MODEL)
+print("Download complete!")
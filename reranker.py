@@ -0,0 +1,78 @@
+import logging
+import threading
+import time
+
+from fastembed.rerank.cross_encoder import TextCrossEncoder
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Reranker:
+    """
+    จัดอันดับ chunk ที่ hybrid search ได้มาใหม่ด้วย cross-encoder (ONNX บน CPU) แล้วคืนแค่ top_n อันดับแรก
+    ให้คะแนนทีละ step chunk ตามลำดับเดิมของ hybrid search (batch เดียวต่อรอบ)
+    ถ้าคะแนนสูงสุดทิ้งห่างอันดับสองเกิน dominance_margin แล้ว หยุดไม่ต้องให้คะแนน chunk ที่เหลือ (early exit)
+    """
+
+    def __init__(self, model_name, top_n=3, step=10, dominance_margin=2.0, threads=None):
+        self.model_name = model_name
+        self.top_n = top_n
+        self.step = step
+        self.dominance_margin = dominance_margin
+        self.model = TextCrossEncoder(model_name=model_name, threads=threads)
+        self.requests = 0
+        self.early_exits = 0
+        self.candidates = 0
+        self.scored = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _dominates(self, scores):
+        if len(scores) < 2:
+            return False
+        best, second = sorted(scores, reverse=True)[:2]
+        return best - second >= self.dominance_margin
+
+    def rerank(self, query, docs):
+        """คืน docs ที่ดีที่สุด top_n อันเรียงตามคะแนน cross-encoder"""
+        started = time.perf_counter()
+        scores = []
+        early_exit = False
+        while len(scores) < len(docs):
+            batch = docs[len(scores):len(scores) + self.step]
+            scores.extend(self.model.rerank(query, [doc.page_content for doc in batch], batch_size=len(batch)))
+            if len(scores) < len(docs) and self._dominates(scores):
+                early_exit = True
+                break
+        ranked = sorted(range(len(scores)), key=lambda index: scores[index], reverse=True)[:self.top_n]
+        elapsed = time.perf_counter() - started
+
+        metrics.observe("rerank", elapsed)
+        metrics.RERANK_SCORED.observe(len(scores))
+        with self._lock:
+            self.requests += 1
+            self.early_exits += early_exit
+            self.candidates += len(docs)
+            self.scored += len(scores)
+            self.seconds += elapsed
+        logger.debug(
+            "🏅 Rerank: scored %d/%d candidates in %.1fms%s", len(scores), len(docs), elapsed * 1000,
+            " (early exit)" if early_exit else "",
+        )
+        return [docs[index] for index in ranked]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "model": self.model_name,
+                "top_n": self.top_n,
+                "step": self.step,
+                "dominance_margin": self.dominance_margin,
+                "requests": self.requests,
+                "early_exits": self.early_exits,
+                "avg_candidates": self.candidates / self.requests if self.requests else 0.0,
+                "avg_scored": self.scored / self.requests if self.requests else 0.0,
+                "avg_ms": self.seconds * 1000 / self.requests if self.requests else 0.0,
+            }
@@ -0,0 +1,179 @@
+"""
+Production server หลาย worker ที่ใช้โมเดลร่วมกันแบบ copy-on-write
+
+master โหลดโมเดล embedding / reranker (และ snapshot ของ VECTOR_BACKEND=numpy) ครั้งเดียว แล้ว fork WORKERS process
+ที่ accept จาก socket เดียวกัน weight ของ ONNX / BM25 / index จึงอยู่ใน memory ชุดเดียว (page ถูก copy เฉพาะที่ถูกเขียน)
+แทนที่จะโหลดซ้ำทุก worker แบบ uvicorn --workers (spawn แล้ว import main ใหม่)
+  - ONNX_THREADS ต่อ worker ค่าเริ่มต้น = CPU / WORKERS (กัน worker แย่ง core กันเอง)
+  - ONNX Runtime ที่สร้าง thread pool ไว้ก่อน fork จะค้างใน process ลูก จึง preload เฉพาะเมื่อ ONNX_THREADS=1
+    (PRELOAD_MODELS=auto) และทดสอบ fork + embed จริงก่อนทุกครั้ง ถ้าไม่ผ่านจะให้แต่ละ worker โหลดโมเดลเอง
+  - connection (Qdrant / Groq / SQLite) เปิดใหม่ในแต่ละ worker หลัง fork
+  - /metrics รวมค่าของทุก worker (PROMETHEUS_MULTIPROC_DIR) ส่วน /cache/stats, /readyz เป็นของ worker ที่ตอบ
+  - worker ที่ตายถูก fork ใหม่จาก master, SIGTERM / SIGINT ส่งต่อให้ทุก worker ปิดแบบ graceful
+
+    WORKERS=4 PORT=8000 python serve.py
+"""
+import gc
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+CPUS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+# ================= CONFIGURATION =================
+# ต้องตั้งก่อน import main / metrics (main อ่าน ONNX_THREADS, prometheus_client อ่าน PROMETHEUS_MULTIPROC_DIR ตอน import)
+WORKERS = int(os.environ.get("WORKERS", CPUS))
+os.environ.setdefault("ONNX_THREADS", str(max(1, CPUS // WORKERS)))
+PRELOAD_MODELS = os.environ.get("PRELOAD_MODELS", "auto")  # auto | 1 | 0
+FORK_CHECK_TIMEOUT_SECONDS = float(os.environ.get("FORK_CHECK_TIMEOUT_SECONDS", 60))
+WORKER_RESTART_DELAY_SECONDS = float(os.environ.get("WORKER_RESTART_DELAY_SECONDS", 1))
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", 8000))
+
+_metrics_dir = None
+if WORKERS > 1 and not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    _metrics_dir = tempfile.mkdtemp(prefix="kmutt-metrics-")
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = _metrics_dir
+
+import uvicorn
+
+import main
+import metrics
+
+logger = logging.getLogger("kmutt.serve")
+PROBE_QUERY = "warm-up query ลาป่วยใช้ฟอร์มอะไร"
+
+
+def fork_check(timeout):
+    """
+    fork process ทดลองแล้วเรียกโมเดลที่ preload ไว้ครบทุกตัว 1 ครั้ง คืน True ถ้าจบภายใน timeout
+    (ONNX Runtime ที่มี thread pool ก่อน fork จะรอ thread ที่ไม่มีอยู่จริงใน process ลูกไปตลอด)
+    """
+    pid = os.fork()
+    if pid == 0:
+        try:
+            embeddings, sparse_embeddings, reranker, _ = main.load_models()
+            embeddings.embed_query(PROBE_QUERY)
+            sparse_embeddings.embed_query(PROBE_QUERY)
+            if reranker is not None:
+                reranker.model.rerank(PROBE_QUERY, [PROBE_QUERY])
+        except BaseException:
+            os._exit(1)
+        os._exit(0)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            return os.waitstatus_to_exitcode(status) == 0
+        time.sleep(0.05)
+    os.kill(pid, signal.SIGKILL)
+    os.waitpid(pid, 0)
+    return False
+
+
+def preload():
+    """โหลดโมเดลใน master ก่อน fork คืน True ถ้า worker ใช้ชุดนี้ร่วมกันได้"""
+    threads = main.ONNX_THREADS
+    if PRELOAD_MODELS == "0" or (PRELOAD_MODELS == "auto" and threads != 1):
+        logger.info("📦 Each worker loads its own models (ONNX_THREADS=%s, PRELOAD_MODELS=%s)", threads, PRELOAD_MODELS)
+        return False
+    started = time.perf_counter()
+    main.load_models()
+    if not fork_check(FORK_CHECK_TIMEOUT_SECONDS):
+        logger.error("❌ Preloaded models do not work after fork, each worker loads its own models instead")
+        main.preloaded_models = None
+        gc.collect()
+        return False
+    logger.info("📦 Preloaded models in %.1fs, shared copy-on-write by %d workers", time.perf_counter() - started, WORKERS)
+    return True
+
+
+def _exit_worker(signum, frame):
+    raise SystemExit(0)
+
+
+def run_worker(config, sock):
+    """process ลูก: uvicorn server บน socket ของ master (ไม่กลับไปทำงานของ master ต่อ)"""
+    # uvicorn ส่ง signal ที่รับไว้ต่อให้ handler เดิมหลังปิด server เสร็จ จึงใช้ handler ที่จบด้วย SystemExit
+    # (SIG_DFL จะฆ่า process ก่อนถึง cleanup ข้างล่าง)
+    signal.signal(signal.SIGTERM, _exit_worker)
+    signal.signal(signal.SIGINT, _exit_worker)
+    code = 0
+    try:
+        uvicorn.Server(config).run(sockets=[sock])
+    except SystemExit as e:
+        code = e.code or 0
+    except BaseException:
+        logger.exception("❌ Worker %d crashed", os.getpid())
+        code = 1
+    finally:
+        # os._exit ข้าม atexit ที่ปกติจะปิด process ของ render pool ให้ (server ปิดแล้ว ไม่มีงานที่ต้องรอ)
+        for process in multiprocessing.active_children():
+            process.terminate()
+        logging.shutdown()
+        os._exit(code)
+
+
+def serve():
+    config = uvicorn.Config(main.app, host=HOST, port=PORT, log_level=main.LOG_LEVEL.lower())
+    sock = config.bind_socket()
+    shared = preload()
+    # ย้าย object ที่มีอยู่ทั้งหมดไป generation ถาวร GC ของ worker จะไม่ไปเขียน header ของ object เหล่านี้ (page ไม่ถูก copy)
+    gc.freeze()
+
+    workers = {}  # pid -> เวลาที่ start
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            run_worker(config, sock)
+        workers[pid] = time.monotonic()
+        logger.info("🚀 Worker %d started", pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info(
+        "🧵 %d workers x ONNX_THREADS=%s on %d CPUs (shared models: %s)", WORKERS, main.ONNX_THREADS, CPUS, shared,
+    )
+    for _ in range(WORKERS):
+        spawn()
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = workers.pop(pid, None)
+        if started is None:
+            continue
+        metrics.worker_exited(pid)
+        if stopping:
+            continue
+        logger.error("❌ Worker %d exited with code %d, restarting", pid, os.waitstatus_to_exitcode(status))
+        if time.monotonic() - started < 10:
+            time.sleep(WORKER_RESTART_DELAY_SECONDS)  # กัน worker ที่ตายตั้งแต่ start ถูก fork ซ้ำรัวๆ
+        if not stopping:
+            spawn()
+
+    sock.close()
+    if _metrics_dir is not None:
+        shutil.rmtree(_metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(serve())
@@ -0,0 +1,225 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+from context_builder import estimate_tokens
+from forms import match_forms
+
+
+def _clip(text, max_chars):
+    return text if len(text) <= max_chars else text[:max_chars] + "…"
+
+
+class SessionStore:
+    """
+    เก็บประวัติสนทนาต่อ session_id แบบกระชับ: turn ล่าสุดไม่เกิน max_turns (คำถาม/คำตอบถูกตัดความยาว)
+    turn ที่เก่ากว่านั้นถูกย่อเป็นบรรทัดเดียวใน summary (คำถาม + ฟอร์มที่อ้างอิง ไม่เรียก LLM เพิ่ม)
+    memory ต่อ session จึงมีเพดานตายตัว (~max_turns * (max_question_chars + max_reply_chars) + max_summary_chars)
+    ทั้ง store จำกัดด้วย LRU (max_sessions) + TTL นับจากการใช้งานล่าสุด
+    """
+
+    def __init__(
+        self,
+        max_sessions=10000,
+        ttl_seconds=1800,
+        max_turns=4,
+        max_question_chars=300,
+        max_reply_chars=800,
+        max_summary_chars=800,
+    ):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max_turns
+        self.max_question_chars = max_question_chars
+        self.max_reply_chars = max_reply_chars
+        self.max_summary_chars = max_summary_chars
+        self.evictions = 0
+        self.expirations = 0
+        self._sessions = OrderedDict()  # session_id -> (expires_at, session)
+        self._lock = threading.Lock()
+
+    # ---------- backend (memory) ----------
+
+    def _load(self, session_id, now):
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._sessions[session_id]
+            self.expirations += 1
+            return None
+        self._sessions.move_to_end(session_id)
+        return entry[1]
+
+    def _save(self, session_id, session, now):
+        self._sessions[session_id] = (now + self.ttl_seconds, session)
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def _delete(self, session_id):
+        return self._sessions.pop(session_id, None) is not None
+
+    def _count(self):
+        return len(self._sessions)
+
+    def _transaction(self):
+        # memory: self._lock พอแล้ว (ทุก worker มี store ของตัวเอง)
+        return nullcontext()
+
+    # ---------- API ----------
+
+    def get(self, session_id):
+        """คืน {"turns": [{"question", "reply", "sources"}], "summary": str} หรือ None ถ้ายังไม่มี/หมดอายุ"""
+        with self._lock:
+            return self._load(session_id, time.time())
+
+    def append(self, session_id, question, reply, sources):
+        """เพิ่ม turn ใหม่ turn ที่ล้น max_turns ถูกย่อลง summary (ตัดบรรทัดเก่าสุดทิ้งเมื่อเกิน max_summary_chars)"""
+        now = time.time()
+        with self._lock, self._transaction():
+            session = self._load(session_id, now) or {"turns": [], "summary": ""}
+            turns = session["turns"] + [{
+                "question": _clip(question, self.max_question_chars),
+                "reply": _clip(reply, self.max_reply_chars),
+                "sources": [source["doc"] for source in sources],
+            }]
+            lines = session["summary"].splitlines()
+            while len(turns) > self.max_turns:
+                old = turns.pop(0)
+                forms = f" (ฟอร์ม: {', '.join(old['sources'])})" if old["sources"] else ""
+                lines.append(f"- ถาม: {_clip(old['question'], 120)}{forms}")
+            while lines and sum(len(line) + 1 for line in lines) > self.max_summary_chars:
+                lines.pop(0)
+            self._save(session_id, {"turns": turns, "summary": "\n".join(lines)}, now)
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._delete(session_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": self._count(),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds,
+                "max_turns": self.max_turns,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    SessionStore ที่เก็บลงไฟล์ SQLite (อยู่รอดข้าม restart และใช้ร่วมกันได้หลาย worker บนเครื่องเดียว)
+    ลบ session ที่หมดอายุ/เกิน max_sessions ทุก cleanup_every ครั้งที่เขียน
+    connection ผูกกับ process: worker ที่ fork มาจาก serve.py จะเปิด connection ของตัวเองใหม่
+    """
+
+    def __init__(self, path, cleanup_every=100, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.cleanup_every = cleanup_every
+        self._writes = 0
+        self._connection, self._pid = None, None
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, expires_at REAL NOT NULL, data TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+
+    @property
+    def _db(self):
+        # ห้ามใช้ connection ของ SQLite ข้าม fork (lock / WAL state ของ process แม่)
+        # ตัวที่ได้มาจาก fork เก็บไว้เฉยๆ ไม่ close (close ใน process ลูกก็กระทบ lock ของแม่ได้)
+        if self._pid != os.getpid():
+            self._inherited = self._connection
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._pid = os.getpid()
+        return self._connection
+
+    def _load(self, session_id, now):
+        row = self._db.execute(
+            "SELECT data FROM sessions WHERE id = ? AND expires_at > ?", (session_id, now)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _save(self, session_id, session, now):
+        self._db.execute(
+            "INSERT OR REPLACE INTO sessions (id, expires_at, data) VALUES (?, ?, ?)",
+            (session_id, now + self.ttl_seconds, json.dumps(session, ensure_ascii=False)),
+        )
+        self._writes += 1
+        if self._writes % self.cleanup_every == 0:
+            self.expirations += self._db.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+            self.evictions += self._db.execute(
+                "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,),
+            ).rowcount
+
+    @contextmanager
+    def _transaction(self):
+        # read-modify-write ของ append ต้องอยู่ใน transaction เดียว: BEGIN IMMEDIATE จอง write lock ตั้งแต่ก่อนอ่าน
+        # worker อื่นที่ append session เดียวกันพร้อมกันจะรอ (timeout ของ connection) แทนที่จะเขียนทับ turn กัน
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _delete(self, session_id):
+        return self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+
+    def _count(self):
+        return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def stats(self):
+        return {**super().stats(), "backend": "sqlite", "path": self.path}
+
+
+def condense_query(session, message, max_ratio=1.5):
+    """
+    คำถามที่ใช้ค้น Vector DB: คำถามต่อเนื่องสั้นๆ ("แล้วต้องให้ใครเซ็น?") ไม่มีหัวข้ออยู่ในตัว
+    จึงเติมคำถามก่อนหน้าของ session ไว้ข้างหน้า เฉพาะเมื่อ
+    - ไม่พูดถึงฟอร์มใดเลย (ไม่มีรหัส/ชื่อ/keyword ของฟอร์ม) คำถามใหม่ที่มีหัวข้อของตัวเองใช้ตามเดิม
+    - ยาวไม่เกิน max_ratio เท่าของคำถามก่อนหน้า (คำถามยาวกว่านั้นถือว่าระบุครบแล้ว)
+    """
+    if not session or not session["turns"]:
+        return message
+    previous = session["turns"][-1]["question"]
+    strong_ids, weak_ids = match_forms(message)
+    if strong_ids or weak_ids or len(message) > max_ratio * len(previous):
+        return message
+    return f"{previous} {message}"
+
+
+def history_messages(session, token_budget):
+    """
+    ประวัติสำหรับส่ง LLM: turn ล่าสุดย้อนหลังไปเรื่อยๆ จนเต็ม token_budget แล้วจึงใส่ summary ถ้ายังพอ
+    คืน list ของ message (เรียงตามเวลา) ที่วางไว้ระหว่าง system prompt กับคำถามปัจจุบัน
+    """
+    if not session:
+        return []
+    messages, remaining = [], token_budget
+    for turn in reversed(session["turns"]):
+        tokens = estimate_tokens(turn["question"]) + estimate_tokens(turn["reply"])
+        if tokens > remaining:
+            break
+        remaining -= tokens
+        messages[:0] = [
+            {"role": "user", "content": turn["question"]},
+            {"role": "assistant", "content": turn["reply"]},
+        ]
+    if session["summary"] and estimate_tokens(session["summary"]) <= remaining:
+        messages.insert(0, {"role": "system", "content": f"สรุปบทสนทนาก่อนหน้า:\n{session['summary']}"})
+    return messages
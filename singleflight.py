@@ -0,0 +1,85 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+import metrics
+
+
+class SingleFlight:
+    """
+    รวม request ที่เหมือนกัน (key เดียวกัน) ที่เข้ามาระหว่างที่งานแรกยังทำอยู่ ให้รอผลจากงานเดียวกัน
+    ไม่เก็บผลไว้หลังงานเสร็จ (request ที่มาทีหลังจากนั้นเริ่มงานใหม่ จึงไม่ได้ข้อมูลเก่า)
+    error ของงานส่งต่อให้ทุก request ที่รออยู่
+    """
+
+    def __init__(self, name, enabled=True):
+        self.name = name
+        self.enabled = enabled
+        self.leaders = 0
+        self.merged = 0
+        self._calls = {}  # key -> Future (sync) หรือ Task (async)
+        self._lock = threading.Lock()
+
+    def _merge(self):
+        self.merged += 1
+        metrics.COALESCED_REQUESTS.labels(self.name).inc()
+
+    def run(self, key, fn):
+        """สำหรับ handler แบบ sync (เรียกจากหลาย thread)"""
+        if not self.enabled:
+            return fn()
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self._merge()
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def run_async(self, key, fn):
+        """
+        สำหรับ handler แบบ async (fn คืน coroutine) งานรันเป็น task แยก
+        client ของ request แรกตัดการเชื่อมต่อไปก็ไม่ยกเลิกงานของ request อื่นที่รออยู่
+        """
+        if not self.enabled:
+            return await fn()
+        with self._lock:
+            task = self._calls.get(key)
+            if task is None:
+                task = self._calls[key] = asyncio.ensure_future(fn())
+                task.add_done_callback(lambda done: self._done(key, done))
+                self.leaders += 1
+            else:
+                self._merge()
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        # ดึง exception ไว้เสมอ ถ้า request ทุกตัวที่รอถูกยกเลิกไปหมด ไม่มีใคร await task นี้
+        # asyncio จะ log "Task exception was never retrieved" ตอน task ถูกเก็บกวาด
+        if not task.cancelled():
+            task.exception()
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "leaders": self.leaders,
+                "merged": self.merged,
+                "in_flight": len(self._calls),
+            }
@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# main.py อ่าน env ตอน import: ไม่ต่อ Groq / Qdrant จริงระหว่างเทสต์
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ.setdefault("WARMUP_ON_STARTUP", "0")
@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+
+from answer_cache import AnswerCache
+from forms import form_topic
+
+
+def vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_exact_hit_and_lru_eviction():
+    cache = AnswerCache(max_entries=2)
+    cache.put("a", vector(1, 0), "A")
+    cache.put("b", vector(0, 1), "B")
+    assert cache.get("a") == "A"  # a ถูกใช้ล่าสุด b จึงถูกไล่ออกก่อน
+    cache.put("c", vector(1, 1), "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+
+
+def test_ttl_expires_entries(monkeypatch):
+    cache = AnswerCache(ttl_seconds=10)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    cache.put("a", vector(1, 0), "A")
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_version_change_clears_cache():
+    cache = AnswerCache()
+    assert cache.set_version("v1")
+    cache.put("a", vector(1, 0), "A")
+    assert not cache.set_version("v1")
+    assert cache.get("a") == "A"
+    assert cache.set_version("v2")
+    assert cache.get("a") is None
+
+
+def test_semantic_hits_are_off_by_default():
+    cache = AnswerCache()
+    cache.put("a", vector(1, 0), "A")
+    assert cache.get_similar("b", vector(1, 0)) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_semantic_hit_picks_the_closest_entry():
+    cache = AnswerCache(similarity_threshold=0.999)
+    cache.put("a", vector(1, 0), "A")
+    cache.put("b", vector(0.8, 0.6), "B")
+    cache.put("c", vector(0, 1), "C")
+    assert cache.get_similar("x", vector(1, 0.02)) == "A"
+    assert cache.get_similar("y", vector(0.5, 0.5)) is None
+    cache.put("d", vector(0.7, 0.7), "D")  # entry ใหม่หลังสร้าง matrix แล้วต้องถูกค้นเจอ
+    assert cache.get_similar("z", vector(0.5, 0.5)) == "D"
+    assert cache.stats()["semantic_hits"] == 2
+
+
+def test_semantic_hit_requires_the_same_forms():
+    cache = AnswerCache(similarity_threshold=0.9, topic_fn=form_topic)
+    cache.put("ขอลาออกต้องทำยังไง", vector(1, 0), "RO.13")
+    # embedding เหมือนกันแต่คนละฟอร์ม ต้องไม่ได้คำตอบของ RO.13
+    assert cache.get_similar("ลาป่วยต้องทำยังไง", vector(1, 0)) is None
+    assert cache.get_similar("ลาออกต้องยื่นอะไร", vector(1, 0)) == "RO.13"
+
+
+def test_semantic_hit_skips_evicted_entries():
+    cache = AnswerCache(max_entries=1, similarity_threshold=0.9)
+    cache.put("a", vector(1, 0), "A")
+    assert cache.get_similar("x", vector(1, 0)) == "A"
+    cache.put("b", vector(0, 1), "B")
+    assert cache.get_similar("x", vector(1, 0)) is None
+    cache.clear()
+    assert cache.get_similar("y", vector(0, 1)) is None
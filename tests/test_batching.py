@@ -0,0 +1,50 @@
+import threading
+
+import pytest
+
+from batching import MicroBatcher
+
+
+def test_batches_concurrent_items_in_order():
+    sizes = []
+
+    def double(items):
+        sizes.append(len(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, max_batch_size=8, max_wait_ms=50)
+    futures = [batcher.submit(i) for i in range(5)]
+    assert [future.result(timeout=5) for future in futures] == [0, 2, 4, 6, 8]
+    assert sum(sizes) == 5 and max(sizes) > 1
+    assert batcher.stats()["items"] == 5
+
+
+def test_disabled_batching_runs_inline():
+    threads = []
+
+    def record(items):
+        threads.append(threading.current_thread())
+        return items
+
+    batcher = MicroBatcher(record, max_batch_size=1)
+    assert batcher("a") == "a"
+    assert threads == [threading.current_thread()]
+
+
+def test_batch_fn_error_fails_every_future():
+    def fail(items):
+        raise RuntimeError("boom")
+
+    batcher = MicroBatcher(fail, max_batch_size=4, max_wait_ms=20)
+    futures = [batcher.submit(i) for i in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+
+
+def test_short_result_list_fails_every_future():
+    batcher = MicroBatcher(lambda items: items[:-1], max_batch_size=4, max_wait_ms=50)
+    futures = [batcher.submit(i) for i in range(3)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
@@ -0,0 +1,45 @@
+from langchain_core.documents import Document
+
+from context_builder import ContextBuilder, estimate_tokens
+
+
+def doc(text, source="a.pdf", index=None):
+    metadata = {"source": source}
+    if index is not None:
+        metadata["chunk_index"] = index
+    return Document(page_content=text, metadata=metadata)
+
+
+def test_estimate_tokens_counts_thai_denser_than_ascii():
+    assert estimate_tokens("abcdefgh") == 3
+    assert estimate_tokens("ลาป่วยนะ") == 5
+
+
+def test_near_duplicates_keep_the_better_ranked_chunk():
+    text = "คำร้องขอลาป่วย/ลากิจ ยื่นเอกสารต่ออาจารย์ผู้สอนรายวิชา"
+    builder = ContextBuilder()
+    context, used = builder.build([doc(text, "pdf"), doc(text + " ", "summary"), doc("ใบมอบฉันทะ RO.04", "summary")])
+    assert [d.metadata["source"] for d in used] == ["pdf", "summary"]
+    assert context.count("ลาป่วย") == 1
+
+
+def test_adjacent_chunks_are_merged_without_the_overlap():
+    docs = [doc("step two and step three", index=1), doc("intro then step two", index=0), doc("other", "b.pdf", 0)]
+    context, used = ContextBuilder().build(docs)
+    assert context == "intro then step two and step three\n\nother\n\n"
+    assert [d.metadata.get("chunk_index") for d in used] == [0, 1, 0]
+
+
+def test_budget_skips_blocks_that_do_not_fit():
+    builder = ContextBuilder(token_budget=20)
+    context, used = builder.build([doc("x" * 40, "a.pdf"), doc("y" * 200, "b.pdf"), doc("z" * 8, "c.pdf")])
+    assert [d.metadata["source"] for d in used] == ["a.pdf", "c.pdf"]
+    assert "y" not in context
+    stats = builder.stats()
+    assert stats["requests"] == 1 and stats["tokens_out"] == 16 and stats["tokens_saved"] == 52
+
+
+def test_oversized_first_block_is_truncated_to_the_budget():
+    context, used = ContextBuilder(token_budget=10).build([doc("x" * 80, "a.pdf"), doc("z" * 8, "c.pdf")])
+    assert len(used) == 1
+    assert context == "x" * 36 + "\n\n"
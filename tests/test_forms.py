@@ -0,0 +1,67 @@
+from forms import FORM_CARDS, FormMatcher, build_form_card, detect_single_form, form_fast_answer, match_forms, parse_summary_sections
+
+
+def test_fast_answer_includes_steps_and_conditions():
+    reply = form_fast_answer("ขอแบบฟอร์ม RO.13")["reply"]
+    assert " - ขั้นตอน/เงื่อนไข: นักศึกษาต้องตรวจสอบและจัดการภาระหนี้สิน" in reply
+
+
+def test_multiline_fields_keep_their_continuation_lines():
+    card = FORM_CARDS["RO.12"]
+    assert "   2. ติดตามผล:" in card
+    assert "   o ระดับปริญญาตรี: 800 บาท/ภาคการศึกษา" in card
+    assert card.index("ขั้นตอน/เงื่อนไข") < card.index("การอนุมัติ") < card.index("หมายเหตุ")
+
+
+def test_parse_summary_sections_stops_at_separator():
+    sections = parse_summary_sections(
+        "1.1 คำร้องทดสอบ (สทน. 99 / RO.99)\n"
+        "• ขั้นตอน:\n1. ยื่น\n2. รอ\n"
+        "-----\n"
+        "ข้อความอื่น\n"
+    )
+    assert sections == {"RO.99": [{"title": "คำร้องทดสอบ (สทน. 99 / RO.99)", "ขั้นตอน": "1. ยื่น\n2. รอ"}]}
+
+
+def test_form_card_merges_every_section_of_a_form():
+    sections = parse_summary_sections(
+        "1.1 คำร้องเพิ่มรายวิชา (ส่วนหนึ่งของ สทน. 99 / RO.99)\n"
+        "• ช่องทาง: New ACIS\n"
+        "-----\n"
+        "1.2 คำร้องถอนรายวิชา (ส่วนหนึ่งของ สทน. 99 / RO.99)\n"
+        "• ช่องทาง: ยื่นที่สำนักงาน\n"
+    )
+    card = build_form_card({"id": "RO.99", "name": "ทดสอบ", "url": "https://example.test/ro99.pdf"}, sections["RO.99"])
+    assert card.index("คำร้องเพิ่มรายวิชา") < card.index("New ACIS") < card.index("คำร้องถอนรายวิชา")
+    assert card.count("ดาวน์โหลดแบบฟอร์ม") == 1
+
+
+def test_partial_form_summary_skips_fast_answer():
+    # SUMMARY_TEXT ของ RO.26 มีแต่การถอน W คำถามเรื่องเพิ่มวิชาต้องไปที่ RAG
+    assert detect_single_form("ro26 เพิ่มวิชา") == "RO.26"
+    assert form_fast_answer("ro26 เพิ่มวิชา") is None
+    assert form_fast_answer("ขอแบบฟอร์ม RO.12") is not None
+
+
+def test_form_matcher_finds_every_pattern_in_one_pass():
+    # ภาษาไทยไม่เช็คขอบคำ pattern ที่ซ้อนกันเจอครบทุกตัว
+    matcher = FormMatcher({"ลา": ("A", False), "ลาป่วย": ("B", True), "ป่วย": ("C", False)})
+    assert sorted(matcher.find("ขอลาป่วยครับ")) == [("ป่วย", ("C", False)), ("ลา", ("A", False)), ("ลาป่วย", ("B", True))]
+
+
+def test_form_matcher_skips_codes_inside_ascii_words():
+    matcher = FormMatcher({"ro16": ("RO.16", True)})
+    assert matcher.find("ขอro16ครับ") == [("ro16", ("RO.16", True))]
+    assert matcher.find("pro16x") == []
+
+
+def test_match_forms_separates_strong_and_weak_mentions():
+    assert match_forms("สทน. 16 ต้องยื่นที่ไหน") == ({"RO.16"}, set())
+    assert match_forms("อยากลาออก") == (set(), {"RO.13"})
+
+
+def test_detect_single_form_requires_one_unambiguous_form():
+    assert detect_single_form("ขอฟอร์ม ro-16") == "RO.16"
+    assert detect_single_form("ro16 กับ ro13 ต่างกันยังไง") is None
+    assert detect_single_form("ro16 แล้วถ้าจะลาออกล่ะ") is None
+    assert form_fast_answer("ลาออกต้องทำยังไง") is None
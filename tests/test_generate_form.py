@@ -0,0 +1,62 @@
+import pymupdf
+import pytest
+from fastapi.testclient import TestClient
+
+import form_pdf
+import main
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+FORM = {"formType": "RO.16", "studentId": "64070500001", "name": "ทดสอบ ระบบ"}
+
+
+def test_pdf_works_without_configured_font(client, monkeypatch):
+    monkeypatch.setattr(form_pdf, "PDF_THAI_FONT", "fonts/missing.ttf")
+    response = client.post("/generate-form?format=pdf", json=FORM)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/pdf"
+    with pymupdf.open("pdf", response.content) as pdf:
+        assert "ทดสอบ ระบบ" in pdf[0].get_text()
+
+
+def test_system_thai_font_is_used_before_builtin(monkeypatch, tmp_path):
+    path = tmp_path / "NotoSerifThai.otf"
+    path.write_bytes(pymupdf.Font(script=pymupdf.UCDN_SCRIPT_THAI).buffer)
+    monkeypatch.setattr(form_pdf, "PDF_THAI_FONT", "fonts/missing.ttf")
+    monkeypatch.setattr(form_pdf, "SYSTEM_THAI_FONTS", ("/nonexistent/Garuda.ttf", str(path)))
+    monkeypatch.setattr(form_pdf, "_fonts", {})
+    assert form_pdf.font_path() == str(path)
+    assert form_pdf.get_font().has_glyph(ord("ก"))
+
+
+def test_pdf_without_any_thai_font_is_unavailable_not_500(client, monkeypatch):
+    monkeypatch.setattr(form_pdf, "PDF_THAI_FONT", "fonts/missing.ttf")
+    monkeypatch.setattr(form_pdf, "SYSTEM_THAI_FONTS", ())
+    monkeypatch.setattr(form_pdf, "_fontconfig_thai_fonts", lambda: ())
+    monkeypatch.setattr(form_pdf, "_builtin_thai_font", lambda: None)
+    monkeypatch.setattr(form_pdf, "_fonts", {})
+    response = client.post("/generate-form?format=pdf", json=FORM)
+    assert response.status_code == 503
+    assert "format=docx" in response.json()["detail"]
+
+    response = client.post("/generate-form/batch?format=pdf", json={**FORM, "rows": [FORM]})
+    assert response.status_code == 503
+
+
+def test_unknown_format_is_rejected(client):
+    assert client.post("/generate-form?format=odt", json=FORM).status_code == 400
+
+
+@pytest.mark.parametrize("body", [
+    b"[1, 2, 3]",
+    b"{not json",
+    b'{"formType": "RO.16", "rows": "abc"}',
+    b'{"formType": "RO.16", "rows": [1, "x"]}',
+])
+def test_batch_rejects_malformed_json_body(client, body):
+    response = client.post("/generate-form/batch", content=body, headers={"content-type": "application/json"})
+    assert response.status_code == 400
@@ -0,0 +1,82 @@
+import asyncio
+from types import SimpleNamespace
+
+import groq
+import httpx
+import pytest
+
+from llm_gateway import LLMGateway, LLMOverloaded, TokenBucket
+
+MESSAGES = [{"role": "user", "content": "ลาป่วยใช้ฟอร์มอะไร"}]
+
+
+def rate_limited():
+    request = httpx.Request("POST", "http://llm.test/chat/completions")
+    return groq.RateLimitError("rate limited", response=httpx.Response(429, request=request), body=None)
+
+
+def response(text):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=None)
+
+
+def make_gateway(monkeypatch, failures, **kwargs):
+    """gateway ที่ _create / _acreate ล้มเหลว failures ครั้งแรกแล้วตอบ "ok" คืน (gateway, รายชื่อ model ที่ถูกเรียก)"""
+    options = {"requests_per_minute": 600, "tokens_per_minute": 600000, "max_retries": 2, "backoff_base": 0}
+    gateway = LLMGateway(api_key="test", model="main", **{**options, **kwargs})
+    calls = []
+
+    def create(model, messages, **_):
+        calls.append(model)
+        if len(calls) <= failures:
+            raise rate_limited()
+        return response("ok")
+
+    async def acreate(model, messages, **kwargs):
+        return create(model, messages, **kwargs)
+
+    monkeypatch.setattr(gateway, "_create", create)
+    monkeypatch.setattr(gateway, "_acreate", acreate)
+    return gateway, calls
+
+
+def test_token_bucket_queues_and_refills(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("llm_gateway.time.monotonic", lambda: now[0])
+    bucket = TokenBucket(60, capacity=2)  # 1 token ต่อวินาที
+    assert bucket.reserve(1, max_wait=0) == 0
+    assert bucket.reserve(1, max_wait=0) == 0
+    assert bucket.reserve(1, max_wait=0.5) is None  # ต้องรอ 1 วินาที: ไม่จอง
+    assert bucket.reserve(1, max_wait=5) == pytest.approx(1)
+    assert bucket.wait_time(1) == pytest.approx(2)  # ต่อคิวหลังตัวที่จองไว้
+    now[0] += 3
+    assert bucket.wait_time(1) == 0
+    assert bucket.reserve(10, max_wait=0) == 0  # ขอเกิน capacity นับเท่ากับ capacity
+
+
+def test_hedge_pool_only_exists_when_hedging():
+    assert LLMGateway(api_key="test", model="main")._hedge_pool is None
+    assert LLMGateway(api_key="test", model="main", hedge_after_ms=200)._hedge_pool is not None
+
+
+def test_retries_and_fallback_reserve_quota(monkeypatch):
+    gateway, calls = make_gateway(monkeypatch, failures=3, fallback_model="backup")
+    assert gateway.complete(MESSAGES) == "ok"
+    assert calls == ["main", "main", "main", "backup"]
+    # ทุกครั้งที่ยิงจอง 1 request (bucket เติมระหว่าง test ได้เล็กน้อย)
+    assert gateway.request_bucket.capacity - gateway.request_bucket._tokens == pytest.approx(4, abs=0.1)
+    assert gateway.stats()["pending"] == 0
+
+
+def test_retry_without_quota_raises_overloaded(monkeypatch):
+    gateway, calls = make_gateway(monkeypatch, failures=5, requests_per_minute=2, max_queue_wait=0.5)
+    with pytest.raises(LLMOverloaded):
+        gateway.complete(MESSAGES)
+    assert calls == ["main", "main"]  # retry ครั้งที่ 2 ต้องรอ quota ~30 วินาที จึงไม่ยิง
+    assert gateway.stats()["pending"] == 0
+
+
+def test_async_retry_without_quota_raises_overloaded(monkeypatch):
+    gateway, calls = make_gateway(monkeypatch, failures=5, requests_per_minute=2, max_queue_wait=0.5)
+    with pytest.raises(LLMOverloaded):
+        asyncio.run(gateway.acomplete(MESSAGES))
+    assert calls == ["main", "main"]
@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient, models
+
+from local_index import LocalIndex, write_snapshot
+
+DIM = 8
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = np.random.default_rng(0)
+    dense = rng.normal(size=(40, DIM)).astype(np.float32)
+    sparse = []
+    for _ in range(40):
+        indices = sorted(rng.choice(30, size=4, replace=False).tolist())
+        sparse.append((indices, rng.uniform(0.1, 2.0, size=4).tolist()))
+    payloads = [{"page_content": f"chunk {i}", "metadata": {"chunk_index": i}} for i in range(40)]
+    return payloads, dense, sparse
+
+
+@pytest.fixture(scope="module")
+def local_index(corpus, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("snapshot") / "index")
+    write_snapshot(path, *corpus, {"collection": "test", "ingest_version": "v1"})
+    return LocalIndex(path)
+
+
+@pytest.fixture(scope="module")
+def qdrant(corpus):
+    payloads, dense, sparse = corpus
+    client = QdrantClient(":memory:")
+    client.create_collection(
+        "test",
+        vectors_config={"dense_vector": models.VectorParams(size=DIM, distance=models.Distance.COSINE)},
+        sparse_vectors_config={"sparse_vector": models.SparseVectorParams()},
+    )
+    client.upsert("test", [
+        models.PointStruct(id=i, payload=payloads[i], vector={
+            "dense_vector": dense[i].tolist(),
+            "sparse_vector": models.SparseVector(indices=sparse[i][0], values=sparse[i][1]),
+        })
+        for i in range(len(payloads))
+    ])
+    return client
+
+
+def test_snapshot_round_trip(local_index, corpus):
+    assert len(local_index) == 40
+    assert local_index.version == "snapshot:test@v1"
+    assert local_index.payloads[3] == corpus[0][3]
+    assert np.allclose(np.linalg.norm(local_index.dense, axis=1), 1)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_hybrid_search_matches_qdrant_rrf(local_index, qdrant, seed):
+    rng = np.random.default_rng(100 + seed)
+    dense = rng.normal(size=DIM).astype(np.float32).tolist()
+    sparse = SimpleNamespace(indices=sorted(rng.choice(30, size=3, replace=False).tolist()), values=[1.0, 0.5, 0.25])
+    k = 5
+    response = qdrant.query_points(
+        "test",
+        prefetch=[
+            models.Prefetch(using="dense_vector", query=dense, limit=k),
+            models.Prefetch(using="sparse_vector", query=models.SparseVector(
+                indices=sparse.indices, values=sparse.values), limit=k),
+        ],
+        query=models.FusionQuery(fusion=models.Fusion.RRF),
+        limit=2 * k,
+    )
+    expected = {point.payload["metadata"]["chunk_index"]: point.score for point in response.points}
+    [found] = local_index.search_batch([(dense, sparse, k)])
+    indices = [payload["metadata"]["chunk_index"] for payload in found]
+    # คะแนน RRF เท่ากันได้ (อันดับเดียวกันคนละ list) จึงเทียบคะแนนตามลำดับ ไม่เทียบ id ตรงๆ ที่อันดับเสมอกัน
+    assert [expected[i] for i in indices] == pytest.approx(sorted(expected.values(), reverse=True)[:k])
+
+
+def test_empty_batch(local_index):
+    assert local_index.search_batch([]) == []
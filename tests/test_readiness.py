@@ -0,0 +1,21 @@
+import threading
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+def test_lazy_load_marks_server_ready(monkeypatch):
+    monkeypatch.setattr(main, "WARMUP_ON_STARTUP", False)
+    monkeypatch.setattr(main, "VECTOR_BACKEND", "numpy")
+    monkeypatch.setattr(main, "rag_ready", threading.Event())
+    monkeypatch.setattr(main, "vector_store_instance", None)
+    monkeypatch.setattr(main, "groq_client_instance", None)
+    monkeypatch.setattr(main, "load_models", lambda: (SimpleNamespace(), SimpleNamespace(), None, SimpleNamespace()))
+    client = TestClient(main.app)
+
+    assert client.get("/readyz").json() == {"status": "warming_up"}
+    main.get_rag_system()
+    response = client.get("/readyz")
+    assert response.status_code == 200 and response.json() == {"status": "ready"}
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from sessions import SessionStore, SqliteSessionStore, condense_query
+
+SOURCES = [{"doc": "RO.16 คำร้องขอลาป่วย/ลากิจ"}]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            return SessionStore(**kwargs)
+        return SqliteSessionStore(str(tmp_path / "sessions.db"), cleanup_every=1, **kwargs)
+    return make
+
+
+def test_old_turns_are_folded_into_the_summary(make_store):
+    store = make_store(max_turns=2, max_question_chars=10)
+    for i in range(4):
+        store.append("s", f"question {i} is longer than ten chars", "คำตอบ", SOURCES if i == 0 else [])
+    session = store.get("s")
+    assert [turn["question"] for turn in session["turns"]] == ["question 2…", "question 3…"]
+    assert session["summary"] == "- ถาม: question 0… (ฟอร์ม: RO.16 คำร้องขอลาป่วย/ลากิจ)\n- ถาม: question 1…"
+
+
+def test_least_recently_used_sessions_are_evicted(make_store, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    store = make_store(max_sessions=2)
+    for session_id in ("a", "b", "c"):
+        now[0] += 1
+        store.append(session_id, "ลาป่วยใช้ฟอร์มอะไร", "RO.16", SOURCES)
+        if session_id == "b":
+            now[0] += 1
+            store.append("a", "แล้วต้องให้ใครเซ็น?", "อาจารย์ที่ปรึกษา", [])  # a ถูกใช้หลัง b
+    assert store.get("b") is None
+    assert store.get("a") is not None and store.get("c") is not None
+    assert store.stats()["evictions"] == 1 and store.stats()["sessions"] == 2
+
+
+def test_sessions_expire_after_ttl(make_store, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    store = make_store(ttl_seconds=60)
+    store.append("s", "ลาป่วยใช้ฟอร์มอะไร", "RO.16", SOURCES)
+    now[0] += 59
+    assert store.get("s") is not None
+    now[0] += 2
+    assert store.get("s") is None
+    assert store.delete("s") is (store.stats()["backend"] == "sqlite")  # memory ลบไปแล้วตอน get
+
+
+def test_sqlite_append_keeps_every_turn_across_workers(tmp_path):
+    # store คนละตัวบนไฟล์เดียวกันแทน worker คนละ process ที่ append session เดียวกันพร้อมกัน
+    path = str(tmp_path / "sessions.db")
+    stores = [SqliteSessionStore(path, max_turns=200) for _ in range(2)]
+
+    def worker(store, prefix):
+        for i in range(25):
+            store.append("s", f"{prefix}-{i}", "ok", [])
+
+    threads = [threading.Thread(target=worker, args=(store, f"{n}-{k}")) for n, store in enumerate(stores) for k in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(stores[0].get("s")["turns"]) == 100
+
+
+def session_with(question):
+    return {"turns": [{"question": question, "reply": "ใช้แบบฟอร์ม RO.16", "sources": ["RO.16"]}], "summary": ""}
+
+
+def test_follow_up_without_topic_is_condensed():
+    session = session_with("ลาป่วยใช้ฟอร์มอะไร")
+    assert condense_query(session, "แล้วต้องให้ใครเซ็น?") == "ลาป่วยใช้ฟอร์มอะไร แล้วต้องให้ใครเซ็น?"
+
+
+@pytest.mark.parametrize("message", ["ขอลาป่วยใช้ฟอร์มอะไร", "ถ้าจะลาออกต้องทำยังไง", "RO.13 ยื่นที่ไหน"])
+def test_new_question_with_its_own_topic_is_not_condensed(message):
+    assert condense_query(session_with("ขอคืนเงินค่าลงทะเบียนได้ไหม"), message) == message
+
+
+def test_long_question_relative_to_previous_is_not_condensed():
+    message = "อยากทราบว่าถ้าสอบไม่ผ่านแล้วต้องลงทะเบียนเรียนซ้ำ ต้องติดต่อที่ไหนบ้าง"
+    assert condense_query(session_with("ลาป่วยใช้ฟอร์มอะไร"), message) == message
+
+
+def test_no_history_returns_message():
+    assert condense_query(None, "แล้วต้องให้ใครเซ็น?") == "แล้วต้องให้ใครเซ็น?"
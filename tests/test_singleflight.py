@@ -0,0 +1,67 @@
+import asyncio
+import gc
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_run_merges_concurrent_calls():
+    flight = SingleFlight("test")
+    calls = []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.1)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.run("k", work))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["result"] * 4
+    assert len(calls) == 1
+    assert flight.stats() == {"enabled": True, "leaders": 1, "merged": 3, "in_flight": 0}
+
+
+def test_run_async_shares_result_and_error():
+    flight = SingleFlight("test")
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.run_async("k", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert await flight.run_async("k", lambda: asyncio.sleep(0, "fresh")) == "fresh"
+
+    asyncio.run(scenario())
+    assert flight.stats()["leaders"] == 2 and flight.stats()["in_flight"] == 0
+
+
+def test_leader_error_is_retrieved_when_all_waiters_are_cancelled():
+    flight = SingleFlight("test")
+    unretrieved = []
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def scenario():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: unretrieved.append(context))
+        waiter = asyncio.ensure_future(flight.run_async("k", fail))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0.05)  # งานของ leader ยังรันต่อจนจบ
+        assert flight.stats()["in_flight"] == 0
+        gc.collect()
+
+    asyncio.run(scenario())
+    assert unretrieved == []
@@ -0,0 +1,68 @@
+import re
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from thai_text import WORD_BOUNDARY, ThaiSparseEmbeddings, mark_word_boundaries, segment, sparse_text
+
+
+def bm25_tokens(text):
+    # tokenizer ของ Qdrant/bm25 ตัดด้วย [^\w]
+    return re.findall(r"\w+", text)
+
+
+def test_segment_uses_domain_words():
+    assert segment("ลาป่วยใช้ฟอร์มอะไร") == ["ลาป่วย", "ใช้", "ฟอร์ม", "อะไร"]
+    assert "สทน" in segment("ยื่นสทนที่ไหน")
+
+
+def test_mark_word_boundaries_only_touches_thai():
+    marked = mark_word_boundaries("ลาป่วยใช้ฟอร์ม RO.16")
+    assert marked == WORD_BOUNDARY.join(["ลาป่วย", "ใช้", "ฟอร์ม"]) + " RO.16"
+
+
+def test_sparse_text_keeps_each_thai_word_as_one_token():
+    tokens = bm25_tokens(sparse_text("ลาป่วยใช้ฟอร์มอะไร RO.16"))
+    # "ใช้" / "อะไร" เป็น stopword, วรรณยุกต์ไม่แยกคำ "ลาป่วย" ออกเป็นสองส่วน
+    assert len(tokens) == 4 and tokens[-2:] == ["RO", "16"]
+    assert tokens[0] == sparse_text("ลาป่วย").strip()
+    assert all("\u0e00" > ch or ch > "\u0e7f" for ch in tokens[0])
+
+
+def test_sparse_text_matches_between_document_and_query():
+    document = set(bm25_tokens(sparse_text("คำร้องขอลาป่วย/ลากิจ ยื่นต่ออาจารย์ผู้สอน")))
+    query = set(bm25_tokens(sparse_text("ขอลาป่วยต้องยื่นที่ไหน")))
+    assert sparse_text("ลาป่วย").strip() in document
+    assert query & document
+
+
+class EchoSparse:
+    def embed_query(self, text):
+        return text
+
+    def embed_documents(self, texts):
+        return texts
+
+
+def collection_info(metadata):
+    return SimpleNamespace(config=SimpleNamespace(metadata=metadata))
+
+
+def test_thai_sparse_embeddings_can_pass_text_through():
+    sparse = ThaiSparseEmbeddings(EchoSparse(), thai_segmentation=False)
+    assert sparse.embed_query("ลาป่วย") == "ลาป่วย" and sparse.tokenizer == "whitespace"
+    sparse.thai_segmentation = True
+    assert sparse.embed_query("ลาป่วย") == sparse_text("ลาป่วย") and sparse.tokenizer == "thai-newmm"
+
+
+@pytest.mark.parametrize("metadata, tokenizer", [
+    (None, "whitespace"),  # collection ก่อนมี metadata นี้
+    ({"ingest_version": "v1"}, "whitespace"),
+    ({"sparse_tokenizer": "whitespace"}, "whitespace"),
+    ({"sparse_tokenizer": "thai-newmm"}, "thai-newmm"),
+])
+def test_queries_use_the_tokenizer_the_collection_was_indexed_with(metadata, tokenizer):
+    sparse = ThaiSparseEmbeddings(EchoSparse(), thai_segmentation=True)
+    main.use_collection_tokenizer(sparse, "kmutt_forms_v1", collection_info(metadata))
+    assert sparse.tokenizer == tokenizer
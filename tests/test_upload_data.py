@@ -0,0 +1,139 @@
+import hashlib
+import threading
+import time
+from types import SimpleNamespace
+
+import pymupdf
+import pytest
+from langchain_core.documents import Document
+from qdrant_client import QdrantClient
+
+import upload_data
+
+
+class FakeDense:
+    def embed_documents(self, texts):
+        return [[(int(hashlib.md5(t.encode()).hexdigest()[:8], 16) % 97 + 1) / 97] + [0.1] * 383 for t in texts]
+
+
+class FakeSparse:
+    def embed_documents(self, texts):
+        return [SimpleNamespace(indices=[len(t) % 1000], values=[1.0]) for t in texts]
+
+
+VECTOR_STORE = SimpleNamespace(embeddings=FakeDense(), sparse_embeddings=FakeSparse())
+
+
+@pytest.fixture
+def client():
+    client = QdrantClient(":memory:")
+    upload_data.create_collection(client, "test")
+    return client
+
+
+def source_chunks(source, texts):
+    docs = [Document(page_content="\n".join(texts), metadata={"file": source, "source": source})]
+    chunks = [Document(page_content=text, metadata={"file": source, "source": source}) for text in texts]
+    return source, upload_data.finalize_chunks(docs, chunks)
+
+
+def stored(client):
+    points, _ = client.scroll("test", limit=100, with_payload=True)
+    return {point.payload["page_content"]: point.payload["metadata"] for point in points}
+
+
+def sync(client, *sources, prune_missing=True):
+    return upload_data.sync_collection(client, "test", VECTOR_STORE, iter(sources), prune_missing=prune_missing)
+
+
+def test_reorder_refreshes_metadata_without_reembedding(client):
+    sync(client, source_chunks("a.pdf", ["chunk one", "chunk two", "chunk three"]))
+    stats = sync(client, source_chunks("a.pdf", ["chunk three", "chunk one", "chunk two"]))
+
+    assert stats["upserted"] == 0 and stats["deleted"] == 0 and stats["refreshed"] == 3
+    payloads = stored(client)
+    assert {text: meta["chunk_index"] for text, meta in payloads.items()} == {
+        "chunk three": 0, "chunk one": 1, "chunk two": 2,
+    }
+    assert len({meta["source_hash"] for meta in payloads.values()}) == 1
+
+
+def test_inserted_chunk_shifts_index_of_following_chunks(client):
+    sync(client, source_chunks("a.pdf", ["first", "second"]))
+    stats = sync(client, source_chunks("a.pdf", ["new head", "first", "second"]))
+
+    assert stats["upserted"] == 1 and stats["refreshed"] == 2
+    assert [stored(client)[text]["chunk_index"] for text in ("new head", "first", "second")] == [0, 1, 2]
+
+
+def test_unchanged_source_is_not_rewritten(client):
+    sync(client, source_chunks("a.pdf", ["one", "two"]))
+    stats = sync(client, source_chunks("a.pdf", ["one", "two"]))
+    assert stats == {"chunks": 2, "upserted": 0, "refreshed": 0, "deleted": 0, "failed": []}
+
+
+def test_missing_source_removed_only_when_pruning(client):
+    sync(client, source_chunks("a.pdf", ["alpha"]), source_chunks("b.pdf", ["beta"]))
+
+    sync(client, source_chunks("a.pdf", ["alpha"]), prune_missing=False)
+    assert set(stored(client)) == {"alpha", "beta"}
+
+    stats = sync(client, source_chunks("a.pdf", ["alpha"]))
+    assert stats["deleted"] == 1 and set(stored(client)) == {"alpha"}
+
+
+def test_incremental_with_source_keeps_other_documents(client, monkeypatch):
+    sync(client, source_chunks("a.pdf", ["alpha"]), source_chunks("b.pdf", ["beta"]))
+    client.update_collection("test", metadata={"sparse_tokenizer": upload_data.SPARSE_TOKENIZER})
+    monkeypatch.setattr(upload_data, "COLLECTION_NAME", "test")
+    monkeypatch.setattr(upload_data, "make_vector_store", lambda client, name: VECTOR_STORE)
+    monkeypatch.setattr(upload_data, "iter_sources", lambda splitter, sources: iter([source_chunks("a.pdf", ["alpha 2"])]))
+
+    upload_data.incremental(client, ["a.pdf"])
+    assert set(stored(client)) == {"alpha 2", "beta"}
+
+
+def test_failed_source_is_kept_and_reported(client):
+    sync(client, source_chunks("a.pdf", ["alpha"]), source_chunks("b.pdf", ["beta"]))
+    stats = sync(client, source_chunks("a.pdf", ["alpha"]), ("b.pdf", None))
+
+    assert stats["failed"] == ["b.pdf"] and stats["deleted"] == 0
+    assert set(stored(client)) == {"alpha", "beta"}
+
+
+def test_rebuild_with_failed_source_keeps_alias(client, monkeypatch):
+    monkeypatch.setattr(upload_data, "make_vector_store", lambda client, name: VECTOR_STORE)
+    monkeypatch.setattr(upload_data, "iter_sources", lambda splitter, sources: iter([
+        source_chunks("a.pdf", ["alpha"]), ("b.pdf", None),
+    ]))
+    before = {collection.name for collection in client.get_collections().collections}
+
+    with pytest.raises(RuntimeError, match="b.pdf"):
+        upload_data.rebuild(client)
+    assert upload_data.resolve_alias(client) is None
+    assert {collection.name for collection in client.get_collections().collections} == before
+
+
+def test_iter_pdfs_bounds_files_in_flight(monkeypatch):
+    pdf = pymupdf.open()
+    pdf.new_page().insert_text((72, 72), "hello")
+    data = pdf.tobytes()
+    started, yielded, peaks = [], [], []
+    lock = threading.Lock()
+
+    def read_source(session, source):
+        with lock:
+            started.append(source)
+            peaks.append(len(started) - len(yielded))
+        return data, False
+
+    monkeypatch.setattr(upload_data, "read_source", read_source)
+    sources = [f"doc{i}.pdf" for i in range(12)]
+    for source, docs in upload_data.iter_pdfs(sources, max_in_flight=3):
+        assert docs[0].page_content.strip() == "hello"
+        time.sleep(0.01)  # consumer ช้ากว่า download: ถ้าไม่จำกัด ทุกไฟล์จะถูกโหลดค้างไว้
+        with lock:
+            yielded.append(source)
+
+    assert sorted(yielded) == sorted(sources)
+    assert max(peaks) <= 3
@@ -0,0 +1,112 @@
+import re
+import threading
+from functools import lru_cache
+
+from langchain_qdrant.sparse_embeddings import SparseEmbeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from pythainlp.corpus import thai_stopwords, thai_words
+from pythainlp.tokenize import word_tokenize
+from pythainlp.util import dict_trie
+
+THAI_RE = re.compile(r"[\u0e00-\u0e7f]+")
+# คั่นคำไทยระหว่างตัด chunk (ไม่ใช่ whitespace จึงไม่ถูก strip และถูกลบออกหลังตัดเสร็จ)
+WORD_BOUNDARY = "\u200b"
+# tokenizer ของ Qdrant/bm25 (fastembed) ตัดคำด้วย [^\w] ซึ่งสระ/วรรณยุกต์ไทย (ั ิ ่ ้ ...) ไม่ใช่ \w
+# "ลาป่วย" จึงกลายเป็น "ลาป" + "วย" → เลื่อนรหัสอักษรไทยทั้งคำไปยังช่วง CJK (ทุกตัวเป็น \w และไม่ถูก stem)
+# ให้แต่ละคำไทยเป็น token เดียวใน BM25 (แปลงกลับได้ ไม่มีการชนกันของคำ)
+_SPARSE_SHIFT = 0x4E00 - 0x0E00
+_SPARSE_TABLE = {code: code + _SPARSE_SHIFT for code in range(0x0E00, 0x0E80)}
+_SKIP_TOKENS = {"ๆ", "ฯ"}
+# คำเฉพาะ/คำทับศัพท์ที่พจนานุกรม pythainlp ไม่มี (ใส่เฉพาะคำเดี่ยว คำประสมยาวๆ จะทำให้ค้นด้วยคำย่อยไม่เจอ)
+DOMAIN_WORDS = {"สทน", "มจธ", "ดรอป", "เซค", "แอด"}
+
+_trie_lock = threading.Lock()
+_trie = None
+
+
+def get_trie():
+    """Trie ของพจนานุกรม pythainlp + DOMAIN_WORDS สร้างครั้งเดียวต่อ process (~0.5s)"""
+    global _trie
+    if _trie is None:
+        with _trie_lock:
+            if _trie is None:
+                _trie = dict_trie(set(thai_words()) | DOMAIN_WORDS)
+    return _trie
+
+
+def segment(text):
+    """ตัดคำไทยแบบ dictionary (newmm, maximal matching) คืน list ของคำ (ไม่รวมช่องว่าง)"""
+    return word_tokenize(text, custom_dict=get_trie(), engine="newmm", keep_whitespace=False)
+
+
+def mark_word_boundaries(text):
+    """แทรก WORD_BOUNDARY ระหว่างคำไทย ให้ text splitter ตัดที่ขอบคำได้แทนการตัดกลางคำ"""
+    return THAI_RE.sub(lambda match: WORD_BOUNDARY.join(segment(match.group())), text)
+
+
+def sparse_text(text):
+    """
+    แปลงข้อความก่อนส่งให้ BM25 (ทั้งตอน index และตอน query)
+    ตัดคำไทย ตัด stopword ไทย ("ใช้", "อะไร", "ที่ไหน" ...) แล้วเข้ารหัสแต่ละคำเป็น token เดียว ส่วนภาษาอังกฤษ/ตัวเลขคงเดิม
+    """
+    stopwords = thai_stopwords()
+
+    def encode(match):
+        words = [
+            word.translate(_SPARSE_TABLE)
+            for word in segment(match.group())
+            if word not in stopwords and word not in _SKIP_TOKENS
+        ]
+        return f" {' '.join(words)} "
+
+    return THAI_RE.sub(encode, text)
+
+
+@lru_cache(maxsize=2048)
+def sparse_query_text(text):
+    """sparse_text ของคำถาม (คำถามซ้ำบ่อยช่วงลงทะเบียน จึง cache ไว้)"""
+    return sparse_text(text)
+
+
+class ThaiSparseEmbeddings(SparseEmbeddings):
+    """
+    ห่อ sparse embedding (FastEmbedSparse) ให้ตัดคำไทยก่อน ใช้แทนกันได้ใน QdrantVectorStore
+    thai_segmentation=False ส่งข้อความเดิมให้ inner ตรงๆ (collection ที่ index ด้วย whitespace tokenizer)
+    """
+
+    def __init__(self, inner, thai_segmentation=True):
+        self.inner = inner
+        self.thai_segmentation = thai_segmentation
+
+    @property
+    def tokenizer(self):
+        """ชื่อตัวตัดคำแบบเดียวกับ sparse_tokenizer ใน metadata ของ collection / manifest ของ snapshot"""
+        return "thai-newmm" if self.thai_segmentation else "whitespace"
+
+    def embed_documents(self, texts):
+        if not self.thai_segmentation:
+            return self.inner.embed_documents(texts)
+        return self.inner.embed_documents([sparse_text(text) for text in texts])
+
+    def embed_query(self, text):
+        if not self.thai_segmentation:
+            return self.inner.embed_query(text)
+        return self.inner.embed_query(sparse_query_text(text))
+
+
+class ThaiTextSplitter(RecursiveCharacterTextSplitter):
+    """
+    RecursiveCharacterTextSplitter ที่ตัดข้อความไทยที่ขอบคำ (ไม่ตัดกลางคำ)
+    chunk_size / chunk_overlap นับเป็นตัวอักษรจริงเหมือนเดิม (ไม่นับ WORD_BOUNDARY)
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(
+            separators=["\n\n", "\n", " ", WORD_BOUNDARY, ""],
+            length_function=lambda text: len(text) - text.count(WORD_BOUNDARY),
+            **kwargs,
+        )
+
+    def split_text(self, text):
+        chunks = super().split_text(mark_word_boundaries(text))
+        return [chunk.replace(WORD_BOUNDARY, "") for chunk in chunks]
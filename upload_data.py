@@ -1,20 +1,64 @@
 import os
 import re
+import json
+import argparse
+import hashlib
+import uuid
+import time
+import queue
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 from qdrant_client import QdrantClient, models
 from langchain_qdrant import QdrantVectorStore, FastEmbedSparse, RetrievalMode
 from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
-from langchain_community.document_loaders import PyMuPDFLoader
+import pymupdf
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document  # เพิ่ม import นี้สำหรับสร้าง Document จากข้อความ
+from forms import FORM_MASTER_DATA, SUMMARY_TEXT, resolve_source, split_summary_sections  # ข้อมูลฟอร์มทั้งหมด (ใช้ร่วมกับ main.py)
+from local_index import write_snapshot
+from model_config import DENSE_MODEL_NAME, SPARSE_MODEL_NAME
+from thai_text import ThaiSparseEmbeddings, ThaiTextSplitter
 
 # Load keys
 load_dotenv()
 
 # --- CONFIGURATION (MUST MATCH MAIN.PY) ---
 COLLECTION_NAME = "demo_collection_railway_v2"  # <--- Make sure this matches main.py!
+COLLECTION_ALIAS = os.environ.get("COLLECTION_ALIAS", "kmutt_forms")  # <--- ต้องตรงกับ main.py
+KEEP_COLLECTION_VERSIONS = int(os.environ.get("KEEP_COLLECTION_VERSIONS", 2))  # ปัจจุบัน + ก่อนหน้า (ไว้ rollback)
 QDRANT_URL = os.environ.get("QDRANT_URL")
 QDRANT_API_KEY = os.environ.get("QDRANT_API_KEY")
+# VECTOR_BACKEND=qdrant-local เขียนลง Qdrant แบบ embedded ที่ QDRANT_PATH แทน server (ต้องตรงกับ main.py)
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "qdrant")
+QDRANT_PATH = os.environ.get("QDRANT_PATH", "qdrant_data")
+# 🇹🇭 ตัดคำไทยตอนตัด chunk และก่อนทำ BM25 (ต้องตรงกับ main.py, เปลี่ยนค่าแล้วต้อง --rebuild)
+THAI_SEGMENTATION = os.environ.get("THAI_SEGMENTATION", "1") == "1"
+SPARSE_TOKENIZER = "thai-newmm" if THAI_SEGMENTATION else "whitespace"
+# หัวข้อใน SUMMARY_TEXT ที่ยาวไม่เกินนี้เก็บเป็น chunk เดียวทั้งหัวข้อ (ยาวกว่านี้ค่อยตัดด้วย text splitter)
+SUMMARY_SECTION_MAX_CHARS = int(os.environ.get("SUMMARY_SECTION_MAX_CHARS", 1500))
+
+# Namespace สำหรับสร้าง point ID แบบ deterministic (รันซ้ำได้ผลเหมือนเดิม = idempotent)
+POINT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://regis.kmutt.ac.th/kmutt-backend/chunks")
+SUMMARY_SOURCE = "summary_forms"
+
+# --- FETCH / PARSE ---
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", 8))  # จำนวน download พร้อมกัน (= ขนาด connection pool)
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", os.cpu_count() or 2))  # process สำหรับ parse PDF
+# จำนวน PDF ที่โหลด/parse ค้างอยู่พร้อมกันสูงสุด (แต่ละไฟล์ถือ bytes ทั้งไฟล์ไว้จนถูก parse)
+PDF_MAX_IN_FLIGHT = int(os.environ.get("PDF_MAX_IN_FLIGHT", FETCH_WORKERS * 2))
+FETCH_RETRIES = int(os.environ.get("FETCH_RETRIES", 3))
+FETCH_TIMEOUT = float(os.environ.get("FETCH_TIMEOUT", 30))
+PDF_CACHE_DIR = os.environ.get("PDF_CACHE_DIR", os.path.join(".cache", "pdfs"))  # cache ตาม URL + ETag/Last-Modified
+
+# --- EMBED / UPSERT PIPELINE ---
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 64))  # chunks ต่อ batch (embed + upsert)
+UPSERT_QUEUE_BATCHES = int(os.environ.get("UPSERT_QUEUE_BATCHES", 4))  # batch ที่ embed แล้วรอ upsert ได้สูงสุด (backpressure)
 
 # URL list from your project (เดิม)
 PDF_URLS = [
@@ -49,159 +93,6 @@ GDRIVE_LINKS = [
 # รวม URLs ทั้งหมด
 ALL_URLS = PDF_URLS + GDRIVE_LINKS
 
-# เพิ่ม: ข้อมูลสรุปทั้งหมดจากตัวอย่างของคุณ (paste ข้อมูลทั้งหมดที่นี่เป็น string)
-SUMMARY_TEXT = """
-ตัวอย่างคำตอบที่ดี:
-"2.1 คำร้องขอลาพักการศึกษา (สทน. 12 / RO.12)
-• ชื่อกรณี: การขอลาพักการศึกษาเนื่องจากเหตุจำเป็นต่างๆ เช่น ไม่มีรายวิชาให้ลงทะเบียน, ไม่สามารถศึกษาต่อในภาคนั้นได้, หรือเพื่อรักษาสภาพนักศึกษา
-• แบบฟอร์ม/ระบบที่ใช้: คำร้องออนไลน์ในระบบ New ACIS
-• ช่องทาง: ยื่นผ่านระบบ New ACIS เท่านั้น โดยเลือกเมนู > คำร้องผ่านเว็บ > ยื่นคำร้องการลาต่างๆ > ใบคำร้องขอลาพักการศึกษา
-• ขั้นตอน/เงื่อนไข:
-1. ยื่นคำร้อง: Login เข้าระบบ New ACIS, เลือกภาคการศึกษาและปีการศึกษาที่ต้องการลาพักให้ถูกต้อง และระบุเหตุผลในการขอลาพักให้ชัดเจน
-2. ติดตามผล: สามารถติดตามสถานะการอนุมัติของคำร้องได้ผ่านเมนู > คำร้องผ่านเว็บ > ติดตามคำร้อง
-3. ยืนยันและชำระเงิน: เมื่อคำร้องได้รับการอนุมัติแล้ว ในหน้าจอติดตามคำร้องจะปรากฏจำนวนเงินที่ต้องชำระ นักศึกษาสามารถสั่งพิมพ์ใบแจ้งชำระเงินจากหน้านี้ได้โดยตรง หรือเข้าไปที่เมนู > รายการลงทะเบียนรายวิชา > ชำระเงินค่าลงทะเบียน/ค่าลาพัก
-4. การชำระเงิน: นำใบแจ้งชำระเงินไปชำระที่ ธนาคารกรุงเทพ ภายในเวลาที่ระบุ การลาพักการศึกษาจึงจะถือว่าสมบูรณ์
-• การอนุมัติ: คำร้องจะถูกส่งเพื่อพิจารณาอนุมัติตามลำดับขั้น ได้แก่ อาจารย์ที่ปรึกษา, หัวหน้าภาควิชา, และ คณบดี
-• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-12Updated.pdf
-• หมายเหตุ: อัตราค่าธรรมเนียมการลาพักการศึกษา (รักษาสภาพ)
-o ระดับปริญญาตรี: 800 บาท/ภาคการศึกษา
-o ระดับบัณฑิตศึกษา: 1,600 บาท/ภาคการศึกษา
-o กรณีเป็นการลาพักในภาคการศึกษาแรก จะมีค่าประกันอุบัติเหตุเพิ่มอีก 200 บาท
-o มีค่าปรับกรณีดำเนินการล่าช้า 50 บาท/วัน (นับรวมวันหยุด)
---------------------------------------------------------------------------------
-2.2 คำร้องขอถอนรายวิชา (W) (ส่วนหนึ่งของ สทน. 26 / RO.26)
-• ชื่อกรณี: การขอถอนรายวิชาเรียน (Withdrawal) หลังจากพ้นกำหนดช่วงเวลาเพิ่ม-ลดรายวิชาตามปฏิทินการศึกษาแล้ว
-• แบบฟอร์ม/ระบบที่ใช้: คำร้องออนไลน์ในระบบ New ACIS
-• ช่องทาง: ยื่นผ่านระบบ New ACIS
-• ขั้นตอน/เงื่อนไข: นักศึกษาสามารถยื่นคำร้องผ่านระบบ New ACIS โดยต้องเข้าสู่ระบบ, เลือกรายวิชาที่ต้องการถอน (W), และระบุเหตุผลประกอบการพิจารณาอย่างชัดเจน จากนั้นคำร้องจะถูกส่งเข้าระบบเพื่อรอการอนุมัติตามลำดับขั้น
-• การอนุมัติ: ต้องผ่านการอนุมัติจากอาจารย์ที่ปรึกษาและหน่วยงานที่เกี่ยวข้องตามลำดับขั้นที่กำหนดไว้ในระบบ
-• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-26Updated.pdf
---------------------------------------------------------------------------------
-2.3 คำร้องขอลงทะเบียนต่ำกว่า/เกินกว่าหน่วยกิตที่กำหนด (สทน. 18 / RO.18)
-• ชื่อกรณี: การขอลงทะเบียนเรียนด้วยจำนวนหน่วยกิตที่น้อยกว่า หรือมากกว่าเกณฑ์มาตรฐานที่หลักสูตรกำหนดในแต่ละภาคการศึกษา
-• แบบฟอร์ม/ระบบที่ใช้: มีคำร้องออนไลน์ในระบบ New ACIS ควบคู่ไปกับแบบฟอร์มเอกสาร
-• ช่องทาง: สามารถยื่นผ่านระบบ New ACIS ซึ่งเป็นช่องทางที่แนะนำ หรือใช้แบบฟอร์มเอกสาร (RO-18) โดยนักศึกษาควรตรวจสอบช่องทางที่ภาควิชากำหนด
-• ขั้นตอน/เงื่อนไข: นักศึกษาต้องระบุเหตุผลและความจำเป็นในการขอลงทะเบียนเรียนนอกเกณฑ์ที่กำหนด
-• การอนุมัติ: ต้องได้รับการอนุมัติจากอาจารย์ที่ปรึกษา และหัวหน้าภาควิชาตามลำดับ
-• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-18Updated.pdf
---------------------------------------------------------------------------------
-3. การยื่นคำร้องแบบฟอร์มเอกสาร (Paper/PDF)
-แม้ว่าระบบออนไลน์จะเข้ามามีบทบาทสำคัญ แต่คำร้องบางประเภทยังคงจำเป็นต้องใช้รูปแบบเอกสาร (Paper/PDF) เนื่องจากเป็นกรณีที่มีความเฉพาะเจาะจงสูง ต้องการเอกสารหลักฐานประกอบจำนวนมาก หรือต้องอาศัยการพิจารณาและลงนามจากหลายฝ่ายอย่างเป็นทางการ การยื่นคำร้องประเภทนี้ นักศึกษาจำเป็นต้องดาวน์โหลดแบบฟอร์มจากเว็บไซต์สำนักงานทะเบียนนักศึกษา กรอกข้อมูลให้ครบถ้วนสมบูรณ์ และยื่นต่อหน่วยงานที่รับผิดชอบตามขั้นตอน
-3.1 คำร้องทั่วไป (สทน. 01 / RO.01)
-• ชื่อกรณี: ใช้สำหรับยื่นคำร้องในเรื่องอื่นๆ ที่ไม่มีแบบฟอร์มเฉพาะเจาะจงให้ใช้งาน
-• แบบฟอร์ม/ระบบที่ใช้: สทน. 01 / RO.01
-• ช่องทาง: ยื่นเอกสารที่ภาควิชา/หน่วยงานที่เกี่ยวข้องโดยตรง
-• ขั้นตอน/เงื่อนไข: นักศึกษาต้องกรอกรายละเอียดความประสงค์ที่ต้องการยื่นเรื่องให้ชัดเจนและครบถ้วนที่สุด
-• การอนุมัติ: ต้องผ่านความเห็นจาก อาจารย์ที่ปรึกษา, หัวหน้าภาควิชา, และ คณบดี ตามลำดับที่ระบุในแบบฟอร์ม
-• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-01.pdf
---------------------------------------------------------------------------------
-3.2 หนังสือรับรองของผู้ปกครอง (สทน. 03 / RO.03)
-• ชื่อกรณี: เป็นเอกสารประกอบที่ใช้ในกรณีที่ต้องให้ผู้ปกครองรับรองเรื่องต่างๆ เช่น การขอลาออกจากการเป็นนักศึกษา
-• แบบฟอร์ม/ระบบที่ใช้: สทน. 03 / RO.03
-• ช่องทาง: ยื่นเอกสารนี้แนบประกอบไปกับคำร้องหลักที่เกี่ยวข้อง
-• ขั้นตอน/เงื่อนไข: ผู้ปกครองเป็นผู้กรอกข้อมูลและลงนามรับรอง
-• การอนุมัติ: เอกสารนี้ใช้เพื่อประกอบการพิจารณาคำร้องอื่นๆ
-• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-03.pdf
---------------------------------------------------------------------------------
-3.3 ใบมอบฉันทะ (สทน. 04 / RO.04)
-• ชื่อกรณี: การมอบอำนาจให้บุคคลอื่นดำเนินการหรือรับเอกสารทางการศึกษาที่สำคัญแทนตนเอง
-• แบบฟอร์ม/ระบบที่ใช้: สทน. 04 / RO.04
-• ช่องทาง: ยื่นเอกสาร ณ หน่วยงานที่ต้องการติดต่อ (เช่น สำนักงานทะเบียนนักศึกษา)
-• ขั้นตอน/เงื่อนไข: กรอกรายละเอียดของผู้มอบฉันทะและผู้รับมอบฉันทะให้ครบถ้วน
-• การอนุมัติ: เจ้าหน้าที่ ณ หน่วยงานที่รับเรื่องจะทำการตรวจสอบเอกสาร
-• หมายเหตุ: ต้องแนบสำเนาบัตรประจำตัวประชาชนของผู้มอบฉันทะและผู้รับมอบฉันทะ พร้อมลงนามรับรองสำเนาถูกต้องกำกับมาด้วยทุกครั้ง
-• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-04.pdf
---------------------------------------------------------------------------------
-3.4 คำร้องขอคืนเงินค่าลงทะเบียน (สทน. 08 / RO.08)
-• ชื่อกรณี: การขอเงินค่าหน่วยกิตหรือค่าธรรมเนียมคืน ในกรณีที่มีการลดรายวิชาตามกำหนดเวลา หรือกรณีที่รายวิชาที่ลงทะเบียนไว้ถูกยกเลิก
-• แบบฟอร์ม/ระบบที่ใช้: สทน. 08 / RO.08
-• ช่องทาง: ยื่นเอกสารที่สำนักงานทะเบียนนักศึกษา
-• การอนุมัติ: ต้องผ่านความเห็นจากอาจารย์ที่ปรึกษา และหัวหน้าภาควิชา
-• หมายเหตุ: ต้องแนบเอกสารประกอบหลายรายการ ได้แก่ 1) แบบ กค. 18 (ใบแจ้งความจำนงโอนเงิน), 2) ใบเสร็จรับเงินฉบับจริง, 3) รายงานรายวิชาที่จะขอเงินคืน, 4) สำเนาบัตรนักศึกษาและบัตรประชาชน, 5) สำเนาสมุดบัญชีธนาคารหน้าแรก
-• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-08.pdf
---------------------------------------------------------------------------------
-3.5 คำร้องขอเลื่อนรับพระราชทานปริญญาบัตร (สทน. 11 / RO.11)
-• ชื่อกรณี: สำหรับบัณฑิตที่สำเร็จการศึกษาแล้ว แต่ไม่สามารถเข้ารับพระราชทานปริญญาบัตรในปีนั้นได้ และมีความประสงค์จะขอเลื่อนไปเข้ารับในปีถัดไป
-• แบบฟอร์ม/ระบบที่ใช้: สทน. 11 / RO.11
-• ช่องทาง: ยื่นเอกสารที่สำนักงานทะเบียนนักศึกษา
-• ขั้นตอน/เงื่อนไข: ต้องยื่นคำร้องก่อนกำหนดวันซ้อมรับปริญญาบัตรประมาณ 1 สัปดาห์ และสามารถขอเลื่อนได้ไม่เกิน 3 ปีการศึกษานับจากปีที่สำเร็จการศึกษา
-• การอนุมัติ: เสนอต่อรองอธิการบดีฝ่ายพัฒนานักศึกษาเพื่อพิจารณาอนุมัติ
-• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-11.pdf
---------------------------------------------------------------------------------
-3.6 คำร้องขอลาออก (สทน. 13 / RO.13)
-• ชื่อกรณี: การยื่นเรื่องเพื่อขอลาออกจากการเป็นนักศึกษาของมหาวิทยาลัย
-• แบบฟอร์ม/ระบบที่ใช้: สทน. 13 / RO.13
-• ช่องทาง: ยื่นเอกสารที่ภาควิชาที่สังกัด
-• ขั้นตอน/เงื่อนไข: นักศึกษาต้องตรวจสอบและจัดการภาระหนี้สินทั้งหมดที่มีกับทางมหาวิทยาลัยให้เรียบร้อยก่อนยื่นคำร้อง
-• การอนุมัติ: ต้องผ่านความเห็นจาก อาจารย์ที่ปรึกษา, หัวหน้าภาควิชา, และ คณบดี
-• หมายเหตุ: ต้องแนบ "หนังสือรับรองของผู้ปกครอง (สทน. 03)" มาพร้อมกับคำร้องขอลาออกด้วย การแนบ สทน. 03 เป็นการยืนยันว่าผู้ปกครองรับทราบการตัดสินใจที่สำคัญนี้ ซึ่งเป็นส่วนหนึ่งของกระบวนการตรวจสอบของมหาวิทยาลัย
-• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-13Updated.pdf
---------------------------------------------------------------------------------
-3.7 คำร้องขอเปลี่ยนแปลงข้อมูลในทะเบียนประวัติ (สทน. 14 / RO.14)
-• ชื่อกรณี: การขอแก้ไขข้อมูลส่วนตัวในทะเบียนประวัตินักศึกษา เช่น การเปลี่ยนชื่อ-นามสกุล, คำนำหน้าชื่อ, หรือที่อยู่ปัจจุบัน
-• แบบฟอร์ม/ระบบที่ใช้: สทน. 14 / RO.14
-• ช่องทาง: ยื่นเอกสารที่สำนักงานทะเบียนนักศึกษา
-• ขั้นตอน/เงื่อนไข: กรอกข้อมูลเดิมและข้อมูลใหม่ที่ต้องการเปลี่ยนแปลงให้ถูกต้อง
-• การอนุมัติ: เจ้าหน้าที่สำนักงานทะเบียนนักศึกษาเป็นผู้ตรวจสอบและดำเนินการแก้ไขในระบบ
-• หมายเหตุ: ต้องแนบสำเนาเอกสารทางราชการที่ยืนยันการเปลี่ยนแปลง (เช่น ใบเปลี่ยนชื่อ-สกุล, ทะเบียนบ้าน) พร้อมลงนามรับรองสำเนาถูกต้อง
-• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-14.pdf
---------------------------------------------------------------------------------
-3.8 คำร้องขอทำบัตรนักศึกษา (สทน. 15 / RO.15)
-• ชื่อกรณี: การขอทำบัตรนักศึกษาใหม่ (สำหรับนักศึกษาใหม่) หรือทำบัตรทดแทน (กรณีบัตรหาย, ชำรุด, หรือหมดอายุ)
-• แบบฟอร์ม/ระบบที่ใช้: สทน. 15 / RO.15
-• ช่องทาง: แบบฟอร์มมี 2 ส่วน โดยส่วนที่ 1 นำไปยื่นที่ธนาคารกรุงเทพสาขาที่กำหนด และส่วนที่ 2 สำหรับเก็บไว้ที่สำนักงานทะเบียนนักศึกษา
-• ขั้นตอน/เงื่อนไข: นักศึกษาต้องนำแบบฟอร์มมายื่นที่สำนักงานทะเบียนนักศึกษาเพื่อรับการประทับตราและลงนามจากเจ้าหน้าที่ในส่วนที่ 1 ก่อน จึงจะสามารถนำไปยื่นที่ธนาคารได้
-• การอนุมัติ: ดำเนินการโดยเจ้าหน้าที่ทะเบียนและเจ้าหน้าที่ธนาคาร
-• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-15_160718.pdf
---------------------------------------------------------------------------------
-3.9 คำร้องขอลาป่วย/ลากิจ (สทน. 16 / RO.16)
-• ชื่อกรณี: การขอลาเรียนเนื่องจากมีอาการป่วย หรือมีกิจธุระที่จำเป็นและไม่สามารถเข้าชั้นเรียนได้
-• แบบฟอร์ม/ระบบที่ใช้: สทน. 16 / RO.16
-• ช่องทาง: ยื่นเอกสารต่ออาจารย์ผู้สอนรายวิชาหรือภาควิชาที่สังกัด
-• การอนุมัติ: ต้องมีคำรับรองจากผู้ปกครอง และผ่านความเห็นจาก อาจารย์ที่ปรึกษา, อาจารย์ผู้สอน, และหัวหน้าภาควิชา ตามลำดับ
-• หมายเหตุ: กรณีลาป่วย ควรแนบใบรับรองแพทย์เพื่อประกอบการพิจารณาด้วย
-• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-16.pdf
---------------------------------------------------------------------------------
-3.10 คำร้องขอลงทะเบียนในรายวิชาที่มีเวลาสอบซ้อน (สทน. 19 / RO.19)
-• ชื่อกรณี: การขอลงทะเบียนเรียนใน 2 รายวิชา ซึ่งมีตารางสอบปลายภาคตรงกันหรือคาบเกี่ยวกัน
-• แบบฟอร์ม/ระบบที่ใช้: สทน. 19 / RO.19
-• ช่องทาง: ยื่นเอกสารที่ภาควิชา
-• ขั้นตอน/เงื่อนไข: สามารถยื่นขอได้เฉพาะนักศึกษาชั้นปีสุดท้ายเท่านั้น และสามารถขอสอบซ้อนได้ไม่เกิน 2 รายวิชา
-• การอนุมัติ: ต้องได้รับความเห็นชอบจากอาจารย์ที่ปรึกษาและหัวหน้าภาควิชา
-• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-19.pdf
---------------------------------------------------------------------------------
-3.11 คำร้องขอลงทะเบียนรายวิชานอกหลักสูตร (สทน. 20 / RO.20)
-• ชื่อกรณี: การขอลงทะเบียนเรียนในรายวิชาที่ไม่ได้ถูกกำหนดไว้ในโครงสร้างหลักสูตรของตนเอง
-• แบบฟอร์ม/ระบบที่ใช้: สทน. 20 / RO.20
-• ช่องทาง: ยื่นเอกสารที่ภาควิชา
-• ขั้นตอน/เงื่อนไข: สามารถเลือกลงทะเบียนได้ 3 รูปแบบ คือ 1) คิดเกรด A-F และนำไปคำนวณ GPA, 2) คิดเกรด S/U (ผ่าน/ไม่ผ่าน), 3) ลงทะเบียนแบบ Audit (เข้าฟังการบรรยายแต่ไม่นับหน่วยกิตและไม่คิดเกรด, ยกเว้นรายวิชาฝึกงานอุตสาหกรรม และภาษาต่างประเทศ)
-• การอนุมัติ: ต้องได้รับความเห็นชอบจากอาจารย์ที่ปรึกษาและหัวหน้าภาควิชา
-• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-20.pdf
---------------------------------------------------------------------------------
-3.12 คำร้องขอลงทะเบียนเรียนแบบบุคคลภายนอก (สทน. 21 / RO.21)
-• ชื่อกรณี: สำหรับบุคคลทั่วไปที่ไม่ได้มีสถานะเป็นนักศึกษาของ มจธ. แต่มีความประสงค์จะลงทะเบียนเรียนในบางรายวิชาที่มหาวิทยาลัยเปิดสอน
-• แบบฟอร์ม/ระบบที่ใช้: สทน. 21 / RO.21
-• ช่องทาง: ยื่นเอกสารที่ภาควิชาเจ้าของรายวิชาที่ต้องการลงทะเบียน
-• การอนุมัติ: ต้องได้รับความเห็นชอบจากหัวหน้าภาควิชาเจ้าของรายวิชานั้นๆ
-• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-21.pdf
---------------------------------------------------------------------------------
-3.13 คำร้องขอสมัครสอบโดยไม่ต้องเข้าเรียน (สทน. 22 / RO.22)
-• ชื่อกรณี: การขอสิทธิ์เข้าสอบปลายภาคในรายวิชาที่เคยลงทะเบียนเรียนมาแล้วแต่ได้ผลการเรียนต่ำกว่า C หรือขาดสอบด้วยเหตุสุดวิสัย โดยไม่ต้องกลับเข้าไปเรียนใหม่
-• แบบฟอร์ม/ระบบที่ใช้: สทน. 22 / RO.22
-• ช่องทาง: ยื่นเอกสารที่ภาควิชา
-• ขั้นตอน/เงื่อนไข: สำหรับนักศึกษาชั้นปีสุดท้ายเท่านั้น, ต้องเป็นรายวิชาที่ไม่มีภาคปฏิบัติ, และเคยมีเวลาเรียนในวิชานั้นไม่ต่ำกว่า 80%
-• การอนุมัติ: ต้องได้รับความเห็นชอบจากอาจารย์ที่ปรึกษา, อาจารย์ผู้สอน และหัวหน้าภาควิชา
-• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-22.pdf
---------------------------------------------------------------------------------
-3.14 คำร้องขอเปลี่ยน/เทียบรายวิชาเรียน (สทน. 23 / RO.23)
-• ชื่อกรณี: การขอเทียบโอนหน่วยกิตจากรายวิชาที่เคยเรียนมาจากสถาบันอื่น หรือการขอเปลี่ยนไปเรียนรายวิชาอื่นที่มีเนื้อหาเทียบเท่ากันภายในมหาวิทยาลัย
-• แบบฟอร์ม/ระบบที่ใช้: สทน. 23 / RO.23
-• ช่องทาง: ยื่นเอกสารที่ภาควิชา
-• การอนุมัติ: ต้องผ่านความเห็นชอบจากอาจารย์ที่ปรึกษา, หัวหน้าภาควิชา และคณบดี
-• ดาวน์โหลดแบบฟอร์ม: https://regis.kmutt.ac.th/service/form/RO-23.pdf
-"""
-# ถ้าข้อมูลยาวเกิน ให้ตัดเป็นหลาย string แล้ว concat หรือ paste ให้ครบ
-
 def extract_gdrive_id(url):
     """Helper: Extract FILE_ID จาก GDrive URL ถ้าเป็น view link"""
     match = re.search(r'/d/([a-zA-Z0-9_-]+)', url)
@@ -209,72 +100,594 @@ def extract_gdrive_id(url):
         return f"https://drive.google.com/uc?id={match.group(1)}"
     return url  # ถ้าเป็น uc?id= แล้ว คืนเดิม
 
-def main():
-    print(f"🚀 Connecting to Qdrant: {QDRANT_URL}...")
-    client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
-
-    # 1. Check/Create Collection
-    if not client.collection_exists(COLLECTION_NAME):
-        print(f"📦 Creating new collection: {COLLECTION_NAME}")
-        client.create_collection(
-            collection_name=COLLECTION_NAME,
-            vectors_config=models.VectorParams(size=384, distance=models.Distance.COSINE),
-            sparse_vectors_config={"sparse_vector": models.SparseVectorParams()},
+def mark_ingested(client, collection_name):
+    """บันทึก ingest_version ลง metadata ของ collection (main.py ใช้ล้าง Answer Cache)"""
+    version = datetime.now(timezone.utc).isoformat()
+    try:
+        client.update_collection(
+            collection_name=collection_name,
+            metadata={"ingest_version": version, "sparse_tokenizer": SPARSE_TOKENIZER},
         )
-    else:
-        print(f"✅ Collection {COLLECTION_NAME} already exists.")
+        print(f"🏷️ ingest_version = {version}")
+    except Exception as e:
+        print(f"⚠️ Cannot stamp ingest_version (Qdrant server too old?): {e}")
 
-    # 2. Setup Models
-    print("🧠 Loading models...")
-    embeddings = FastEmbedEmbeddings(model_name="BAAI/bge-small-en-v1.5")
-    sparse_embeddings = FastEmbedSparse(model_name="Qdrant/bm25")
+def sha256_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-    # 3. Process PDFs (รวม GDrive)
-    all_docs = []
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+def point_id(source, chunk_hash, occurrence):
+    """ID ของ chunk ขึ้นกับ source + เนื้อหา (occurrence กันกรณีมี chunk ซ้ำกันในไฟล์เดียว)"""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}#{chunk_hash}#{occurrence}"))
 
-    print("📄 Downloading and processing PDFs...")
-    for url in ALL_URLS:
-        # แปลง GDrive ถ้าจำเป็น
-        processed_url = extract_gdrive_id(url)
-        try:
-            print(f"   - Processing: {processed_url}")
-            loader = PyMuPDFLoader(processed_url)
-            docs = loader.load()
-            # Clean metadata to just filename
-            for doc in docs:
-                doc.metadata["file"] = processed_url
-                doc.metadata["source"] = processed_url
-            chunks = text_splitter.split_documents(docs)
-            all_docs.extend(chunks)
-        except Exception as e:
-            print(f"❌ Failed to load {processed_url}: {e}")
-
-    # เพิ่ม: Process ข้อมูลสรุป (จาก string)
+# ================= FETCH & PARSE =================
+def make_session():
+    """HTTP session ที่มี connection pool ขนาด FETCH_WORKERS และ retry แบบ exponential backoff"""
+    retry = Retry(
+        total=FETCH_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    adapter = HTTPAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_WORKERS, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def fetch_pdf(session, url):
+    """
+    ดาวน์โหลด PDF โดยใช้ disk cache: ส่ง If-None-Match / If-Modified-Since ไปด้วย
+    ถ้า server ตอบ 304 ใช้ไฟล์เดิมใน cache เลย คืน (bytes, from_cache)
+    """
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    body_path = os.path.join(PDF_CACHE_DIR, f"{key}.pdf")
+    meta_path = os.path.join(PDF_CACHE_DIR, f"{key}.json")
+
+    headers = {}
+    if os.path.exists(body_path) and os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    response = session.get(url, headers=headers, timeout=FETCH_TIMEOUT)
+    if response.status_code == 304:
+        with open(body_path, "rb") as f:
+            return f.read(), True
+    response.raise_for_status()
+    data = response.content
+    if not data.startswith(b"%PDF"):
+        raise ValueError(f"Not a PDF (content-type: {response.headers.get('Content-Type')})")
+
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    with open(body_path, "wb") as f:
+        f.write(data)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }, f)
+    return data, False
+
+def parse_pdf(data):
+    """แยกข้อความรายหน้า (รันใน process pool) คืน [(page_number, text)]"""
+    with pymupdf.open(stream=data, filetype="pdf") as pdf:
+        return [(page.number, page.get_text()) for page in pdf]
+
+def expand_sources(sources):
+    """แปลงรายการ source เป็น URL / path ของไฟล์ PDF (directory → ทุก .pdf ข้างใน)"""
+    expanded = []
+    for source in sources:
+        if os.path.isdir(source):
+            expanded.extend(
+                os.path.join(source, name) for name in sorted(os.listdir(source)) if name.lower().endswith(".pdf")
+            )
+        elif os.path.exists(source):
+            expanded.append(source)
+        else:
+            # แปลง GDrive ถ้าจำเป็น
+            expanded.append(extract_gdrive_id(source))
+    return expanded
+
+def read_source(session, source):
+    if os.path.exists(source):
+        with open(source, "rb") as f:
+            return f.read(), False
+    return fetch_pdf(session, source)
+
+def iter_pdfs(sources, max_in_flight=None):
+    """
+    ดาวน์โหลดพร้อมกัน (thread pool + connection pool) แล้วส่งไป parse ใน process pool ทันทีที่โหลดเสร็จ
+    yield (source, docs) ทันทีที่ parse เสร็จแต่ละไฟล์ (docs เป็น None ถ้าโหลด/parse ไม่สำเร็จ)
+    ไฟล์ที่กำลังโหลด + parse อยู่มีไม่เกิน max_in_flight (ค่าเริ่มต้น PDF_MAX_IN_FLIGHT) ไฟล์ถัดไปเริ่มโหลดเมื่อมีไฟล์ถูก yield ออกไป
+    bytes ของ PDF ที่ค้างอยู่ใน memory จึงไม่โตตามจำนวนไฟล์ทั้งหมด
+    """
+    max_in_flight = max_in_flight or PDF_MAX_IN_FLIGHT
+    sources = iter(sources)
+    session = make_session()
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as fetch_pool, \
+            ProcessPoolExecutor(max_workers=PARSE_WORKERS) as parse_pool:
+        downloads, parses = {}, {}  # future -> source (pop ทันทีที่ใช้ผลแล้ว)
+
+        def fill():
+            for source in islice(sources, max_in_flight - len(downloads) - len(parses)):
+                downloads[fetch_pool.submit(read_source, session, source)] = source
+
+        fill()
+        while downloads or parses:
+            done, _ = wait([*downloads, *parses], return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in downloads:
+                    source = downloads.pop(future)
+                    try:
+                        data, from_cache = future.result()
+                        print(f"   - Downloaded: {source}{' (cached)' if from_cache else ''}")
+                    except Exception as e:
+                        print(f"❌ Failed to load {source}: {e}")
+                        yield source, None
+                        continue
+                    parses[parse_pool.submit(parse_pdf, data)] = source
+                    continue
+
+                source = parses.pop(future)
+                try:
+                    pages = future.result()
+                except Exception as e:
+                    print(f"❌ Failed to parse {source}: {e}")
+                    yield source, None
+                    continue
+                # Clean metadata to just filename
+                yield source, [
+                    Document(page_content=text, metadata={"file": source, "source": source, "page": page})
+                    for page, text in pages
+                ]
+            del done, future  # ไม่ถือผลของ future (bytes ของ PDF) ไว้ระหว่างรอรอบถัดไป
+            fill()
+
+def iter_sources(text_splitter, sources=None):
+    """
+    โหลดทีละ source แล้วตัดเป็น chunk (sources = URL / ไฟล์ / โฟลเดอร์ ค่าเริ่มต้นคือ ALL_URLS)
+    yield (source, chunks) — chunk แต่ละอันมี metadata source_hash / chunk_hash / chunk_index
+    (chunks เป็น None ถ้า source นั้นโหลดไม่สำเร็จ)
+    """
+    # เพิ่ม: Process ข้อมูลสรุป (จาก string) — ทำก่อนเพราะไม่ต้องรอดาวน์โหลด
     print("📝 Processing summary text...")
     summary_doc = Document(
         page_content=SUMMARY_TEXT,
-        metadata={"file": "summary_forms.txt", "source": "summary_forms"}
+        metadata={"file": "summary_forms.txt", "source": SUMMARY_SOURCE}
     )
-    summary_chunks = text_splitter.split_documents([summary_doc])  # Split เหมือน PDF
-    all_docs.extend(summary_chunks)
+    yield SUMMARY_SOURCE, finalize_chunks([summary_doc], split_summary(text_splitter, summary_doc))
+
+    print("📄 Downloading and processing PDFs...")
+    for source, docs in iter_pdfs(expand_sources(sources or ALL_URLS)):
+        yield source, None if docs is None else finalize_chunks(docs, text_splitter.split_documents(docs))
+
+def split_summary(text_splitter, summary_doc):
+    """
+    ตัด SUMMARY_TEXT ตามหัวข้อ (1 ฟอร์ม = 1 chunk) แทนการตัดทุก 500 ตัวอักษร
+    - ข้อความสั้นๆ ที่ไม่ใช่หัวข้อ (เช่น "ตัวอย่างคำตอบที่ดี:") รวมเข้ากับหัวข้อถัดไป
+    - หัวข้อที่ยาวเกิน SUMMARY_SECTION_MAX_CHARS ตัดด้วย text splitter แล้วใส่บรรทัดหัวข้อไว้ต้นทุก chunk
+    """
+    chunks, carry = [], ""
+    for section in split_summary_sections(summary_doc.page_content):
+        if len(section) < 100:
+            carry = f"{carry}\n{section}" if carry else section
+            continue
+        if len(section) <= SUMMARY_SECTION_MAX_CHARS:
+            pieces = [section]
+        else:
+            header, _, body = section.partition("\n")
+            pieces = [f"{header}\n{piece}" for piece in text_splitter.split_text(body)]
+        if carry:
+            pieces[0] = f"{carry}\n{pieces[0]}"
+            carry = ""
+        chunks.extend(Document(page_content=piece, metadata=dict(summary_doc.metadata)) for piece in pieces)
+    if carry:
+        chunks.append(Document(page_content=carry, metadata=dict(summary_doc.metadata)))
+    return chunks
 
-    # 4. Upload to Qdrant
-    print(f"📤 Uploading {len(all_docs)} chunks to Qdrant...")
-    QdrantVectorStore.from_documents(
-        documents=all_docs,
+def make_text_splitter():
+    if THAI_SEGMENTATION:
+        return ThaiTextSplitter(chunk_size=500, chunk_overlap=50)  # ตัดที่ขอบคำไทย ไม่ตัดกลางคำ
+    return RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+
+def finalize_chunks(docs, chunks):
+    """
+    ใส่ hash ของทั้ง source และของแต่ละ chunk ลง metadata (เก็บใน payload ของ Qdrant)
+    พร้อมฟอร์ม/ลิงก์ที่ chunk อ้างถึง (form_id, form_name, form_url, display_name) ให้ main.py อ่านได้ทันที
+    """
+    source_hash = sha256_text("\n".join(doc.page_content for doc in docs))
+    for index, chunk in enumerate(chunks):
+        chunk.metadata["source_hash"] = source_hash
+        chunk.metadata["chunk_hash"] = sha256_text(chunk.page_content)
+        chunk.metadata["chunk_index"] = index
+        chunk.metadata.update(resolve_source(chunk.metadata["file"], chunk.page_content))
+    return chunks
+
+def fetch_existing_points(client, collection_name):
+    """อ่าน point ที่มีอยู่แล้ว: {source: {point_id: metadata}}"""
+    existing = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=1000,
+            offset=offset,
+            with_payload=["metadata"],
+            with_vectors=False,
+        )
+        for point in points:
+            metadata = (point.payload or {}).get("metadata") or {}
+            existing.setdefault(metadata.get("source"), {})[str(point.id)] = metadata
+        if offset is None:
+            return existing
+
+def plan_sync(source_iter, existing, to_delete, to_refresh, stats, prune_missing=True):
+    """
+    เทียบ chunk ใหม่กับ point เดิมทีละ source แล้ว yield (id, chunk) ที่ต้อง embed + upsert
+    id ที่ต้องลบจะถูกเติมลงใน to_delete (ลบหลัง upsert เสร็จทั้งหมด)
+    - chunk ที่ id มีอยู่แล้ว (เนื้อหาเดิม) → ไม่ embed ใหม่ แต่ถ้า metadata เปลี่ยน (chunk_index / source_hash /
+      ฟอร์มที่อ้างถึง เมื่อ source มี chunk เพิ่ม/หาย/สลับลำดับ) เติม (id, metadata) ลง to_refresh
+    - point ของ source ที่โหลดไม่สำเร็จ → เก็บไว้ก่อน (ไม่ลบข้อมูลเพราะเน็ตล่ม) และบันทึกลง stats["failed"]
+    - chunk ที่หายไป → ลบ
+    - point ของ source ที่ไม่อยู่ในรายการแล้ว → ลบ เฉพาะเมื่อ prune_missing (ไม่ใช่ sync บางไฟล์ด้วย --source)
+    """
+    handled_sources = set()
+    for source, chunks in source_iter:
+        handled_sources.add(source)
+        if chunks is None:
+            stats["failed"].append(source)
+            continue
+        old_points = existing.get(source, {})
+        new_ids = set()
+        seen = {}
+        refreshed = 0
+        for chunk in chunks:
+            chunk_hash = chunk.metadata["chunk_hash"]
+            seen[chunk_hash] = seen.get(chunk_hash, 0) + 1
+            pid = point_id(source, chunk_hash, seen[chunk_hash])
+            new_ids.add(pid)
+            if pid not in old_points:
+                yield pid, chunk
+            elif old_points[pid] != chunk.metadata:
+                to_refresh.append((pid, chunk.metadata))
+                refreshed += 1
+        to_delete.extend(pid for pid in old_points if pid not in new_ids)
+        stats["chunks"] += len(chunks)
+        if new_ids ^ set(old_points):
+            status = "changed"
+        elif refreshed:
+            status = f"metadata refreshed on {refreshed} chunks"
+        else:
+            status = "unchanged"
+        print(f"   - {source}: {len(chunks)} chunks ({status})")
+
+    for source, old_points in existing.items():
+        if source in handled_sources:
+            continue
+        if prune_missing:
+            print(f"   - {source}: removed ({len(old_points)} points)")
+            to_delete.extend(old_points)
+        else:
+            print(f"   - {source}: not in --source, kept ({len(old_points)} points)")
+
+def create_collection(client, collection_name):
+    """สร้าง collection (named vectors ให้ตรงกับที่ main.py ค้นหา)"""
+    print(f"📦 Creating new collection: {collection_name}")
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config={"dense_vector": models.VectorParams(size=384, distance=models.Distance.COSINE)},
+        sparse_vectors_config={"sparse_vector": models.SparseVectorParams(index=models.SparseIndexParams(on_disk=False))},
+    )
+
+def make_vector_store(client, collection_name):
+    print("🧠 Loading models...")
+    embeddings = FastEmbedEmbeddings(model_name=DENSE_MODEL_NAME)
+    sparse_embeddings = FastEmbedSparse(model_name=SPARSE_MODEL_NAME)
+    if THAI_SEGMENTATION:
+        sparse_embeddings = ThaiSparseEmbeddings(sparse_embeddings)
+    return QdrantVectorStore(
+        client=client,
+        collection_name=collection_name,
         embedding=embeddings,
         sparse_embedding=sparse_embeddings,
-        url=QDRANT_URL,
-        api_key=QDRANT_API_KEY,
-        collection_name=COLLECTION_NAME,
         retrieval_mode=RetrievalMode.HYBRID,
         vector_name="dense_vector",
         sparse_vector_name="sparse_vector",
-        force_recreate=True  # Don't delete if we just created it
     )
+
+# ================= EMBED & UPSERT PIPELINE =================
+class UpsertPipeline:
+    """
+    Embed chunk เป็น batch ละ batch_size แล้วส่งต่อให้ thread upsert ผ่าน queue ที่จำกัดขนาด
+    ถ้า Qdrant upsert ช้ากว่า embed, queue เต็ม → การ embed (และการอ่าน source) จะหยุดรอ (backpressure)
+    memory จึงคงที่ไม่โตตามขนาด corpus
+    """
+
+    def __init__(self, client, collection_name, vector_store, batch_size=None, queue_batches=None):
+        self.client = client
+        self.collection_name = collection_name
+        self.vector_store = vector_store
+        self.batch_size = batch_size or EMBED_BATCH_SIZE
+        self._queue = queue.Queue(maxsize=queue_batches or UPSERT_QUEUE_BATCHES)
+        self._error = None
+        self.upserted = 0
+        self.batches = 0
+
+    def run(self, items):
+        """items: iterable ของ (point_id, chunk) คืนจำนวน chunk ที่ upsert"""
+        started = time.perf_counter()
+        worker = threading.Thread(target=self._upsert_loop, args=(started,), name="qdrant-upsert", daemon=True)
+        worker.start()
+        try:
+            items = iter(items)
+            while self._error is None and (batch := list(islice(items, self.batch_size))):
+                embed_started = time.perf_counter()
+                points = self._build_points(batch)
+                embed_ms = (time.perf_counter() - embed_started) * 1000
+                self._queue.put((points, embed_ms))
+        finally:
+            self._queue.put(None)
+            worker.join()
+        if self._error is not None:
+            raise self._error
+        return self.upserted
+
+    def _build_points(self, batch):
+        texts = [chunk.page_content for _, chunk in batch]
+        dense = self.vector_store.embeddings.embed_documents(texts)
+        sparse = self.vector_store.sparse_embeddings.embed_documents(texts)
+        return [
+            models.PointStruct(
+                id=pid,
+                vector={
+                    "dense_vector": dense_vector,
+                    "sparse_vector": models.SparseVector(indices=sparse_vector.indices, values=sparse_vector.values),
+                },
+                payload={"page_content": chunk.page_content, "metadata": chunk.metadata},
+            )
+            for (pid, chunk), dense_vector, sparse_vector in zip(batch, dense, sparse)
+        ]
+
+    def _upsert_loop(self, started):
+        while (item := self._queue.get()) is not None:
+            if self._error is not None:
+                continue  # ระบาย queue ให้ฝั่ง embed ไม่ค้าง
+            points, embed_ms = item
+            try:
+                upsert_started = time.perf_counter()
+                self.client.upsert(collection_name=self.collection_name, points=points)
+                upsert_ms = (time.perf_counter() - upsert_started) * 1000
+            except Exception as e:
+                self._error = e
+                continue
+            self.batches += 1
+            self.upserted += len(points)
+            rate = self.upserted / (time.perf_counter() - started)
+            print(
+                f"   📤 batch {self.batches}: {len(points)} chunks | embed {embed_ms:.0f} ms | "
+                f"upsert {upsert_ms:.0f} ms | total {self.upserted} ({rate:.1f} chunks/s)"
+            )
+
+def refresh_payloads(client, collection_name, to_refresh, batch_size=256):
+    """เขียน metadata ใหม่ทับของ point ที่เนื้อหาเดิม (ไม่ต้อง embed ใหม่) ทีละ batch_size point ต่อ request"""
+    for start in range(0, len(to_refresh), batch_size):
+        client.batch_update_points(
+            collection_name=collection_name,
+            update_operations=[
+                models.SetPayloadOperation(set_payload=models.SetPayload(payload={"metadata": metadata}, points=[pid]))
+                for pid, metadata in to_refresh[start:start + batch_size]
+            ],
+        )
+
+def sync_collection(client, collection_name, vector_store, source_iter, prune_missing=True):
+    """
+    Diff + upsert (แบบ streaming) + refresh metadata + delete
+    คืน stats {"chunks", "upserted", "refreshed", "deleted", "failed": [source ที่โหลดไม่สำเร็จ]}
+    """
+    print("🔍 Reading existing points...")
+    existing = fetch_existing_points(client, collection_name)
+    to_delete, to_refresh = [], []
+    stats = {"chunks": 0, "upserted": 0, "refreshed": 0, "deleted": 0, "failed": []}
+
+    # Upsert ก่อน แล้วค่อยลบของเก่า → collection ไม่เคยว่างระหว่างอัปเดต
+    pipeline = UpsertPipeline(client, collection_name, vector_store)
+    stats["upserted"] = pipeline.run(plan_sync(source_iter, existing, to_delete, to_refresh, stats, prune_missing))
+    if to_refresh:
+        print(f"🏷️ Refreshing metadata of {len(to_refresh)} unchanged points...")
+        refresh_payloads(client, collection_name, to_refresh)
+        stats["refreshed"] = len(to_refresh)
+    if to_delete:
+        print(f"🗑️ Deleting {len(to_delete)} stale points...")
+        client.delete(
+            collection_name=collection_name,
+            points_selector=models.PointIdsList(points=to_delete),
+        )
+        stats["deleted"] = len(to_delete)
+    print(
+        f"📊 {stats['chunks']} chunks, {stats['upserted']} upserted, {stats['refreshed']} refreshed, "
+        f"{stats['deleted']} deleted, {len(stats['failed'])} sources failed"
+    )
+    return stats
+
+# ================= BLUE/GREEN (ALIAS) =================
+def resolve_alias(client):
+    """collection ที่ COLLECTION_ALIAS ชี้อยู่ (None ถ้ายังไม่มี alias)"""
+    for alias in client.get_aliases().aliases:
+        if alias.alias_name == COLLECTION_ALIAS:
+            return alias.collection_name
+    return None
+
+def versioned_collections(client):
+    """collection ที่สร้างจาก --rebuild เรียงจากเก่าไปใหม่ (ชื่อมี timestamp)"""
+    prefix = f"{COLLECTION_ALIAS}_v"
+    return sorted(c.name for c in client.get_collections().collections if c.name.startswith(prefix))
+
+def switch_alias(client, collection_name):
+    """สลับ alias แบบ atomic (ลบ + สร้างใน request เดียว) main.py จะเห็นภายใน COLLECTION_CHECK_SECONDS"""
+    operations = []
+    if resolve_alias(client) is not None:
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=COLLECTION_ALIAS)))
+    operations.append(models.CreateAliasOperation(
+        create_alias=models.CreateAlias(collection_name=collection_name, alias_name=COLLECTION_ALIAS)
+    ))
+    client.update_collection_aliases(change_aliases_operations=operations)
+    print(f"🔀 Alias {COLLECTION_ALIAS} → {collection_name}")
+
+def validate_collection(client, vector_store, collection_name, expected_points):
+    """ตรวจ collection ใหม่ก่อนสลับ alias: จำนวน point ต้องครบ และ sample query ต้องเจอผลลัพธ์"""
+    count = client.count(collection_name=collection_name, exact=True).count
+    if count == 0 or count != expected_points:
+        raise RuntimeError(f"Point count mismatch: {count} (expected {expected_points})")
+    for item in FORM_MASTER_DATA[:5]:
+        if not vector_store.similarity_search(item["name"], k=3):
+            raise RuntimeError(f"Sample query returned nothing: {item['name']}")
+    print(f"✅ Validated {collection_name}: {count} points, sample queries OK")
+
+def garbage_collect(client, active_collection):
+    """เก็บไว้ KEEP_COLLECTION_VERSIONS เวอร์ชันล่าสุด (รวมตัวที่ใช้งานอยู่) ที่เหลือลบทิ้ง"""
+    versions = versioned_collections(client)
+    for name in versions[:-KEEP_COLLECTION_VERSIONS]:
+        if name != active_collection:
+            print(f"🗑️ Dropping old collection: {name}")
+            client.delete_collection(name)
+
+def rebuild(client, sources=None):
+    """สร้าง index ใหม่ทั้งหมดใน collection ใหม่ ตรวจสอบ แล้วค่อยสลับ alias (ไม่มี downtime)"""
+    collection_name = f"{COLLECTION_ALIAS}_v{datetime.now(timezone.utc):%Y%m%d%H%M%S}"
+    create_collection(client, collection_name)
+    try:
+        vector_store = make_vector_store(client, collection_name)
+        text_splitter = make_text_splitter()
+        stats = sync_collection(client, collection_name, vector_store, iter_sources(text_splitter, sources))
+        # collection ใหม่ที่ขาดบาง source (โหลดไม่สำเร็จ) ห้ามสลับ alias ไปใช้ ไม่งั้นเอกสารนั้นหายจากระบบ
+        if stats["failed"]:
+            raise RuntimeError(f"{len(stats['failed'])} sources failed to load: {', '.join(stats['failed'])}")
+        validate_collection(client, vector_store, collection_name, stats["chunks"])
+    except Exception:
+        print(f"❌ Rebuild failed, dropping {collection_name} (alias unchanged)")
+        client.delete_collection(collection_name)
+        raise
+    mark_ingested(client, collection_name)
+    switch_alias(client, collection_name)
+    garbage_collect(client, collection_name)
+
+def rollback(client):
+    """ชี้ alias กลับไปยังเวอร์ชันก่อนหน้า"""
+    current = resolve_alias(client)
+    older = [name for name in versioned_collections(client) if current is None or name < current]
+    if not older:
+        raise SystemExit("❌ No previous collection version to roll back to")
+    switch_alias(client, older[-1])
+
+def incremental(client, sources=None):
+    """Sync เฉพาะส่วนที่เปลี่ยนเข้า collection ที่ใช้งานอยู่ (ตาม alias หรือ collection เดิม)"""
+    collection_name = resolve_alias(client) or COLLECTION_NAME
+
+    # 1. Check/Create Collection
+    if not client.collection_exists(collection_name):
+        create_collection(client, collection_name)
+    else:
+        print(f"✅ Collection {collection_name} already exists.")
+        # sparse vector เดิมที่ยังไม่เปลี่ยนจะไม่ถูก embed ใหม่ ถ้าตัวตัดคำไม่ตรงกันต้องสร้างใหม่ทั้ง collection
+        metadata = getattr(client.get_collection(collection_name).config, "metadata", None) or {}
+        if metadata.get("sparse_tokenizer", "whitespace") != SPARSE_TOKENIZER:
+            raise SystemExit(
+                f"❌ {collection_name} was indexed with sparse_tokenizer={metadata.get('sparse_tokenizer', 'whitespace')}, "
+                f"current is {SPARSE_TOKENIZER}: run with --rebuild"
+            )
+
+    # 2. Setup Models
+    vector_store = make_vector_store(client, collection_name)
+
+    # 3. Process PDFs (รวม GDrive) + Summary → diff กับข้อมูลเดิม → embed + upsert เป็น batch ระหว่างโหลด
+    text_splitter = make_text_splitter()
+    # --source: sync เฉพาะไฟล์ที่ระบุ ไม่ลบเอกสารอื่นใน collection ที่ใช้งานอยู่
+    stats = sync_collection(
+        client, collection_name, vector_store, iter_sources(text_splitter, sources), prune_missing=not sources,
+    )
+    if not stats["upserted"] and not stats["refreshed"] and not stats["deleted"]:
+        print("✅ Nothing changed.")
+        return
+
+    # 4. Stamp version → main.py จะล้าง Answer Cache เมื่อเห็น ingest_version เปลี่ยน
+    mark_ingested(client, collection_name)
+
+# ================= SNAPSHOT (VECTOR_BACKEND=numpy) =================
+def export_snapshot(client, path):
+    """
+    ดึงทุก point (payload + dense/sparse vector) จาก collection ที่ใช้งานอยู่ แล้วเขียนเป็น snapshot
+    ให้ main.py โหลดเข้า memory ตอน startup (VECTOR_BACKEND=numpy VECTOR_SNAPSHOT_PATH=path)
+    """
+    collection_name = resolve_alias(client) or COLLECTION_NAME
+    info = client.get_collection(collection_name)
+    metadata = getattr(info.config, "metadata", None) or {}
+    payloads, dense, sparse = [], [], []
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=1000,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        for point in points:
+            payloads.append(point.payload or {})
+            dense.append(point.vector["dense_vector"])
+            sparse_vector = point.vector.get("sparse_vector")
+            sparse.append((sparse_vector.indices, sparse_vector.values) if sparse_vector else ([], []))
+        if offset is None:
+            break
+    if not payloads:
+        raise SystemExit(f"❌ Collection {collection_name} is empty, nothing to export")
+    write_snapshot(path, payloads, dense, sparse, {
+        "collection": collection_name,
+        "ingest_version": metadata.get("ingest_version"),
+        "sparse_tokenizer": metadata.get("sparse_tokenizer", "whitespace"),
+        "dense_model": DENSE_MODEL_NAME,
+        "sparse_model": SPARSE_MODEL_NAME,
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+    })
+    print(f"💾 Exported {len(payloads)} points from {collection_name} → {path}")
+
+def make_client():
+    if VECTOR_BACKEND == "qdrant-local":
+        print(f"🚀 Opening local Qdrant: {QDRANT_PATH}...")
+        return QdrantClient(path=QDRANT_PATH)
+    print(f"🚀 Connecting to Qdrant: {QDRANT_URL}...")
+    return QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync KMUTT form documents into Qdrant")
+    parser.add_argument("--rebuild", action="store_true", help="สร้าง collection ใหม่ทั้งหมดแล้วสลับ alias (blue/green)")
+    parser.add_argument("--rollback", action="store_true", help="ชี้ alias กลับไปเวอร์ชันก่อนหน้า")
+    parser.add_argument(
+        "--source", action="append",
+        help="URL / ไฟล์ PDF / โฟลเดอร์ (ใส่ได้หลายครั้ง) แทน ALL_URLS (ไม่ใช้ --rebuild: sync เฉพาะไฟล์เหล่านี้ ไม่ลบไฟล์อื่น)",
+    )
+    parser.add_argument(
+        "--export-snapshot", metavar="PATH",
+        help="เขียน snapshot ของ collection ปัจจุบันสำหรับ VECTOR_BACKEND=numpy (ใช้คู่กับ --rebuild ได้ ไม่งั้นไม่ sync)",
+    )
+    args = parser.parse_args()
+
+    client = make_client()
+
+    if args.rollback:
+        rollback(client)
+        return
+    if args.rebuild:
+        rebuild(client, args.source)
+    elif not args.export_snapshot:
+        incremental(client, args.source)
+    if args.export_snapshot:
+        export_snapshot(client, args.export_snapshot)
     
-    print("🎉 Success! Database is full. Your Railway app should work now.")
+    print("🎉 Success! Database is in sync. Your Railway app should work now.")
 
 if __name__ == "__main__":
     main()